@@ -54,6 +54,25 @@ export interface UploadResponse {
     message: string
 }
 
+// 定义文档处理任务类型
+export type IngestJobStatus = 'queued' | 'extracting' | 'embedding' | 'done' | 'failed'
+
+export interface IngestJob {
+    job_id: string
+    title: string
+    filename: string
+    status: IngestJobStatus
+    chunks_total: number
+    chunks_embedded: number
+    progress: number
+    document_id: string | null
+    is_new: boolean | null
+    message: string | null
+    error: string | null
+    created_at: string
+    updated_at: string
+}
+
 // 定义列表响应类型
 export interface DocumentListResponse {
     documents: DocumentInfo[]
@@ -69,19 +88,82 @@ export interface DeleteResponse {
     message: string
 }
 
-// 上传文档
-export const uploadDocument = async (file: File, title: string): Promise<UploadResponse> => {
+// 处理任务状态轮询：初始间隔，之后逐次放大到上限（毫秒）
+const JOB_POLL_INTERVAL = 1000
+const JOB_POLL_MAX_INTERVAL = 5000
+const JOB_POLL_BACKOFF = 1.5
+// 轮询截止时间（毫秒），超过后停止等待，任务仍在服务端继续处理
+const JOB_POLL_TIMEOUT = 30 * 60 * 1000
+// 查询任务连续失败（网络错误、服务端错误）的最大重试次数
+const JOB_POLL_MAX_RETRIES = 5
+
+// 处理任务不存在或已过期（服务端按保留期清理任务状态）
+export class IngestJobNotFoundError extends Error {}
+
+// 查询文档处理任务
+export const getIngestJob = async (jobId: string): Promise<IngestJob> => {
+    try {
+        const response = await api.get<IngestJob>(`/teacher/document_vectorization/jobs/${jobId}`)
+        return response.data
+    } catch (error: any) {
+        console.error('查询处理任务失败:', error)
+        if (error.response?.status === 404) {
+            throw new IngestJobNotFoundError('处理任务不存在或已过期，请在文档列表中确认是否已上传成功')
+        } else if (error.response) {
+            throw new Error(error.response.data?.detail || error.response.data?.message || '查询处理任务失败')
+        } else if (error.request) {
+            throw new Error('网络连接失败，请检查网络设置')
+        } else {
+            throw new Error('查询处理任务请求失败')
+        }
+    }
+}
+
+// 轮询处理任务直到完成或失败：间隔逐次放大，查询失败有限次重试，任务不存在或超过截止时间时报错
+const waitForIngestJob = async (job: IngestJob, onProgress?: (job: IngestJob) => void): Promise<IngestJob> => {
+    const deadline = Date.now() + JOB_POLL_TIMEOUT
+    let interval = JOB_POLL_INTERVAL
+    let retries = 0
+
+    while (job.status !== 'done' && job.status !== 'failed') {
+        if (Date.now() + interval > deadline) {
+            throw new Error('文档处理超时，任务仍在后台进行，请稍后在文档列表中查看')
+        }
+        await new Promise((resolve) => setTimeout(resolve, interval))
+        interval = Math.min(interval * JOB_POLL_BACKOFF, JOB_POLL_MAX_INTERVAL)
+
+        try {
+            job = await getIngestJob(job.job_id)
+            retries = 0
+        } catch (error) {
+            if (error instanceof IngestJobNotFoundError || ++retries > JOB_POLL_MAX_RETRIES) {
+                throw error
+            }
+            continue
+        }
+        onProgress?.(job)
+    }
+    return job
+}
+
+// 上传文档：提交后轮询处理任务直到完成，onProgress 接收每次查询到的任务状态
+export const uploadDocument = async (
+    file: File,
+    title: string,
+    onProgress?: (job: IngestJob) => void
+): Promise<UploadResponse> => {
+    let job: IngestJob
     try {
         const formData = new FormData()
         formData.append('file', file)
         formData.append('title', title)
 
-        const response = await api.post<UploadResponse>('/teacher/document_vectorization/upload', formData, {
+        const response = await api.post<IngestJob>('/teacher/document_vectorization/upload', formData, {
             headers: {
                 'Content-Type': 'multipart/form-data'
             }
         })
-        return response.data
+        job = response.data
     } catch (error: any) {
         console.error('上传文档失败:', error)
         if (error.response) {
@@ -92,6 +174,21 @@ export const uploadDocument = async (file: File, title: string): Promise<UploadR
             throw new Error('上传请求失败')
         }
     }
+
+    onProgress?.(job)
+    job = await waitForIngestJob(job, onProgress)
+
+    if (job.status === 'failed') {
+        throw new Error(job.error || '文档处理失败')
+    }
+
+    return {
+        document_id: job.document_id as string,
+        title: job.title,
+        is_new: job.is_new ?? true,
+        chunk_count: job.chunks_total,
+        message: job.message || '文档处理并存储成功'
+    }
 }
 
 // 获取文档列表
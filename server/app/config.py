@@ -17,6 +17,90 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30  # 0.5小时过期
 
 # 习题生成配置
 DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "sk-0eda12ea690b402b9f6e7a702504280d")
+# 大模型接口地址，压测时可指向本地模拟服务（见 server/llm_stub）
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+
+# 大模型HTTP连接池与超时配置（单位：秒）
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+# 大模型调用重试配置：最大重试次数、指数退避的基准与上限（秒）
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", "8"))
+
+# 大模型熔断配置：触发熔断的连续失败次数与熔断持续时间（秒）
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+LLM_CIRCUIT_RECOVERY_SECONDS = float(os.environ.get("LLM_CIRCUIT_RECOVERY_SECONDS", "30"))
+
+# 大模型调用调度配置：全局同时进行的调用数上限与单个用户同时进行的调用数上限
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_CONCURRENCY_PER_USER = int(os.environ.get("LLM_MAX_CONCURRENCY_PER_USER", "2"))
+
+# 大模型调用指标配置：每个功能保留的最近调用样本数，用于计算百分位
+LLM_METRICS_SAMPLE_SIZE = int(os.environ.get("LLM_METRICS_SAMPLE_SIZE", "2000"))
+
+# 相同大模型请求合并：同一用户同时进行的相同生成请求只调用一次上游，请求方共享结果
+LLM_COALESCE_ENABLED = os.environ.get("LLM_COALESCE_ENABLED", "true").lower() == "true"
+
+# 聊天记录写回配置：后台任务刷新间隔（秒）与触发立即刷新的待写入数据量（字节）
+CHAT_FLUSH_INTERVAL_SECONDS = float(os.environ.get("CHAT_FLUSH_INTERVAL_SECONDS", "1.0"))
+CHAT_FLUSH_MAX_PENDING_BYTES = int(os.environ.get("CHAT_FLUSH_MAX_PENDING_BYTES", str(64 * 1024)))
+
+# 流式聊天中检测客户端断开的间隔（秒）
+CHAT_DISCONNECT_CHECK_INTERVAL_SECONDS = float(os.environ.get("CHAT_DISCONNECT_CHECK_INTERVAL_SECONDS", "0.5"))
+
+# 聊天历史内存缓存上限：全局对话数、估算字节数与单用户对话数
+CHAT_CACHE_MAX_ENTRIES = int(os.environ.get("CHAT_CACHE_MAX_ENTRIES", "2000"))
+CHAT_CACHE_MAX_BYTES = int(os.environ.get("CHAT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CHAT_CACHE_MAX_ENTRIES_PER_USER = int(os.environ.get("CHAT_CACHE_MAX_ENTRIES_PER_USER", "20"))
+
+# 聊天历史存储引擎：filesystem（按用户目录保存的日志文件）或 database（chat_session/chat_message表）
+CHAT_STORAGE_ENGINE = os.environ.get("CHAT_STORAGE_ENGINE", "filesystem").lower()
+
+# 聊天文件跨进程锁的等待超时（秒）
+CHAT_FILE_LOCK_TIMEOUT_SECONDS = float(os.environ.get("CHAT_FILE_LOCK_TIMEOUT_SECONDS", "10"))
+
+# 聊天上下文配置：发送给模型的token预算、每次重新生成摘要至少覆盖的新消息数（避免每轮都重新生成）与摘要长度上限
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.environ.get("CHAT_CONTEXT_TOKEN_BUDGET", "16000"))
+CHAT_SUMMARY_REFRESH_MESSAGES = int(os.environ.get("CHAT_SUMMARY_REFRESH_MESSAGES", "6"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.environ.get("CHAT_SUMMARY_MAX_TOKENS", "512"))
+# 摘要生成失败后的重试退避：首次失败后等待的秒数，每次连续失败翻倍，不超过上限
+CHAT_SUMMARY_RETRY_BASE_SECONDS = float(os.environ.get("CHAT_SUMMARY_RETRY_BASE_SECONDS", "60"))
+CHAT_SUMMARY_RETRY_MAX_SECONDS = float(os.environ.get("CHAT_SUMMARY_RETRY_MAX_SECONDS", "1800"))
+
+# 聊天语义答案缓存配置：是否启用、判定为相同问题的余弦相似度阈值、条目有效期（秒）与最大条目数
+CHAT_ANSWER_CACHE_ENABLED = os.environ.get("CHAT_ANSWER_CACHE_ENABLED", "false").lower() == "true"
+CHAT_ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get("CHAT_ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+CHAT_ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("CHAT_ANSWER_CACHE_TTL_SECONDS", "86400"))
+CHAT_ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("CHAT_ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# 命中缓存时回放答案的每段字符数
+CHAT_ANSWER_CACHE_REPLAY_CHUNK_CHARS = int(os.environ.get("CHAT_ANSWER_CACHE_REPLAY_CHUNK_CHARS", "24"))
+
+# 文档问答配置：每个文档检索的片段数、参考资料的token预算、检索结果缓存有效期（秒）与最大条目数
+CHAT_RAG_TOP_K = int(os.environ.get("CHAT_RAG_TOP_K", "5"))
+CHAT_RAG_TOKEN_BUDGET = int(os.environ.get("CHAT_RAG_TOKEN_BUDGET", "3000"))
+CHAT_RAG_CACHE_TTL_SECONDS = float(os.environ.get("CHAT_RAG_CACHE_TTL_SECONDS", "600"))
+CHAT_RAG_CACHE_MAX_ENTRIES = int(os.environ.get("CHAT_RAG_CACHE_MAX_ENTRIES", "500"))
+
+# 冷对话归档配置：超过该天数未更新的对话压缩归档（0表示不归档）与后台扫描间隔（秒）
+CHAT_ARCHIVE_AFTER_DAYS = int(os.environ.get("CHAT_ARCHIVE_AFTER_DAYS", "30"))
+CHAT_ARCHIVE_INTERVAL_SECONDS = float(os.environ.get("CHAT_ARCHIVE_INTERVAL_SECONDS", str(6 * 3600)))
+
+# 向量库配置：进程内缓存的集合句柄数上限（按最近使用淘汰）
+VECTOR_STORE_MAX_COLLECTIONS = int(os.environ.get("VECTOR_STORE_MAX_COLLECTIONS", "256"))
+
+# 文档处理线程池大小：同时进行文本提取、分块与向量化的任务数上限
+DOCUMENT_INGEST_WORKERS = int(os.environ.get("DOCUMENT_INGEST_WORKERS", "2"))
+
+# 文档处理任务配置：已结束任务的状态文件保留天数
+DOCUMENT_INGEST_JOB_RETENTION_DAYS = int(os.environ.get("DOCUMENT_INGEST_JOB_RETENTION_DAYS", "7"))
+
+# 文档向量化批处理配置：每批向量化并写入向量库的文本块数（不超过向量库单次写入上限）与等待写入的批次数上限
+DOCUMENT_EMBED_BATCH_SIZE = int(os.environ.get("DOCUMENT_EMBED_BATCH_SIZE", "64"))
+DOCUMENT_EMBED_MAX_PENDING_BATCHES = int(os.environ.get("DOCUMENT_EMBED_MAX_PENDING_BATCHES", "2"))
 
 # 文件存储路径
 MEDIA_ROOT = SERVER_DIR / "app" / "documents"
@@ -0,0 +1,218 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from app.config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL,
+    LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT,
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RECOVERY_SECONDS
+)
+from app.core.logger import setup_logger
+
+# 大模型网关日志记录器
+logger = setup_logger("llm_gateway")
+
+# 进程内共享的异步客户端
+_async_client: Optional[AsyncOpenAI] = None
+
+# 可重试的上游错误：网络错误、超时、限流与服务端错误；参数或鉴权错误重试无意义
+_RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # 包含 APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LLMCircuitOpenError(Exception):
+    """熔断期间拒绝调用：上游连续失败，快速失败而不是继续排队等待超时"""
+
+
+class CircuitBreaker:
+    """
+    大模型上游熔断器
+
+    连续失败达到阈值后进入熔断（open），期间所有调用立即失败；
+    超过恢复时间后进入半开（half_open），只放行一个探测调用，成功则恢复，失败则重新熔断
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    def before_call(self) -> None:
+        """调用前检查，熔断中或半开状态已有探测调用时抛出 LLMCircuitOpenError"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.recovery_seconds:
+                self.rejected += 1
+                raise LLMCircuitOpenError("大模型服务暂时不可用，请稍后重试")
+            self.state = self.HALF_OPEN
+            logger.info("大模型熔断器进入半开状态，放行探测调用")
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise LLMCircuitOpenError("大模型服务暂时不可用，请稍后重试")
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("大模型上游已恢复，熔断器关闭")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"大模型上游连续失败 {self.consecutive_failures} 次，熔断 {self.recovery_seconds}s")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """探测调用因非上游原因（如参数错误、请求取消）结束，不改变熔断状态，允许下一次探测"""
+        self._probe_in_flight = False
+
+
+class LLMGateway:
+    """
+    大模型调用网关
+
+    所有服务通过网关调用大模型：共用一个带连接池的异步客户端与超时配置，
+    对可重试错误以带随机抖动的指数退避重试，并由熔断器在上游异常时快速失败
+    """
+
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float, breaker: CircuitBreaker):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """全抖动指数退避：在 [0, min(上限, 基准 * 2^attempt)] 内随机取值，避免重试同时到达"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def chat_completion(self, **kwargs: Any) -> Any:
+        """
+        调用 chat.completions.create，参数与 OpenAI SDK 一致
+
+        stream=True 时只对建立流的请求重试，返回流对象；开始输出后的中断不重试，由调用方处理
+        """
+        client = get_async_llm_client()
+        self.calls += 1
+        attempt = 0
+
+        while True:
+            self.breaker.before_call()
+            try:
+                response = await client.chat.completions.create(**kwargs)
+            except _RETRYABLE_ERRORS as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or self.breaker.state == CircuitBreaker.OPEN:
+                    self.failures += 1
+                    raise
+
+                delay = self._backoff_delay(attempt)
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"大模型调用失败，{delay:.2f}s 后第 {attempt} 次重试: {type(e).__name__}: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 参数错误、鉴权失败或请求被取消，不代表上游异常
+                self.breaker.release_probe()
+                self.failures += 1
+                raise
+
+            self.breaker.record_success()
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "rejected": self.breaker.rejected,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+
+def get_async_llm_client() -> AsyncOpenAI:
+    """
+    获取进程内共享的异步大模型客户端
+
+    所有调用共用同一个 httpx 连接池，避免重复建立 TLS 连接，
+    且流式读取不会阻塞事件循环；重试由网关统一处理，关闭SDK自带的重试
+    """
+    global _async_client
+
+    if _async_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+        _async_client = AsyncOpenAI(
+            api_key=DEEPSEEK_API_KEY,
+            base_url=DEEPSEEK_BASE_URL,
+            http_client=http_client,
+            max_retries=0
+        )
+        logger.info(
+            f"异步大模型客户端已创建: 接口地址={DEEPSEEK_BASE_URL}, 最大连接数={LLM_MAX_CONNECTIONS}, "
+            f"连接超时={LLM_CONNECT_TIMEOUT}s, 读取超时={LLM_READ_TIMEOUT}s"
+        )
+
+    return _async_client
+
+
+async def close_async_llm_client() -> None:
+    """关闭共享客户端并释放连接池，供应用关闭时调用"""
+    global _async_client
+
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+        logger.info("异步大模型客户端已关闭")
+
+
+# 全局大模型网关
+llm_gateway = LLMGateway(
+    max_retries=LLM_MAX_RETRIES,
+    base_delay=LLM_RETRY_BASE_DELAY,
+    max_delay=LLM_RETRY_MAX_DELAY,
+    breaker=CircuitBreaker(
+        failure_threshold=LLM_CIRCUIT_FAILURE_THRESHOLD,
+        recovery_seconds=LLM_CIRCUIT_RECOVERY_SECONDS
+    )
+)
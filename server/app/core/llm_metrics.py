@@ -0,0 +1,147 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+from app.config import LLM_METRICS_SAMPLE_SIZE
+from app.core.logger import setup_logger
+
+logger = setup_logger("llm_gateway")
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """计算已排序数据的百分位数（最近秩法），空数据返回0"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(len(sorted_values) * q + 0.5) - 1))
+    return sorted_values[index]
+
+
+class LLMCall:
+    """
+    单次大模型调用的计时与用量记录
+
+    流式调用在收到第一段内容时调用 mark_first_token；非流式调用的首个token与完整结果同时到达，
+    首token时间即为总耗时
+    """
+
+    def __init__(self, metrics: "LLMMetrics", feature: str):
+        self._metrics = metrics
+        self.feature = feature
+        self.started_at = time.monotonic()
+        self.ttft: Optional[float] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._finished = False
+
+    def mark_first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.started_at
+
+    def set_usage(self, usage: Any) -> None:
+        """记录用量，兼容OpenAI SDK的usage对象与字典"""
+        if not usage:
+            return
+        if isinstance(usage, dict):
+            self.prompt_tokens = usage.get("prompt_tokens", 0) or 0
+            self.completion_tokens = usage.get("completion_tokens", 0) or 0
+        else:
+            self.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+
+    def finish(self, error: Optional[str] = None) -> None:
+        """结束计时并提交记录，重复调用只记录第一次"""
+        if self._finished:
+            return
+        self._finished = True
+
+        duration = time.monotonic() - self.started_at
+        ttft = self.ttft if self.ttft is not None else (duration if error is None else None)
+        self._metrics.record(self.feature, ttft, duration, self.prompt_tokens, self.completion_tokens, error)
+
+    def __enter__(self) -> "LLMCall":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.finish(exc_type.__name__ if exc_type else None)
+        return False
+
+
+class _FeatureMetrics:
+    """单个功能的滚动样本与累计计数"""
+
+    def __init__(self, sample_size: int):
+        self.ttft: Deque[float] = deque(maxlen=sample_size)
+        self.duration: Deque[float] = deque(maxlen=sample_size)
+        self.calls = 0
+        self.errors: Dict[str, int] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+class LLMMetrics:
+    """按功能汇总大模型调用的首token时间、总耗时、token用量与错误类型"""
+
+    def __init__(self, sample_size: int):
+        self.sample_size = sample_size
+        self._features: Dict[str, _FeatureMetrics] = {}
+
+    def start(self, feature: str) -> LLMCall:
+        """开始记录一次调用"""
+        return LLMCall(self, feature)
+
+    def record(
+            self,
+            feature: str,
+            ttft: Optional[float],
+            duration: float,
+            prompt_tokens: int,
+            completion_tokens: int,
+            error: Optional[str]
+    ) -> None:
+        metrics = self._features.get(feature)
+        if metrics is None:
+            metrics = self._features[feature] = _FeatureMetrics(self.sample_size)
+
+        metrics.calls += 1
+        metrics.duration.append(duration)
+        if ttft is not None:
+            metrics.ttft.append(ttft)
+        metrics.prompt_tokens += prompt_tokens
+        metrics.completion_tokens += completion_tokens
+        if error:
+            metrics.errors[error] = metrics.errors.get(error, 0) + 1
+
+        logger.info(
+            f"大模型调用: 功能={feature}, 首token={f'{ttft * 1000:.0f}ms' if ttft is not None else '-'}, "
+            f"总耗时={duration * 1000:.0f}ms, 输入token={prompt_tokens}, 输出token={completion_tokens}, "
+            f"错误={error or '-'}"
+        )
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """各功能的百分位统计（毫秒）"""
+        result = []
+        for feature, metrics in self._features.items():
+            ttft = sorted(metrics.ttft)
+            duration = sorted(metrics.duration)
+            result.append({
+                "feature": feature,
+                "calls": metrics.calls,
+                "errors": sum(metrics.errors.values()),
+                "errors_by_class": dict(metrics.errors),
+                "samples": len(duration),
+                "ttft_p50_ms": round(percentile(ttft, 0.5) * 1000, 2),
+                "ttft_p90_ms": round(percentile(ttft, 0.9) * 1000, 2),
+                "ttft_p99_ms": round(percentile(ttft, 0.99) * 1000, 2),
+                "duration_p50_ms": round(percentile(duration, 0.5) * 1000, 2),
+                "duration_p90_ms": round(percentile(duration, 0.9) * 1000, 2),
+                "duration_p99_ms": round(percentile(duration, 0.99) * 1000, 2),
+                "prompt_tokens": metrics.prompt_tokens,
+                "completion_tokens": metrics.completion_tokens,
+                "avg_prompt_tokens": round(metrics.prompt_tokens / metrics.calls, 1),
+                "avg_completion_tokens": round(metrics.completion_tokens / metrics.calls, 1),
+            })
+        return result
+
+
+# 全局大模型调用指标
+llm_metrics = LLMMetrics(sample_size=LLM_METRICS_SAMPLE_SIZE)
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Deque, Dict, Any, List
+
+from app.config import LLM_MAX_CONCURRENCY, LLM_MAX_CONCURRENCY_PER_USER
+from app.core.llm_metrics import percentile
+from app.core.logger import setup_logger
+
+logger = setup_logger("llm_gateway")
+
+# 每个功能保留的最近等待时间样本数
+_WAIT_SAMPLE_SIZE = 1000
+
+
+class LLMPriority(IntEnum):
+    """大模型调用优先级，数值越小越优先"""
+    INTERACTIVE = 0  # 交互式聊天
+    BATCH = 1  # 习题、PPT大纲等批量生成
+
+
+class _Waiter:
+    """排队中的调用"""
+    __slots__ = ("user_key", "feature", "future", "enqueued_at")
+
+    def __init__(self, user_key: str, feature: str, future: asyncio.Future):
+        self.user_key = user_key
+        self.feature = feature
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    大模型调用准入调度器
+
+    - 全局与单用户并发上限
+    - 同一优先级内按用户轮转出队，单个用户的突发请求不会挤占其他用户
+    - 交互式聊天优先于批量生成
+    - 记录排队深度与等待时间
+    """
+
+    def __init__(self, max_concurrency: int, max_per_user: int):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+
+        self._active_total = 0
+        self._active_by_user: Dict[str, int] = {}
+        # 每个优先级一个按用户分组的等待队列，OrderedDict的顺序即轮转顺序
+        self._queues: Dict[LLMPriority, "OrderedDict[str, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in LLMPriority
+        }
+
+        self._admitted: Dict[str, int] = {}
+        self._wait_samples: Dict[str, Deque[float]] = {}
+        self._max_queue_depth = 0
+
+    @asynccontextmanager
+    async def slot(self, user_key: str, priority: LLMPriority = LLMPriority.BATCH, feature: str = "default"):
+        """获取调用名额，退出上下文时释放"""
+        await self.acquire(user_key, priority, feature)
+        try:
+            yield
+        finally:
+            self.release(user_key)
+
+    async def acquire(self, user_key: str, priority: LLMPriority = LLMPriority.BATCH, feature: str = "default") -> None:
+        """获取调用名额，名额不足时排队等待"""
+        if not self._has_waiters() and self._can_admit(user_key):
+            self._admit(user_key, feature, 0.0)
+            return
+
+        waiter = _Waiter(user_key, feature, asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(user_key, deque()).append(waiter)
+        self._max_queue_depth = max(self._max_queue_depth, self.queue_depth())
+        # 排队中的调用可能都受单用户上限阻塞，新调用仍可能立即获得名额
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已分配名额但调用方被取消，归还名额
+                self.release(user_key)
+            else:
+                self._remove_waiter(priority, waiter)
+            raise
+
+    def release(self, user_key: str) -> None:
+        """释放调用名额并调度排队中的调用"""
+        self._active_total -= 1
+        remaining = self._active_by_user.get(user_key, 0) - 1
+        if remaining > 0:
+            self._active_by_user[user_key] = remaining
+        else:
+            self._active_by_user.pop(user_key, None)
+        self._dispatch()
+
+    def queue_depth(self) -> int:
+        """当前排队中的调用数"""
+        return sum(len(waiters) for queue in self._queues.values() for waiters in queue.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """调度器统计信息"""
+        features: List[Dict[str, Any]] = []
+        for feature, samples in self._wait_samples.items():
+            ordered = sorted(samples)
+            features.append({
+                "feature": feature,
+                "admitted": self._admitted.get(feature, 0),
+                "avg_wait_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+                "p95_wait_ms": round(percentile(ordered, 0.95) * 1000, 2),
+                "max_wait_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+            })
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_per_user": self.max_per_user,
+            "active": self._active_total,
+            "active_users": len(self._active_by_user),
+            "queue_depth": self.queue_depth(),
+            "queue_depth_by_priority": {
+                priority.name.lower(): sum(len(waiters) for waiters in queue.values())
+                for priority, queue in self._queues.items()
+            },
+            "max_queue_depth": self._max_queue_depth,
+            "features": features,
+        }
+
+    def _has_waiters(self) -> bool:
+        return any(self._queues[priority] for priority in LLMPriority)
+
+    def _can_admit(self, user_key: str) -> bool:
+        return (self._active_total < self.max_concurrency and
+                self._active_by_user.get(user_key, 0) < self.max_per_user)
+
+    def _admit(self, user_key: str, feature: str, waited: float) -> None:
+        self._active_total += 1
+        self._active_by_user[user_key] = self._active_by_user.get(user_key, 0) + 1
+        self._admitted[feature] = self._admitted.get(feature, 0) + 1
+        self._wait_samples.setdefault(feature, deque(maxlen=_WAIT_SAMPLE_SIZE)).append(waited)
+
+    def _remove_waiter(self, priority: LLMPriority, waiter: _Waiter) -> None:
+        queue = self._queues[priority]
+        waiters = queue.get(waiter.user_key)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            pass
+        if not waiters:
+            del queue[waiter.user_key]
+
+    def _dispatch(self) -> None:
+        """按优先级、用户轮转的顺序为排队中的调用分配名额"""
+        while self._active_total < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            waited = time.monotonic() - waiter.enqueued_at
+            self._admit(waiter.user_key, waiter.feature, waited)
+            waiter.future.set_result(None)
+            if waited > 1:
+                logger.info(f"大模型调用排队 {waited:.2f}s 后获得名额: 功能={waiter.feature}, 用户={waiter.user_key}")
+
+    def _next_waiter(self):
+        for priority in LLMPriority:
+            queue = self._queues[priority]
+            for user_key in list(queue.keys()):
+                if self._active_by_user.get(user_key, 0) >= self.max_per_user:
+                    continue
+
+                waiters = queue[user_key]
+                waiter = waiters.popleft()
+                # 该用户移到轮转队尾
+                del queue[user_key]
+                if waiters:
+                    queue[user_key] = waiters
+
+                if waiter.future.cancelled():
+                    continue
+                return waiter
+        return None
+
+
+# 全局大模型调用调度器
+llm_scheduler = LLMScheduler(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_per_user=LLM_MAX_CONCURRENCY_PER_USER
+)
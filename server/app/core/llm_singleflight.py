@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict
+
+from app.config import LLM_COALESCE_ENABLED
+from app.core.logger import setup_logger
+
+logger = setup_logger("llm_gateway")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize_text(text: str) -> str:
+    """合并连续空白并去掉首尾空白，排版差异不影响请求是否相同"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def make_request_key(feature: str, user_key: str, **params: Any) -> str:
+    """
+    根据功能名、用户与调用参数计算请求键
+
+    messages 中的文本内容先规范化空白，其余参数原样参与计算；同一用户参数完全相同的请求得到相同的键。
+    键包含用户：只合并同一用户的重复请求（重复点击、前端重试），不同用户的相同请求各自调用，
+    各自占用调用名额，跟随方不会绕过单用户限流
+    """
+    normalized = dict(params)
+    if "messages" in normalized:
+        normalized["messages"] = [
+            {**message, "content": _normalize_text(message.get("content") or "")}
+            for message in normalized["messages"]
+        ]
+    payload = json.dumps({"feature": feature, "user": user_key, "params": normalized}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """一次进行中的上游调用及其等待方"""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    相同请求合并器
+
+    同一请求键同时只有一个上游调用在进行，期间到达的相同请求等待并共享该调用的结果；
+    调用结束后立即移除，之后的请求会重新调用（只合并并发请求，不做结果缓存）。
+    上游调用在独立任务中执行，某个等待方断开不会影响其他等待方；所有等待方都离开时取消上游调用
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn 并返回结果；相同 key 的调用正在进行时直接等待其结果"""
+        if not self.enabled:
+            return await fn()
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._remove_flight(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"合并相同的大模型请求: 键={key[:12]}, 等待方={flight.waiters + 1}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _remove_flight(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # 没有等待方取走的异常在这里读取，避免未处理异常的警告
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+# 全局相同请求合并器
+llm_singleflight = SingleFlight(enabled=LLM_COALESCE_ENABLED)
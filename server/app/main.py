@@ -8,10 +8,15 @@ from tortoise.contrib.fastapi import register_tortoise
 
 from app.config import MEDIA_ROOT
 from app.core import initialize_system_directories
+from app.core.llm_gateway import close_async_llm_client
 from app.core.logger import app_logger
 from app.core.middleware import log_request_middleware
 from app.database import TORTOISE_ORM
 from app.routers import api_router
+from app.services.chat_history.chat_archive_svc import chat_archiver
+from app.services.chat_history.write_behind_svc import chat_write_behind
+from app.services.doc_vector.document_vectorization_svc import vector_store, shutdown_ingest_pool
+from app.services.doc_vector.ingest_job_svc import ingest_job_queue
 
 # 将项目根目录添加到 Python 路径
 BASE_DIR = Path(__file__).parent
@@ -25,6 +30,10 @@ async def lifespan(app: FastAPI):
     # 应用启动前的操作
     initialize_system_directories(MEDIA_ROOT)
     print("应用初始化: 目录结构已准备就绪")
+    chat_write_behind.start()
+    chat_archiver.start()
+    vector_store.start()
+    await ingest_job_queue.start()
     app_logger.info("应用程序启动")
 
     # 应用运行中
@@ -32,6 +41,12 @@ async def lifespan(app: FastAPI):
 
     # 应用关闭时的操作
     print("应用关闭中: 正在清理资源...")
+    await chat_archiver.stop()
+    await chat_write_behind.stop()
+    await close_async_llm_client()
+    await ingest_job_queue.stop()
+    shutdown_ingest_pool()
+    vector_store.close()
     app_logger.info("应用程序关闭")
 
 
@@ -4,6 +4,7 @@ from .course_notification import CourseNotification, NotificationConfirmation
 from .student import Student
 from .teacher import Teacher
 from .admin import Admin
+from .chat_history import ChatSession, ChatMessageRecord
 
 # 导出所有模型
 __all__ = [
@@ -13,4 +14,6 @@ __all__ = [
     'Student',
     'Teacher',
     'Admin',
+    'ChatSession',
+    'ChatMessageRecord',
 ]
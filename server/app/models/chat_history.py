@@ -0,0 +1,55 @@
+from tortoise import fields, models
+
+
+class ChatSession(models.Model):
+    """聊天对话模型（数据库聊天存储引擎）"""
+    id = fields.IntField(pk=True)
+
+    # 对话归属
+    user_role = fields.CharField(max_length=16, description="用户角色")
+    user_id = fields.CharField(max_length=50, description="用户ID")
+    chat_id = fields.CharField(max_length=64, description="对话ID")
+
+    # 列表展示所需的汇总信息，随消息写入同步维护
+    preview = fields.CharField(max_length=64, default="新对话", description="对话预览")
+    message_count = fields.IntField(default=0, description="有效消息数")
+    size_bytes = fields.BigIntField(default=0, description="消息内容总字节数")
+
+    # 较早对话的滚动摘要
+    context_summary = fields.TextField(null=True, description="上下文摘要")
+    summary_covered_count = fields.IntField(default=0, description="摘要覆盖的消息数")
+
+    # 每次写入递增，各服务进程据此判断本地缓存是否过期
+    version = fields.IntField(default=0, description="数据版本号")
+
+    # 时间信息，沿用文件存储中的ISO格式字符串，保证两种引擎返回的数据一致
+    created_at = fields.CharField(max_length=32, description="创建时间")
+    last_updated = fields.CharField(max_length=32, description="最后更新时间")
+
+    class Meta:
+        table = "chat_session"
+        table_description = "聊天对话表"
+        unique_together = (("user_role", "user_id", "chat_id"),)
+        indexes = (("user_role", "user_id", "last_updated"),)
+
+
+class ChatMessageRecord(models.Model):
+    """聊天消息模型（数据库聊天存储引擎）"""
+    id = fields.BigIntField(pk=True)
+
+    session = fields.ForeignKeyField(
+        "models.ChatSession",
+        related_name="messages",
+        on_delete=fields.CASCADE,
+        description="所属对话"
+    )
+    seq = fields.IntField(description="消息在对话中的序号")
+    role = fields.CharField(max_length=16, description="消息角色")
+    content = fields.TextField(description="消息内容")
+    truncated = fields.BooleanField(default=False, description="回复是否因客户端断开而截断")
+
+    class Meta:
+        table = "chat_message"
+        table_description = "聊天消息表"
+        unique_together = (("session", "seq"),)
+        ordering = ["seq"]
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.routers.admin import user_management_rt, log_management_rt, model_management_rt
+from app.routers.admin import user_management_rt, log_management_rt, model_management_rt, system_monitor_rt
 
 # 管理员专用路由
 admin_router = APIRouter()
@@ -22,5 +22,11 @@ admin_router.include_router(
     prefix="/model_management",
 )
 
+# 系统监控路由
+admin_router.include_router(
+    system_monitor_rt.router,
+    prefix="/system_monitor",
+)
+
 # 导出路由供主路由使用
 router = admin_router
\ No newline at end of file
@@ -0,0 +1,70 @@
+from typing import List
+
+from fastapi import APIRouter
+
+from app.schemas.admin.system_monitor_sch import (
+    ChatCacheStats, LLMSchedulerStats, LLMFeatureMetrics, AnswerCacheStats, LLMGatewayStats,
+    LLMCoalescingStats, VectorStoreStats
+)
+from app.services.admin.system_monitor_svc import (
+    get_chat_cache_stats, get_llm_scheduler_stats, get_llm_call_metrics, get_answer_cache_stats,
+    get_llm_gateway_stats, get_llm_coalescing_stats, get_vector_store_stats
+)
+
+router = APIRouter(tags=["管理员端-系统监控"])
+
+
+@router.get("/chat_cache", response_model=ChatCacheStats)
+async def chat_cache_stats():
+    """
+    获取聊天历史缓存统计：条目数、估算内存占用、命中/未命中/淘汰次数
+    """
+    return await get_chat_cache_stats()
+
+
+@router.get("/llm_scheduler", response_model=LLMSchedulerStats)
+async def llm_scheduler_stats():
+    """
+    获取大模型调用调度统计：当前并发数、各优先级排队深度、各功能的排队等待时间
+    """
+    return await get_llm_scheduler_stats()
+
+
+@router.get("/llm_metrics", response_model=List[LLMFeatureMetrics])
+async def llm_call_metrics():
+    """
+    获取各功能的大模型调用统计：首token时间与总耗时的P50/P90/P99、token用量、按错误类型的失败次数
+    """
+    return await get_llm_call_metrics()
+
+
+@router.get("/answer_cache", response_model=AnswerCacheStats)
+async def answer_cache_stats():
+    """
+    获取聊天语义答案缓存统计：条目数、查询/命中/写入/淘汰/过期次数与命中率
+    """
+    return await get_answer_cache_stats()
+
+
+@router.get("/llm_gateway", response_model=LLMGatewayStats)
+async def llm_gateway_stats():
+    """
+    获取大模型调用网关统计：熔断器状态、连续失败次数、熔断次数、拒绝次数与重试次数
+    """
+    return await get_llm_gateway_stats()
+
+
+@router.get("/llm_coalescing", response_model=LLMCoalescingStats)
+async def llm_coalescing_stats():
+    """
+    获取相同大模型请求合并统计：进行中的上游调用数、实际发起的调用数与被合并的请求数
+    """
+    return await get_llm_coalescing_stats()
+
+
+@router.get("/vector_store", response_model=VectorStoreStats)
+async def vector_store_stats():
+    """
+    获取向量库统计：客户端是否已初始化、缓存的集合句柄数与命中/未命中/淘汰次数
+    """
+    return await get_vector_store_stats()
@@ -1,13 +1,15 @@
 import json
 from typing import Dict, Any, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Query, HTTPException
 from fastapi.responses import StreamingResponse
 
 from app.core.auth import auth_current_user
 from app.models.user_common import UserBase
-from app.schemas.chat_sch import ChatRequest
-from app.services.chat_svc import process_chat_request, get_chat_history
+from app.schemas.chat_sch import ChatRequest, ChatMessagePage, ChatSearchResponse
+from app.services.chat_svc import (
+    process_chat_request, get_chat_history, get_chat_message_page, search_chat_history
+)
 
 
 router = APIRouter(tags=["AI-Chat"])
@@ -16,16 +18,33 @@ router = APIRouter(tags=["AI-Chat"])
 @router.post("/stream")
 async def stream_message(
         request: ChatRequest,
+        http_request: Request,
         user: UserBase = Depends(auth_current_user)
 ):
-    """统一的AI问答接口 - 流式响应 - 面向教师与学生用户"""
+    """
+    统一的AI问答接口 - 流式响应 - 面向教师与学生用户
+
+    - delta_stream=false（默认）：每个事件返回当前累积的完整内容
+    - delta_stream=true：每个事件只返回新增文本 delta，最终事件返回完整内容 content 与用量 usage
+    - document_ids：基于当前用户已上传并向量化的文档回答
+    """
     # 强制设置为流式请求
     request.stream = True
 
+    # 文档问答检索的文档归属：教师为工号，学生为学号（与文档上传接口一致）
+    document_owner_id = getattr(user, "staff_id", None) or getattr(user, "student_id", None)
+
     async def event_generator():
+        # 传入断开检测，客户端关闭页面后停止上游生成
+        stream = process_chat_request(
+            request, str(user.id), user.role,
+            is_disconnected=http_request.is_disconnected,
+            document_owner_id=document_owner_id
+        )
         try:
-            async for chunk in process_chat_request(request, str(user.id), user.role):
-                yield f"data: {json.dumps(chunk.model_dump(), ensure_ascii=False)}\n\n"
+            async for chunk in stream:
+                # 省略空字段：增量模式下中间事件只包含 chat_id、delta 与 is_complete
+                yield f"data: {chunk.model_dump_json(exclude_none=True)}\n\n"
 
                 if chunk.is_complete:
                     break
@@ -35,6 +54,9 @@ async def stream_message(
             error_json = json.dumps({"error": str(e)}, ensure_ascii=False)
             yield f"data: {error_json}\n\n"
             yield "data: [DONE]\n\n"
+        finally:
+            # 收到最终事件后跳出循环时生成器仍停在最后一次 yield，显式关闭而不是等待垃圾回收
+            await stream.aclose()
 
     return StreamingResponse(
         event_generator(),
@@ -51,4 +73,35 @@ async def chat_history(
     """获取聊天历史记录"""
     # 传递用户角色信息
     history = await get_chat_history(str(user.id), user.role, chat_id, limit)
-    return history
\ No newline at end of file
+    return history
+
+
+@router.get("/messages", response_model=ChatMessagePage)
+async def chat_messages(
+        chat_id: str = Query(..., description="对话ID"),
+        before: Optional[int] = Query(None, ge=0, description="游标：返回序号小于该值的消息，为空时返回最新消息"),
+        limit: int = Query(50, ge=1, le=200, description="每页消息数"),
+        user: UserBase = Depends(auth_current_user)
+):
+    """分页获取长对话的消息，先取最新一页，再以 next_cursor 向前翻页"""
+    page = await get_chat_message_page(str(user.id), user.role, chat_id, before, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="对话不存在")
+
+    return ChatMessagePage(
+        chat_id=chat_id,
+        messages=page["messages"],
+        total=page["total"],
+        next_cursor=page["next_cursor"],
+        has_more=page["next_cursor"] is not None
+    )
+
+
+@router.get("/search", response_model=ChatSearchResponse)
+async def chat_search(
+        q: str = Query(..., min_length=1, max_length=100, description="关键词，多个关键词以空格分隔"),
+        limit: int = Query(20, ge=1, le=100, description="最多返回的消息数"),
+        user: UserBase = Depends(auth_current_user)
+):
+    """在当前用户的全部聊天记录中检索关键词，结果按时间倒序"""
+    return await search_chat_history(str(user.id), user.role, q, limit)
@@ -4,12 +4,12 @@ from typing import Optional
 from app.core.dependencies import auth_student_user
 from app.models.student import Student
 from app.services.doc_vector.document_vectorization_svc import (
-    process_and_store_document,
     list_teacher_documents,
     delete_document,
     get_document_info,
     search_documents
 )
+from app.services.doc_vector.ingest_job_svc import ingest_job_queue
 from app.core.logger import setup_logger
 
 logger = setup_logger("stu_document_vectorization_api")
@@ -17,7 +17,7 @@ logger = setup_logger("stu_document_vectorization_api")
 router = APIRouter(tags=["学生端-文档向量化"])
 
 
-@router.post("/upload")
+@router.post("/upload", status_code=202)
 async def upload_student_document(
     file: UploadFile = File(...),
     title: str = Form(...),
@@ -47,18 +47,18 @@ async def upload_student_document(
     - 支持格式：.txt, .docx
     - 文件大小：500MB以内
     - 内容要求：必须包含有效文本
+
+    文件保存后立即返回处理任务，文本提取与向量化在后台进行，
+    通过 /jobs/{job_id} 查询处理状态与进度
     """
     logger.info(f"学生 {current_user.username}(学号:{current_user.student_id}) 上传文档: {title}")
 
     try:
-        result = await process_and_store_document(
-            file=file,
-            staff_id=current_user.student_id,  # 使用学号标识
-            title=title
-        )
+        # 使用学号标识
+        job = await ingest_job_queue.submit(current_user.student_id, title, file)
 
-        logger.info(f"学生文档处理成功: {title}, 学号: {current_user.student_id}")
-        return result
+        logger.info(f"学生文档处理任务已提交: {job['job_id']}, 学号: {current_user.student_id}")
+        return job
 
     except HTTPException:
         raise
@@ -67,6 +67,18 @@ async def upload_student_document(
         raise HTTPException(status_code=500, detail=f"文档上传失败: {str(e)}")
 
 
+@router.get("/jobs/{job_id}")
+async def get_student_upload_job(
+    job_id: str,
+    current_user: Student = Depends(auth_student_user)
+):
+    """查询文档处理任务的状态与进度（已向量化的文本块数/总块数）"""
+    job = await ingest_job_queue.get_job(current_user.student_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="处理任务不存在")
+    return job
+
+
 @router.get("/list")
 async def list_student_documents(
     current_user: Student = Depends(auth_student_user)
@@ -13,6 +13,7 @@ from app.services.student.exercise_generator_stu_svc import (
 from app.core.logger import setup_logger
 from app.core.dependencies import auth_student_user
 from app.models.student import Student
+from app.services.chat_svc import get_user_cache_key
 
 logger = setup_logger("student_exercise_generator_api")
 
@@ -49,6 +50,7 @@ async def generate_student_exercises_endpoint(
         result = await generate_student_exercises(
             content=request.content,
             student_id=current_user.student_id,
+            user_key=get_user_cache_key(str(current_user.id), current_user.role),
             title=request.title,
             count=request.count,
             types=request.types,
@@ -6,20 +6,20 @@ from app.core.dependencies import auth_teacher_user
 from app.core.logger import setup_logger
 from app.models.teacher import Teacher
 from app.services.doc_vector.document_vectorization_svc import (
-    process_and_store_document,
     list_teacher_documents,
     retrieve_document_context,
     delete_document,
     get_document_info,
     search_documents
 )
+from app.services.doc_vector.ingest_job_svc import ingest_job_queue
 
 logger = setup_logger("th_document_vectorization_api")
 
 router = APIRouter(tags=["教师端-文档向量化"])
 
 
-@router.post("/upload")
+@router.post("/upload", status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
     title: str = Form(...),
@@ -49,17 +49,16 @@ async def upload_document(
     - 支持格式：.txt, .docx
     - 文件大小：500MB以内
     - 内容要求：必须包含有效文本
+
+    文件保存后立即返回处理任务，文本提取与向量化在后台进行，
+    通过 /jobs/{job_id} 查询处理状态与进度
     """
     logger.info(f"教师{current_user.staff_id}上传文档: {title}")
 
     try:
-        result = await process_and_store_document(
-            file,
-            current_user.staff_id,
-            title
-        )
-        logger.info(f"文档处理完成: {result}")
-        return result
+        job = await ingest_job_queue.submit(current_user.staff_id, title, file)
+        logger.info(f"文档处理任务已提交: {job['job_id']}")
+        return job
     except HTTPException:
         raise
     except Exception as e:
@@ -67,6 +66,18 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=f"文档处理失败: {str(e)}")
 
 
+@router.get("/jobs/{job_id}")
+async def get_upload_job(
+    job_id: str,
+    current_user: Teacher = Depends(auth_teacher_user)
+):
+    """查询文档处理任务的状态与进度（已向量化的文本块数/总块数）"""
+    job = await ingest_job_queue.get_job(current_user.staff_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="处理任务不存在")
+    return job
+
+
 @router.get("/list")
 async def list_documents(
     current_user: Teacher = Depends(auth_teacher_user)
@@ -13,6 +13,7 @@ from app.services.teacher.exercise_generator_svc import (
 from app.core.logger import setup_logger
 from app.core.dependencies import auth_teacher_user
 from app.models.teacher import Teacher
+from app.services.chat_svc import get_user_cache_key
 
 # 创建专用于习题生成器的日志记录器
 logger = setup_logger("exercise_generator_api")
@@ -51,6 +52,7 @@ async def generate_exercises_endpoint(
         result = await generate_exercises(
             content=request.content,
             staff_id=current_user.staff_id,
+            user_key=get_user_cache_key(str(current_user.id), current_user.role),
             title=request.title,
             count=request.count,
             types=request.types,
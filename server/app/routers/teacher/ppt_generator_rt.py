@@ -8,6 +8,7 @@ from app.schemas.teacher.ppt_generator_sch import (
     PPTGenerationRequest, PPTGenerationResponse,
     PPTOutlineResponse, PPTGenerationFromOutlineRequest
 )
+from app.services.chat_svc import get_user_cache_key
 from app.services.teacher.ppt_generator_svc import (
     generate_ppt_outline, generate_ppt_from_outline,
     download_ppt_service, list_ppt_files_service, list_ppt_outlines_service, delete_ppt_outline_service,
@@ -29,7 +30,9 @@ async def generate_ppt_outline_endpoint(
     """
     try:
         logger.info(f"教师 {current_user.username}(教工号:{current_user.staff_id}) 请求生成PPT大纲: {request.title}")
-        response = await generate_ppt_outline(request, current_user.staff_id)
+        response = await generate_ppt_outline(
+            request, current_user.staff_id, get_user_cache_key(str(current_user.id), current_user.role)
+        )
         return response
     except Exception as e:
         logger.error(f"PPT大纲生成失败: {str(e)}")
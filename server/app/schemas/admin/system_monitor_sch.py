@@ -0,0 +1,103 @@
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+
+class ChatCacheStats(BaseModel):
+    """聊天历史缓存统计"""
+    entries: int
+    users: int
+    pinned_entries: int
+    total_bytes: int
+    max_entries: int
+    max_bytes: int
+    max_entries_per_user: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+
+class LLMFeatureWaitStats(BaseModel):
+    """单个功能的大模型调用排队统计"""
+    feature: str
+    admitted: int
+    avg_wait_ms: float
+    p95_wait_ms: float
+    max_wait_ms: float
+
+
+class LLMSchedulerStats(BaseModel):
+    """大模型调用调度器统计"""
+    max_concurrency: int
+    max_per_user: int
+    active: int
+    active_users: int
+    queue_depth: int
+    queue_depth_by_priority: Dict[str, int]
+    max_queue_depth: int
+    features: List[LLMFeatureWaitStats]
+
+
+class LLMFeatureMetrics(BaseModel):
+    """单个功能的大模型调用耗时与用量统计（耗时单位毫秒，百分位基于最近的调用样本）"""
+    feature: str
+    calls: int
+    errors: int
+    errors_by_class: Dict[str, int]
+    samples: int
+    ttft_p50_ms: float
+    ttft_p90_ms: float
+    ttft_p99_ms: float
+    duration_p50_ms: float
+    duration_p90_ms: float
+    duration_p99_ms: float
+    prompt_tokens: int
+    completion_tokens: int
+    avg_prompt_tokens: float
+    avg_completion_tokens: float
+
+
+class AnswerCacheStats(BaseModel):
+    """聊天语义答案缓存统计"""
+    enabled: bool
+    entries: int
+    max_entries: int
+    similarity_threshold: float
+    ttl_seconds: float
+    lookups: int
+    hits: int
+    misses: int
+    stores: int
+    evictions: int
+    expirations: int
+    hit_rate: float
+
+
+class LLMGatewayStats(BaseModel):
+    """大模型调用网关统计"""
+    circuit_state: str
+    consecutive_failures: int
+    times_opened: int
+    rejected: int
+    calls: int
+    retries: int
+    failures: int
+
+
+class LLMCoalescingStats(BaseModel):
+    """相同大模型请求合并统计"""
+    enabled: bool
+    in_flight: int
+    leaders: int
+    coalesced: int
+
+
+class VectorStoreStats(BaseModel):
+    """向量库客户端与集合句柄缓存统计"""
+    initialized: bool
+    cached_collections: int
+    max_collections: int
+    hits: int
+    misses: int
+    evictions: int
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Any
 
 from pydantic import BaseModel, Field
 
@@ -19,11 +19,17 @@ class ChatRequest(BaseModel):
     max_tokens: Optional[int] = 4096
     temperature: Optional[float] = 0.7
     stream: bool = True
+    # 增量流式模式：每个事件只返回新增文本，最终事件返回完整内容与用量
+    delta_stream: bool = False
+    # 文档问答：基于当前用户已向量化的这些文档回答
+    document_ids: Optional[List[str]] = None
 
 class ChatStreamResponse(BaseModel):
     chat_id: str
-    content: str
+    content: Optional[str] = None
+    delta: Optional[str] = None
     is_complete: bool = False
+    usage: Optional[Dict[str, int]] = None
 
 class ChatResponse(BaseModel):
     id: str
@@ -36,4 +42,26 @@ class ChatHistoryItem(BaseModel):
     preview: str
 
 class ChatHistoryResponse(BaseModel):
-    chats: List[ChatHistoryItem]
\ No newline at end of file
+    chats: List[ChatHistoryItem]
+
+class ChatMessagePage(BaseModel):
+    chat_id: str
+    # 每条消息附带其在对话中的序号 seq
+    messages: List[Dict[str, Any]]
+    total: int
+    # 请求上一页时作为 before 传入，为空表示已到对话开头
+    next_cursor: Optional[int] = None
+    has_more: bool = False
+
+class ChatSearchHit(BaseModel):
+    chat_id: str
+    # 命中消息在对话中的序号，可配合 /chat/messages 的 before=seq+1 定位上下文
+    seq: int
+    role: str
+    snippet: str
+    updated_at: str
+
+class ChatSearchResponse(BaseModel):
+    query: str
+    results: List[ChatSearchHit]
+    took_ms: float
@@ -15,6 +15,7 @@ SERVICE_DESCRIPTIONS = {
     # 系统服务
     "app": "应用启动日志",
     "request": "应用请求日志",
+    "llm_gateway": "大模型调用网关日志",
     # 用户个人中心服务
     "user_center_service": "用户个人中心服务日志",
     # AI-Chat服务
@@ -0,0 +1,48 @@
+from typing import List
+
+from app.core.llm_gateway import llm_gateway
+from app.core.llm_metrics import llm_metrics
+from app.core.llm_scheduler import llm_scheduler
+from app.core.llm_singleflight import llm_singleflight
+from app.schemas.admin.system_monitor_sch import (
+    ChatCacheStats, LLMSchedulerStats, LLMFeatureMetrics, AnswerCacheStats, LLMGatewayStats,
+    LLMCoalescingStats, VectorStoreStats
+)
+from app.services.chat_answer_cache_svc import semantic_answer_cache
+from app.services.chat_history.history_cache_svc import chat_history_cache
+from app.services.doc_vector.document_vectorization_svc import vector_store
+
+
+async def get_chat_cache_stats() -> ChatCacheStats:
+    """获取聊天历史缓存的容量与命中统计"""
+    return ChatCacheStats(**chat_history_cache.stats())
+
+
+async def get_llm_scheduler_stats() -> LLMSchedulerStats:
+    """获取大模型调用调度器的并发、排队深度与等待时间统计"""
+    return LLMSchedulerStats(**llm_scheduler.stats())
+
+
+async def get_llm_call_metrics() -> List[LLMFeatureMetrics]:
+    """获取各功能的大模型调用首token时间、总耗时百分位与token用量"""
+    return [LLMFeatureMetrics(**item) for item in llm_metrics.stats()]
+
+
+async def get_answer_cache_stats() -> AnswerCacheStats:
+    """获取聊天语义答案缓存的容量与命中统计"""
+    return AnswerCacheStats(**semantic_answer_cache.stats())
+
+
+async def get_llm_gateway_stats() -> LLMGatewayStats:
+    """获取大模型调用网关的熔断状态与重试统计"""
+    return LLMGatewayStats(**llm_gateway.stats())
+
+
+async def get_llm_coalescing_stats() -> LLMCoalescingStats:
+    """获取相同大模型请求合并的进行中调用数与合并次数"""
+    return LLMCoalescingStats(**llm_singleflight.stats())
+
+
+async def get_vector_store_stats() -> VectorStoreStats:
+    """获取向量库集合句柄缓存的容量与命中统计"""
+    return VectorStoreStats(**vector_store.stats())
@@ -0,0 +1,149 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.config import (
+    CHAT_ANSWER_CACHE_ENABLED, CHAT_ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    CHAT_ANSWER_CACHE_TTL_SECONDS, CHAT_ANSWER_CACHE_MAX_ENTRIES
+)
+from app.core.logger import setup_logger
+
+logger = setup_logger("chat_service")
+
+
+def _embed_question(question: str) -> np.ndarray:
+    """使用文档向量化服务的嵌入函数计算问题向量，并归一化便于用点积计算余弦相似度"""
+    # 延迟导入：嵌入模型加载较慢，只在启用答案缓存时才需要
+    from app.services.doc_vector.document_vectorization_svc import embedding_function
+
+    vector = np.asarray(embedding_function([question])[0], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存
+
+    按用户角色分区匹配（不同角色的系统提示词不同），以问题向量的余弦相似度匹配相近问题；
+    条目超过TTL后失效，超出容量时淘汰最久未命中的条目
+    """
+
+    def __init__(self, enabled: bool, similarity_threshold: float, ttl_seconds: float, max_entries: int):
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        # 全局LRU：最久未命中的在前
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 每个角色的向量矩阵缓存，条目变化后重建
+        self._matrices: Dict[str, Tuple[list, np.ndarray]] = {}
+
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def lookup(self, role: str, question: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        查找相近问题的缓存答案
+
+        返回:
+            (缓存答案, 问题向量)；未命中时答案为None，向量可在生成回答后用于写入缓存；
+            计算向量失败时两者均为None
+        """
+        try:
+            embedding = await asyncio.to_thread(_embed_question, question)
+        except Exception as e:
+            logger.warning(f"答案缓存计算问题向量失败，跳过缓存: {str(e)}")
+            return None, None
+
+        self.lookups += 1
+        self._expire()
+
+        matrix_entry = self._get_matrix(role)
+        if matrix_entry is None:
+            return None, embedding
+
+        entry_ids, matrix = matrix_entry
+        similarities = matrix @ embedding
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < self.similarity_threshold:
+            return None, embedding
+
+        entry_id = entry_ids[best]
+        entry = self._entries[entry_id]
+        entry["hits"] += 1
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        logger.info(f"答案缓存命中: 角色={role}, 相似度={similarity:.4f}, 该条目命中次数={entry['hits']}")
+        return entry["answer"], embedding
+
+    def store(self, role: str, question: str, embedding: np.ndarray, answer: str) -> None:
+        """写入问题与答案，超出容量时淘汰最久未命中的条目"""
+        self._entries[uuid.uuid4().hex] = {
+            "role": role,
+            "question": question,
+            "answer": answer,
+            "embedding": embedding,
+            "created_at": time.monotonic(),
+            "hits": 0,
+        }
+        self.stores += 1
+
+        self._matrices.pop(role, None)
+
+        while len(self._entries) > self.max_entries:
+            _, victim = self._entries.popitem(last=False)
+            self._matrices.pop(victim["role"], None)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "similarity_threshold": self.similarity_threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "misses": self.lookups - self.hits,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+        }
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.ttl_seconds
+        expired = [entry_id for entry_id, entry in self._entries.items() if entry["created_at"] < deadline]
+        for entry_id in expired:
+            self._matrices.pop(self._entries.pop(entry_id)["role"], None)
+        self.expirations += len(expired)
+
+    def _get_matrix(self, role: str) -> Optional[Tuple[list, np.ndarray]]:
+        matrix_entry = self._matrices.get(role)
+        if matrix_entry is None:
+            entry_ids = [entry_id for entry_id, entry in self._entries.items() if entry["role"] == role]
+            if not entry_ids:
+                return None
+            matrix = np.stack([self._entries[entry_id]["embedding"] for entry_id in entry_ids])
+            matrix_entry = self._matrices[role] = (entry_ids, matrix)
+        return matrix_entry
+
+
+# 全局语义答案缓存
+semantic_answer_cache = SemanticAnswerCache(
+    enabled=CHAT_ANSWER_CACHE_ENABLED,
+    similarity_threshold=CHAT_ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ttl_seconds=CHAT_ANSWER_CACHE_TTL_SECONDS,
+    max_entries=CHAT_ANSWER_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,191 @@
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.config import (
+    CHAT_CONTEXT_TOKEN_BUDGET, CHAT_SUMMARY_REFRESH_MESSAGES, CHAT_SUMMARY_MAX_TOKENS,
+    CHAT_SUMMARY_RETRY_BASE_SECONDS, CHAT_SUMMARY_RETRY_MAX_SECONDS
+)
+from app.core.llm_gateway import llm_gateway
+from app.core.llm_metrics import llm_metrics
+from app.core.logger import setup_logger
+
+logger = setup_logger("chat_service")
+
+# 每条消息在对话格式中的固定开销（角色标记、分隔符等）
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+# 生成摘要时单条消息最多保留的字符数，避免摘要请求本身过长
+_SUMMARY_MESSAGE_CHAR_LIMIT = 1500
+
+# ASCII字符（英文、数字、代码、半角标点）按每三个字符一个token估算
+_ASCII_CHARS_PER_TOKEN = 3
+
+# 记录在对话数据中的摘要与摘要失败状态；摘要随对话写入存储，失败状态只保存在缓存里
+_SUMMARY_KEY = "context_summary"
+_SUMMARY_FAILURE_KEY = "context_summary_failure"
+
+
+def strip_context_state(chat_data: Dict[str, Any]) -> Dict[str, Any]:
+    """返回去掉摘要与摘要失败状态的对话数据副本，供接口返回给客户端"""
+    return {key: value for key, value in chat_data.items() if key not in (_SUMMARY_KEY, _SUMMARY_FAILURE_KEY)}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本token数，不调用分词器，用于上下文与参考资料的预算控制
+
+    估算有意偏高，宁可少放一些历史也不超出模型上下文：
+    - 非ASCII字符（汉字、全角标点、其他文字与表情）每个按一个token计，
+      DeepSeek文档给出的中文约为每字0.6个token
+    - ASCII字符每三个按一个token计，DeepSeek文档给出的英文约为每字符0.3个token，
+      数字与代码的切分更碎，按三个字符计也能覆盖
+
+    结果只用于预算比较，不能当作计费用量
+    """
+    if not text:
+        return 0
+    ascii_count = len(text.encode("ascii", "ignore"))
+    non_ascii_count = len(text) - ascii_count
+    return non_ascii_count + (ascii_count + _ASCII_CHARS_PER_TOKEN - 1) // _ASCII_CHARS_PER_TOKEN
+
+
+def estimate_message_tokens(message: Dict[str, str]) -> int:
+    """估算单条消息的token数"""
+    return estimate_tokens(message.get("content", "")) + _MESSAGE_OVERHEAD_TOKENS
+
+
+def _get_conversation(chat_data: Dict[str, Any]) -> List[Dict[str, str]]:
+    """提取参与上下文的对话消息：只保留用户消息与有内容的AI回复"""
+    conversation = []
+    for msg in chat_data.get("messages", []):
+        role = msg.get("role")
+        content = msg.get("content", "")
+        if role == "user" or (role == "assistant" and content.strip()):
+            conversation.append({"role": role, "content": content})
+    return conversation
+
+
+async def _summarize_messages(previous_summary: Optional[str], messages: List[Dict[str, str]]) -> Optional[str]:
+    """在已有摘要的基础上，把新移出上下文窗口的消息合并成新的滚动摘要"""
+    transcript = "\n".join(
+        f"{'用户' if msg['role'] == 'user' else '助手'}: {msg['content'][:_SUMMARY_MESSAGE_CHAR_LIMIT]}"
+        for msg in messages
+    )
+    prompt = (
+        f"已有摘要：\n{previous_summary or '无'}\n\n"
+        f"新增对话：\n{transcript}\n\n"
+        "请将已有摘要与新增对话合并为一份简洁的中文摘要，保留用户的问题背景、关键结论和尚未解决的问题，"
+        "不要添加对话中没有的信息。只输出摘要正文。"
+    )
+
+    try:
+        with llm_metrics.start("chat_summary") as llm_call:
+            response = await llm_gateway.chat_completion(
+                model="deepseek-chat",
+                messages=[
+                    {"role": "system", "content": "你是一个对话摘要助手，负责压缩较早的对话内容。"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+                stream=False
+            )
+            llm_call.set_usage(response.usage)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.warning(f"生成对话摘要失败，本轮将只使用最近的对话: {str(e)}")
+        return None
+
+
+def _summary_retry_allowed(chat_data: Dict[str, Any]) -> bool:
+    """上次摘要失败后的退避时间是否已过"""
+    failure = chat_data.get(_SUMMARY_FAILURE_KEY)
+    return failure is None or time.time() >= failure["retry_at"]
+
+
+def _record_summary_failure(chat_data: Dict[str, Any]) -> None:
+    """在对话上记录摘要失败，连续失败时退避时间翻倍，期间不再请求摘要"""
+    failures = chat_data.get(_SUMMARY_FAILURE_KEY, {}).get("failures", 0) + 1
+    delay = min(CHAT_SUMMARY_RETRY_BASE_SECONDS * 2 ** (failures - 1), CHAT_SUMMARY_RETRY_MAX_SECONDS)
+    chat_data[_SUMMARY_FAILURE_KEY] = {"failures": failures, "retry_at": time.time() + delay}
+    logger.warning(f"对话摘要连续失败 {failures} 次，{delay:.0f}s 内不再重试")
+
+
+async def build_chat_context(
+        system_prompt: str,
+        chat_data: Dict[str, Any],
+        reference_context: Optional[str] = None
+) -> Tuple[List[Dict[str, str]], bool]:
+    """
+    在token预算内构建发送给模型的上下文
+
+    从最新的消息开始向前保留，超出预算的较早消息以滚动摘要代替；
+    摘要保存在 chat_data["context_summary"] 中，一旦有移出窗口且未被摘要覆盖的消息就重新生成，
+    每次至少多覆盖 CHAT_SUMMARY_REFRESH_MESSAGES 条消息（可能包括仍在预算内的消息），避免每轮都重新生成；
+    摘要覆盖的消息不再原文发送，较早的消息要么在摘要中，要么原文保留；
+    生成失败时在对话上记录失败并退避，退避期间沿用已有摘要（没有则只保留最近的对话），不是每轮都重试；
+    reference_context 为文档检索得到的参考资料，紧随系统提示之后，预算优先于历史对话
+
+    返回:
+        (消息列表, 摘要是否已更新)
+    """
+    conversation = _get_conversation(chat_data)
+    system_message = {"role": "system", "content": system_prompt}
+    reference_message = {"role": "system", "content": reference_context} if reference_context else None
+
+    # 为系统提示、参考资料与摘要预留预算，其余留给最近的对话
+    budget = CHAT_CONTEXT_TOKEN_BUDGET - estimate_message_tokens(system_message) - CHAT_SUMMARY_MAX_TOKENS
+    if reference_message:
+        budget -= estimate_message_tokens(reference_message)
+
+    kept_start = len(conversation)
+    used_tokens = 0
+    while kept_start > 0:
+        cost = estimate_message_tokens(conversation[kept_start - 1])
+        # 至少保留最后一条消息
+        if used_tokens + cost > budget and kept_start < len(conversation):
+            break
+        used_tokens += cost
+        kept_start -= 1
+
+    messages = [system_message]
+    if reference_message:
+        messages.append(reference_message)
+    summary_updated = False
+
+    summary = chat_data.get(_SUMMARY_KEY)
+    covered_count = min(summary.get("covered_count", 0), len(conversation)) if summary else 0
+
+    if kept_start > covered_count and _summary_retry_allowed(chat_data):
+        # 一次多覆盖若干条消息，之后移出窗口的消息仍在摘要内，不必每轮重新生成；最后一条消息始终保留原文
+        new_covered_count = max(
+            kept_start, min(covered_count + CHAT_SUMMARY_REFRESH_MESSAGES, len(conversation) - 1)
+        )
+        new_content = await _summarize_messages(
+            summary.get("content") if summary else None,
+            conversation[covered_count:new_covered_count]
+        )
+        if new_content:
+            summary = {"content": new_content, "covered_count": new_covered_count}
+            covered_count = new_covered_count
+            chat_data[_SUMMARY_KEY] = summary
+            chat_data.pop(_SUMMARY_FAILURE_KEY, None)
+            summary_updated = True
+            logger.info(f"对话摘要已更新: 覆盖前 {new_covered_count} 条消息")
+        else:
+            _record_summary_failure(chat_data)
+
+    if summary:
+        kept_start = max(kept_start, min(covered_count, len(conversation) - 1))
+        messages.append({
+            "role": "system",
+            "content": f"以下是本次对话中较早内容的摘要，供参考：\n{summary['content']}"
+        })
+
+    messages.extend(conversation[kept_start:])
+
+    logger.info(
+        f"上下文构建完成: 对话消息总数={len(conversation)}, 保留最近{len(conversation) - kept_start}条, "
+        f"估算token={used_tokens}, 预算={CHAT_CONTEXT_TOKEN_BUDGET}"
+    )
+    return messages, summary_updated
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from contextlib import suppress
+from typing import Optional
+
+from filelock import FileLock, Timeout
+
+from app.config import CHAT_ARCHIVE_AFTER_DAYS, CHAT_ARCHIVE_INTERVAL_SECONDS, CHAT_STORAGE_ENGINE
+from app.core.logger import setup_logger
+from app.services.chat_history.chat_index_svc import patch_chat_index_entry
+from app.services.chat_history.chat_log_store_svc import CHAT_LOG_SUFFIX, archive_chat_log
+from app.services.chat_history.fs_storage_engine_svc import (
+    CHAT_HISTORY_ROOT_DIR, get_chat_lock, get_chat_id_from_file
+)
+
+logger = setup_logger("chat_service")
+
+# 归档扫描的跨进程锁：多个服务进程中同一时间只有一个执行扫描
+_ARCHIVE_SCAN_LOCK_PATH = CHAT_HISTORY_ROOT_DIR / ".archive.lock"
+
+
+class ChatArchiver:
+    """
+    冷对话归档任务
+
+    定期扫描文件存储中的聊天日志，把超过 after_days 天未更新的对话整理后以gzip压缩归档；
+    归档对话仍出现在列表与检索中，再次打开时由存储引擎自动解压
+    """
+
+    def __init__(self, after_days: int, interval: float):
+        self.after_days = after_days
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def archive_cold_chats(self) -> int:
+        """归档全部冷对话，返回本次归档的对话数；其他进程正在扫描时直接返回"""
+        try:
+            with FileLock(str(_ARCHIVE_SCAN_LOCK_PATH), timeout=0):
+                return self._archive_cold_chats()
+        except Timeout:
+            logger.debug("其他进程正在执行冷对话归档，跳过本次扫描")
+            return 0
+
+    def _archive_cold_chats(self) -> int:
+        cutoff = time.time() - self.after_days * 86400
+        archived_count = 0
+        hot_bytes = 0
+        cold_bytes = 0
+
+        for user_dir in CHAT_HISTORY_ROOT_DIR.iterdir():
+            if not user_dir.is_dir():
+                continue
+
+            for chat_file in user_dir.glob(f"chat_*{CHAT_LOG_SUFFIX}"):
+                try:
+                    if chat_file.stat().st_mtime >= cutoff:
+                        continue
+
+                    with get_chat_lock(chat_file):
+                        # 等待锁期间对话可能已被写入或归档
+                        if not chat_file.exists() or chat_file.stat().st_mtime >= cutoff:
+                            continue
+                        original_size = chat_file.stat().st_size
+                        # 锁文件保留：持有锁时删除会使等待方与新加锁方落在不同的文件上，失去互斥
+                        archive_size = archive_chat_log(chat_file)
+
+                    patch_chat_index_entry(
+                        user_dir, get_chat_id_from_file(chat_file),
+                        {"size_bytes": archive_size, "archived": True}
+                    )
+                    archived_count += 1
+                    hot_bytes += original_size
+                    cold_bytes += archive_size
+                except Exception as e:
+                    logger.error(f"归档聊天日志失败 {chat_file}: {str(e)}")
+
+        if archived_count:
+            logger.info(f"冷对话归档完成: 归档 {archived_count} 个对话, "
+                        f"{hot_bytes} 字节压缩为 {cold_bytes} 字节")
+        return archived_count
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.to_thread(self.archive_cold_chats)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """启动后台归档任务，需在事件循环中调用；仅文件存储引擎需要归档"""
+        if self.after_days <= 0 or CHAT_STORAGE_ENGINE != "filesystem":
+            return
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"冷对话归档任务已启动: 归档阈值={self.after_days}天, 扫描间隔={self.interval}s")
+
+    async def stop(self) -> None:
+        """停止后台归档任务"""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+            logger.info("冷对话归档任务已停止")
+
+
+# 全局冷对话归档任务
+chat_archiver = ChatArchiver(
+    after_days=CHAT_ARCHIVE_AFTER_DAYS,
+    interval=CHAT_ARCHIVE_INTERVAL_SECONDS
+)
@@ -0,0 +1,78 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from filelock import FileLock
+
+from app.config import CHAT_FILE_LOCK_TIMEOUT_SECONDS
+from app.core.logger import setup_logger
+
+logger = setup_logger("chat_service")
+
+# 用户聊天索引文件名，与聊天文件位于同一目录
+CHAT_INDEX_FILENAME = "_chat_index.json"
+
+
+def get_chat_index_path(user_dir: Path) -> Path:
+    """获取用户聊天索引文件路径"""
+    return user_dir / CHAT_INDEX_FILENAME
+
+
+def get_chat_index_lock(user_dir: Path) -> FileLock:
+    """获取用户聊天索引的跨进程锁，读-改-写索引时持有"""
+    return FileLock(str(get_chat_index_path(user_dir)) + ".lock", timeout=CHAT_FILE_LOCK_TIMEOUT_SECONDS)
+
+
+def load_chat_index(user_dir: Path) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    读取用户聊天索引
+
+    返回:
+        以chat_id为键的索引条目；索引不存在或损坏时返回None，由调用方重建
+    """
+    index_path = get_chat_index_path(user_dir)
+    if not index_path.exists():
+        return None
+
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if isinstance(index, dict):
+            return index
+        logger.warning(f"聊天索引格式不正确，将重建: {index_path}")
+    except Exception as e:
+        logger.warning(f"读取聊天索引失败，将重建: {index_path}, {str(e)}")
+    return None
+
+
+def save_chat_index(user_dir: Path, index: Dict[str, Dict[str, Any]]) -> None:
+    """原子写入用户聊天索引（调用方需持有索引锁）"""
+    index_path = get_chat_index_path(user_dir)
+    temp_path = index_path.with_suffix(".tmp")
+
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temp_path, index_path)
+
+
+def upsert_chat_index_entry(user_dir: Path, entry: Dict[str, Any]) -> None:
+    """新增或更新单个对话的索引条目；索引尚未建立时跳过，由首次列表请求统一重建"""
+    with get_chat_index_lock(user_dir):
+        index = load_chat_index(user_dir)
+        if index is None:
+            return
+
+        index[entry["chat_id"]] = entry
+        save_chat_index(user_dir, index)
+
+
+def patch_chat_index_entry(user_dir: Path, chat_id: str, fields: Dict[str, Any]) -> None:
+    """更新单个对话索引条目的部分字段；索引或条目不存在时跳过"""
+    with get_chat_index_lock(user_dir):
+        index = load_chat_index(user_dir)
+        if index is None or chat_id not in index:
+            return
+
+        index[chat_id].update(fields)
+        save_chat_index(user_dir, index)
@@ -0,0 +1,440 @@
+import gzip
+import json
+import os
+import struct
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.core.logger import setup_logger
+
+logger = setup_logger("chat_service")
+
+# 追加式日志文件后缀、冷对话归档后缀与旧版整文件JSON后缀
+CHAT_LOG_SUFFIX = ".jsonl"
+ARCHIVE_SUFFIX = ".gz"
+LEGACY_CHAT_SUFFIX = ".json"
+
+# 日志记录类型
+RECORD_META = "meta"  # 对话元信息，位于文件首行
+RECORD_MESSAGE = "msg"  # 追加一条完整消息
+RECORD_DELTA = "delta"  # 向最后一条消息追加增量文本
+RECORD_SET = "set"  # 覆盖最后一条消息的内容
+RECORD_SUMMARY = "summary"  # 较早对话的滚动摘要
+RECORD_PATCH = "patch"  # 合并附加字段到最后一条消息（如截断标记）
+
+# 自上次压缩以来追加的记录数达到该值时触发压缩
+COMPACT_RECORD_THRESHOLD = 200
+
+# 消息偏移索引文件后缀，与日志文件并列存放，如 chat_<id>.jsonl.idx
+# 格式：8字节头部记录索引覆盖到的日志字节数，其后每条消息记录在日志中的起始偏移各占8字节
+MESSAGE_INDEX_SUFFIX = ".idx"
+_INDEX_HEADER = struct.Struct("<q")
+
+# 消息记录行的固定前缀，构建索引时据此快速跳过其他类型的记录
+_MESSAGE_LINE_PREFIX = b'{"op":"msg"'
+
+# 向前查找末尾完整行时每次读取的字节数
+_TAIL_SCAN_BLOCK_SIZE = 4096
+
+# 各日志文件自上次压缩以来追加的记录数
+_appended_record_counts: Dict[str, int] = {}
+
+
+def _dump_record(record: Dict[str, Any]) -> str:
+    """将单条记录序列化为一行JSON"""
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def get_message_index_path(log_path: Path) -> Path:
+    """获取日志对应的消息偏移索引路径"""
+    return log_path.with_name(log_path.name + MESSAGE_INDEX_SUFFIX)
+
+
+def _write_message_index(log_path: Path, offsets: array, covered_size: int) -> None:
+    """原子写入完整的消息偏移索引"""
+    index_path = get_message_index_path(log_path)
+    temp_path = index_path.with_name(index_path.name + ".tmp")
+    with open(temp_path, "wb") as f:
+        f.write(_INDEX_HEADER.pack(covered_size))
+        f.write(offsets.tobytes())
+    os.replace(temp_path, index_path)
+
+
+def _extend_message_index(log_path: Path, start_size: int, new_offsets: List[int], new_size: int) -> None:
+    """
+    追加写入日志后同步扩展消息偏移索引
+
+    索引不存在或未覆盖到本次追加前的日志末尾时删除索引，由下次读取时补齐
+    """
+    index_path = get_message_index_path(log_path)
+    try:
+        with open(index_path, "r+b") as f:
+            covered_size = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))[0]
+            if covered_size != start_size:
+                raise ValueError("消息偏移索引落后于日志")
+            f.seek(0, os.SEEK_END)
+            f.write(array("q", new_offsets).tobytes())
+            f.seek(0)
+            f.write(_INDEX_HEADER.pack(new_size))
+    except FileNotFoundError:
+        return
+    except Exception:
+        index_path.unlink(missing_ok=True)
+
+
+def _truncate_torn_tail(f) -> int:
+    """
+    截掉日志末尾不完整的行（写入中崩溃留下的半条记录），返回截断后的文件大小
+
+    不截断时新记录会接在半行之后，与其拼成一行无法解析的记录而丢失
+    """
+    size = f.seek(0, os.SEEK_END)
+    if size == 0:
+        return 0
+    f.seek(size - 1)
+    if f.read(1) == b"\n":
+        return size
+
+    end = size
+    while end > 0:
+        start = max(0, end - _TAIL_SCAN_BLOCK_SIZE)
+        f.seek(start)
+        newline = f.read(end - start).rfind(b"\n")
+        if newline >= 0:
+            end = start + newline + 1
+            break
+        end = start
+
+    logger.warning(f"截断聊天日志末尾不完整的记录: {f.name}, {size - end} 字节")
+    f.truncate(end)
+    return end
+
+
+def _scan_message_offsets(log_path: Path, start: int, offsets: array) -> int:
+    """从指定位置扫描日志，把完整的消息记录起始偏移追加到 offsets，返回扫描到的字节位置"""
+    position = start
+    with open(log_path, "rb") as f:
+        f.seek(start)
+        for line in f:
+            # 末尾不完整的行（写入中崩溃）不计入索引
+            if not line.endswith(b"\n"):
+                break
+            if line.startswith(_MESSAGE_LINE_PREFIX):
+                try:
+                    json.loads(line)
+                    offsets.append(position)
+                except json.JSONDecodeError:
+                    pass
+            position += len(line)
+    return position
+
+
+def load_message_index(log_path: Path) -> Optional[array]:
+    """
+    读取消息偏移索引，返回每条消息记录在日志中的起始偏移
+
+    索引落后于日志时只扫描新增部分补齐；索引缺失或与日志不一致时全量重建
+    """
+    if not log_path.exists():
+        return None
+
+    log_size = log_path.stat().st_size
+    index_path = get_message_index_path(log_path)
+    offsets = array("q")
+    covered_size = 0
+
+    try:
+        with open(index_path, "rb") as f:
+            covered_size = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))[0]
+            offsets.frombytes(f.read())
+    except (FileNotFoundError, struct.error, ValueError):
+        offsets = array("q")
+        covered_size = 0
+
+    if covered_size == log_size:
+        return offsets
+
+    if covered_size > log_size:
+        offsets = array("q")
+        covered_size = 0
+
+    covered_size = _scan_message_offsets(log_path, covered_size, offsets)
+    _write_message_index(log_path, offsets, covered_size)
+    return offsets
+
+
+def _apply_record(messages: List[Dict[str, Any]], op: Optional[str], record: Dict[str, Any]) -> None:
+    """把消息相关的记录应用到消息列表"""
+    if op == RECORD_MESSAGE:
+        messages.append(record)
+    elif op == RECORD_DELTA and messages:
+        messages[-1]["content"] = messages[-1].get("content", "") + record.get("text", "")
+    elif op == RECORD_SET and messages:
+        messages[-1]["content"] = record.get("content", "")
+    elif op == RECORD_PATCH and messages:
+        messages[-1].update(record.get("fields", {}))
+
+
+def read_message_range(log_path: Path, offsets: array, start: int, end: int) -> List[Dict[str, Any]]:
+    """
+    读取第 start 到 end-1 条消息
+
+    直接定位到第 start 条消息记录，只回放到第 end 条消息记录之前，与对话总长度无关
+    """
+    if start >= end:
+        return []
+
+    stop = offsets[end] if end < len(offsets) else None
+    messages: List[Dict[str, Any]] = []
+
+    with open(log_path, "rb") as f:
+        f.seek(offsets[start])
+        data = f.read(stop - offsets[start]) if stop is not None else f.read()
+
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        op = record.pop("op", None)
+        record.pop("ts", None)
+        _apply_record(messages, op, record)
+
+    return messages
+
+
+def build_message_record(message: Dict[str, Any]) -> Dict[str, Any]:
+    """构造消息记录"""
+    record = {"op": RECORD_MESSAGE, "ts": datetime.now().isoformat()}
+    record.update(message)
+    return record
+
+
+def build_delta_record(text: str) -> Dict[str, Any]:
+    """构造增量文本记录"""
+    return {"op": RECORD_DELTA, "text": text, "ts": datetime.now().isoformat()}
+
+
+def build_set_record(content: str) -> Dict[str, Any]:
+    """构造覆盖内容记录"""
+    return {"op": RECORD_SET, "content": content, "ts": datetime.now().isoformat()}
+
+
+def build_patch_record(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """构造消息字段补丁记录"""
+    return {"op": RECORD_PATCH, "fields": fields, "ts": datetime.now().isoformat()}
+
+
+def build_summary_record(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """构造滚动摘要记录"""
+    return {
+        "op": RECORD_SUMMARY,
+        "content": summary.get("content", ""),
+        "covered_count": summary.get("covered_count", 0),
+        "ts": datetime.now().isoformat()
+    }
+
+
+def _encode_chat_snapshot(chat_data: Dict[str, Any]) -> Tuple[bytes, array]:
+    """把对话序列化为快照形式的日志内容：首行元信息，其后每条消息一行；同时返回各消息记录的偏移"""
+    meta = {
+        "op": RECORD_META,
+        "created_at": chat_data.get("created_at", datetime.now().isoformat()),
+        "user_id": chat_data.get("user_id"),
+        "user_role": chat_data.get("user_role"),
+        "ts": chat_data.get("last_updated", datetime.now().isoformat()),
+    }
+
+    lines = [_dump_record(meta).encode("utf-8")]
+    if chat_data.get("context_summary"):
+        summary_record = build_summary_record(chat_data["context_summary"])
+        summary_record["ts"] = meta["ts"]
+        lines.append(_dump_record(summary_record).encode("utf-8"))
+
+    offsets = array("q")
+    position = sum(len(line) for line in lines)
+    for message in chat_data.get("messages", []):
+        record = {"op": RECORD_MESSAGE}
+        record.update(message)
+        line = _dump_record(record).encode("utf-8")
+        offsets.append(position)
+        lines.append(line)
+        position += len(line)
+
+    return b"".join(lines), offsets
+
+
+def write_chat_snapshot(log_path: Path, chat_data: Dict[str, Any]) -> None:
+    """
+    以压缩形式重写整个对话日志：首行元信息，其后每条消息一行
+
+    先写入临时文件再原子替换，写入过程中崩溃不会损坏原日志
+    """
+    log_path.parent.mkdir(exist_ok=True, parents=True)
+    temp_path = log_path.with_suffix(log_path.suffix + ".tmp")
+
+    content, offsets = _encode_chat_snapshot(chat_data)
+    with open(temp_path, "wb") as f:
+        f.write(content)
+
+    os.replace(temp_path, log_path)
+    _write_message_index(log_path, offsets, len(content))
+    _appended_record_counts[str(log_path)] = 0
+
+
+def append_chat_records(log_path: Path, records: List[Dict[str, Any]]) -> bool:
+    """
+    向对话日志末尾追加记录
+
+    返回:
+        bool: 自上次压缩以来的记录数是否已达到压缩阈值
+    """
+    if not records:
+        return False
+
+    new_offsets = []
+    with open(log_path, "a+b") as f:
+        start_size = _truncate_torn_tail(f)
+        chunks = []
+        position = start_size
+        for record in records:
+            line = _dump_record(record).encode("utf-8")
+            if record.get("op") == RECORD_MESSAGE:
+                new_offsets.append(position)
+            chunks.append(line)
+            position += len(line)
+        f.write(b"".join(chunks))
+
+    _extend_message_index(log_path, start_size, new_offsets, position)
+
+    key = str(log_path)
+    _appended_record_counts[key] = _appended_record_counts.get(key, 0) + len(records)
+    return _appended_record_counts[key] >= COMPACT_RECORD_THRESHOLD
+
+
+def load_chat_log(log_path: Path) -> Optional[Dict[str, Any]]:
+    """回放追加式日志，还原为对话数据"""
+    if not log_path.exists():
+        return None
+
+    # 崩溃时末行可能在多字节字符中间截断，按替换字符解码，使该行作为不完整记录被跳过
+    with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+        lines = f.readlines()
+
+    return _replay_chat_records(lines, log_path)
+
+
+def get_chat_archive_path(log_path: Path) -> Path:
+    """获取日志对应的冷对话归档路径，如 chat_<id>.jsonl.gz"""
+    return log_path.with_name(log_path.name + ARCHIVE_SUFFIX)
+
+
+def archive_chat_log(log_path: Path) -> int:
+    """
+    将对话日志压缩归档：整理为快照形式后以gzip写入归档文件，随后删除日志及其消息偏移索引
+
+    返回:
+        int: 归档文件的字节数
+    """
+    chat_data = load_chat_log(log_path)
+    if chat_data is None:
+        raise ValueError(f"聊天日志无法解析，跳过归档: {log_path}")
+
+    content, _ = _encode_chat_snapshot(chat_data)
+    archive_path = get_chat_archive_path(log_path)
+    temp_path = archive_path.with_name(archive_path.name + ".tmp")
+    with gzip.open(temp_path, "wb", compresslevel=9) as f:
+        f.write(content)
+    os.replace(temp_path, archive_path)
+
+    log_path.unlink()
+    get_message_index_path(log_path).unlink(missing_ok=True)
+    _appended_record_counts.pop(str(log_path), None)
+    return archive_path.stat().st_size
+
+
+def load_chat_archive(archive_path: Path) -> Optional[Dict[str, Any]]:
+    """直接读取归档中的对话数据，不解压到磁盘（用于批量加载）"""
+    if not archive_path.exists():
+        return None
+
+    with gzip.open(archive_path, "rt", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    return _replay_chat_records(lines, archive_path)
+
+
+def restore_chat_archive(log_path: Path) -> bool:
+    """
+    对话再次被打开时把归档解压回追加式日志
+
+    返回:
+        bool: 是否存在归档并已解压
+    """
+    archive_path = get_chat_archive_path(log_path)
+    if not archive_path.exists():
+        return False
+
+    temp_path = log_path.with_suffix(log_path.suffix + ".tmp")
+    with gzip.open(archive_path, "rb") as src, open(temp_path, "wb") as dst:
+        dst.write(src.read())
+    os.replace(temp_path, log_path)
+    archive_path.unlink()
+
+    # 解压后的日志即为快照形式，消息偏移索引在下次分页读取时重建
+    _appended_record_counts[str(log_path)] = 0
+    return True
+
+
+def _replay_chat_records(lines: List[str], source: Path) -> Optional[Dict[str, Any]]:
+    """按顺序回放日志记录，还原为对话数据"""
+    chat_data: Dict[str, Any] = {"messages": []}
+    messages = chat_data["messages"]
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # 进程崩溃时可能留下写了一半的记录，跳过该行继续回放
+            logger.warning(f"忽略聊天日志中不完整的记录: {source}")
+            continue
+
+        op = record.pop("op", None)
+        ts = record.pop("ts", None)
+
+        if op == RECORD_META:
+            chat_data["created_at"] = record.get("created_at", ts)
+            chat_data["user_id"] = record.get("user_id")
+            chat_data["user_role"] = record.get("user_role")
+        elif op == RECORD_SUMMARY:
+            chat_data["context_summary"] = {
+                "content": record.get("content", ""),
+                "covered_count": record.get("covered_count", 0)
+            }
+        else:
+            _apply_record(messages, op, record)
+
+        if ts:
+            chat_data["last_updated"] = ts
+
+    if "created_at" not in chat_data:
+        logger.warning(f"聊天日志缺少元信息记录: {source}")
+        return None
+
+    chat_data.setdefault("last_updated", chat_data["created_at"])
+    return chat_data
+
+
+def load_legacy_chat_file(legacy_path: Path) -> Optional[Dict[str, Any]]:
+    """读取旧版整文件JSON格式的对话"""
+    if not legacy_path.exists():
+        return None
+
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        return json.load(f)
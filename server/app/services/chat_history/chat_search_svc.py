@@ -0,0 +1,262 @@
+import asyncio
+import re
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from app.config import MEDIA_ROOT, CHAT_FILE_LOCK_TIMEOUT_SECONDS
+from app.core.logger import setup_logger
+from app.models.user_common import UserRole
+from app.services.chat_history.storage_engine_svc import get_chat_storage_engine
+
+logger = setup_logger("chat_service")
+
+# 聊天全文检索索引根目录，每个用户一个SQLite文件，与聊天存储引擎无关
+CHAT_SEARCH_ROOT_DIR = MEDIA_ROOT / "chat_search"
+CHAT_SEARCH_ROOT_DIR.mkdir(exist_ok=True, parents=True)
+
+# 搜索结果中命中位置前后保留的字符数
+SNIPPET_CONTEXT_CHARS = 40
+
+# 中日韩统一表意文字（含扩展A与兼容区）按字切分，其余按字母数字连续串切分
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD_RUN = re.compile(r"[0-9a-z_]+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (chat_id, seq)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (term, chat_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_message ON postings (chat_id, seq);
+CREATE INDEX IF NOT EXISTS idx_messages_updated ON messages (updated_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文感知的分词：汉字输出单字与相邻二元组，英文与数字输出完整的小写单词
+
+    单字用于单字查询，二元组使多字查询只需求交少量倒排列表；结果已去重
+    """
+    text = text.lower()
+    terms = set(_WORD_RUN.findall(text))
+    for run in _CJK_RUN.findall(text):
+        terms.update(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return list(terms)
+
+
+def _query_terms(query: str) -> List[str]:
+    """查询只使用汉字二元组（单字查询时用单字）与完整单词，减少需要求交的倒排列表"""
+    text = query.lower()
+    terms = set(_WORD_RUN.findall(text))
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.add(run)
+        else:
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return list(terms)
+
+
+def get_search_index_path(user_id: str, user_role: UserRole) -> Path:
+    """获取用户聊天检索索引文件路径"""
+    return CHAT_SEARCH_ROOT_DIR / f"{user_role.value}_{user_id}.sqlite3"
+
+
+def _connect(index_path: Path) -> sqlite3.Connection:
+    """打开索引库；多个服务进程共享同一文件，依赖SQLite自身的锁串行化写入"""
+    conn = sqlite3.connect(str(index_path), timeout=CHAT_FILE_LOCK_TIMEOUT_SECONDS)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _index_messages(
+        conn: sqlite3.Connection,
+        chat_id: str,
+        messages: Iterable[Tuple[int, Dict[str, Any]]],
+        updated_at: str,
+        replace: bool = True
+) -> None:
+    """
+    写入若干条消息及其倒排记录（调用方负责提交事务）
+
+    replace 为False时跳过已索引的消息，全量构建期间增量写入的内容更新，不应被覆盖
+    """
+    for seq, message in messages:
+        if not replace and conn.execute(
+                "SELECT 1 FROM messages WHERE chat_id = ? AND seq = ?", (chat_id, seq)
+        ).fetchone():
+            continue
+
+        conn.execute("DELETE FROM postings WHERE chat_id = ? AND seq = ?", (chat_id, seq))
+        content = message.get("content", "")
+        if not content.strip():
+            conn.execute("DELETE FROM messages WHERE chat_id = ? AND seq = ?", (chat_id, seq))
+            continue
+
+        conn.execute(
+            "INSERT OR REPLACE INTO messages (chat_id, seq, role, content, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, seq, message.get("role", "user"), content, updated_at)
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO postings (term, chat_id, seq) VALUES (?, ?, ?)",
+            [(term, chat_id, seq) for term in tokenize(content)]
+        )
+
+
+def _is_index_built(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+    return row is not None
+
+
+def _build_snippet(content: str, keywords: List[str]) -> str:
+    """截取第一个关键词命中位置附近的文本"""
+    lowered = content.lower()
+    positions = [lowered.find(keyword) for keyword in keywords]
+    hit = min((pos for pos in positions if pos >= 0), default=0)
+
+    start = max(hit - SNIPPET_CONTEXT_CHARS, 0)
+    end = min(hit + SNIPPET_CONTEXT_CHARS * 2, len(content))
+    snippet = content[start:end].replace("\n", " ")
+    return ("..." if start > 0 else "") + snippet + ("..." if end < len(content) else "")
+
+
+class ChatSearchIndex:
+    """
+    用户聊天全文检索
+
+    每个用户一个倒排索引（SQLite），消息写入存储后增量更新；查询只读取命中关键词的倒排列表，
+    不加载聊天文件。索引首次使用时从存储引擎全量构建一次
+    """
+
+    def index_messages(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            start_seq: int,
+            messages: List[Dict[str, Any]]
+    ) -> None:
+        """索引对话中从 start_seq 开始的连续若干条消息，同一序号重复索引时覆盖旧内容"""
+        if not messages:
+            return
+
+        with closing(_connect(get_search_index_path(user_id, user_role))) as conn:
+            with conn:
+                _index_messages(
+                    conn, chat_id,
+                    enumerate(messages, start=start_seq),
+                    datetime.now().isoformat()
+                )
+
+    def rebuild(self, user_id: str, user_role: UserRole, user_chats: Dict[str, Dict[str, Any]]) -> int:
+        """用用户的全部对话构建索引，返回处理的消息数"""
+        count = 0
+        with closing(_connect(get_search_index_path(user_id, user_role))) as conn:
+            with conn:
+                for chat_id, chat_data in user_chats.items():
+                    messages = chat_data.get("messages", [])
+                    updated_at = chat_data.get("last_updated") or chat_data.get("created_at", "")
+                    _index_messages(conn, chat_id, enumerate(messages), updated_at, replace=False)
+                    count += len(messages)
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)",
+                    (datetime.now().isoformat(),)
+                )
+        return count
+
+    def is_built(self, user_id: str, user_role: UserRole) -> bool:
+        index_path = get_search_index_path(user_id, user_role)
+        if not index_path.exists():
+            return False
+        with closing(_connect(index_path)) as conn:
+            return _is_index_built(conn)
+
+    def search(self, user_id: str, user_role: UserRole, query: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        关键词检索，多个关键词之间为"且"关系，结果按消息更新时间倒序
+
+        倒排列表求交得到候选消息后，再按原文做子串校验，排除二元组拼接造成的误命中
+        """
+        terms = _query_terms(query)
+        keywords = [keyword for keyword in query.lower().split() if keyword]
+        if not terms or not keywords:
+            return []
+
+        term_params = ",".join("?" for _ in terms)
+        keyword_filters = " AND ".join("instr(lower(m.content), ?) > 0" for _ in keywords)
+        sql = (
+            "SELECT m.chat_id, m.seq, m.role, m.content, m.updated_at FROM messages m "
+            "JOIN (SELECT chat_id, seq FROM postings "
+            f"WHERE term IN ({term_params}) GROUP BY chat_id, seq HAVING COUNT(*) = ?) p "
+            "ON m.chat_id = p.chat_id AND m.seq = p.seq "
+            f"WHERE {keyword_filters} "
+            "ORDER BY m.updated_at DESC, m.seq DESC LIMIT ?"
+        )
+
+        with closing(_connect(get_search_index_path(user_id, user_role))) as conn:
+            rows = conn.execute(sql, [*terms, len(terms), *keywords, limit]).fetchall()
+
+        return [
+            {
+                "chat_id": chat_id,
+                "seq": seq,
+                "role": role,
+                "snippet": _build_snippet(content, keywords),
+                "updated_at": updated_at
+            }
+            for chat_id, seq, role, content, updated_at in rows
+        ]
+
+
+chat_search_index = ChatSearchIndex()
+
+
+async def index_chat_messages(
+        user_id: str,
+        user_role: UserRole,
+        chat_id: str,
+        start_seq: int,
+        messages: List[Dict[str, Any]]
+) -> None:
+    """在线程中增量更新检索索引，失败只记录日志，不影响聊天流程"""
+    try:
+        await asyncio.to_thread(chat_search_index.index_messages, user_id, user_role, chat_id, start_seq, messages)
+    except Exception as e:
+        logger.error(f"更新聊天检索索引失败: {user_role.value}_{user_id}/chat_{chat_id}, {str(e)}")
+
+
+async def search_chat_messages(
+        user_id: str,
+        user_role: UserRole,
+        query: str,
+        limit: int = 20
+) -> List[Dict[str, Any]]:
+    """检索用户的聊天消息；索引尚未构建时先从存储引擎全量构建一次"""
+    folder_name = f"{user_role.value}_{user_id}"
+
+    if not await asyncio.to_thread(chat_search_index.is_built, user_id, user_role):
+        logger.info(f"开始构建用户 {folder_name} 的聊天检索索引")
+        user_chats = await get_chat_storage_engine().load_user_chats(user_id, user_role)
+        count = await asyncio.to_thread(chat_search_index.rebuild, user_id, user_role, user_chats)
+        logger.info(f"用户 {folder_name} 的聊天检索索引构建完成，共 {count} 条消息")
+
+    return await asyncio.to_thread(chat_search_index.search, user_id, user_role, query, limit)
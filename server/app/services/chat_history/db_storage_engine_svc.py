@@ -0,0 +1,274 @@
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+
+from app.core.logger import setup_logger
+from app.models.chat_history import ChatSession, ChatMessageRecord
+from app.models.user_common import UserRole
+from app.services.chat_history.chat_log_store_svc import (
+    RECORD_MESSAGE, RECORD_DELTA, RECORD_SET, RECORD_PATCH, RECORD_SUMMARY
+)
+from app.services.chat_history.storage_engine_svc import (
+    ChatStorageEngine, get_chat_preview, count_valid_messages, get_message_page_bounds, build_message_page
+)
+
+logger = setup_logger("chat_service")
+
+
+def _message_bytes(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(msg.get("content", "").encode("utf-8")) for msg in messages)
+
+
+def _to_message_dict(record: ChatMessageRecord) -> Dict[str, Any]:
+    message = {"role": record.role, "content": record.content}
+    if record.truncated:
+        message["truncated"] = True
+    return message
+
+
+def _to_index_entry(session: ChatSession) -> Dict[str, Any]:
+    return {
+        "chat_id": session.chat_id,
+        "created_at": session.created_at,
+        "last_updated": session.last_updated,
+        "preview": session.preview,
+        "message_count": session.message_count,
+        "user_role": session.user_role,
+        "size_bytes": session.size_bytes
+    }
+
+
+class DatabaseChatStorageEngine(ChatStorageEngine):
+    """
+    数据库聊天存储引擎
+
+    对话与消息分别保存在 chat_session / chat_message 表中，列表查询只读取对话表的汇总列；
+    写入时锁定对话行并递增版本号，多个服务进程可安全共享同一份数据
+
+    增量记录只能通过重写整条消息内容实现，因此生成中的回复只保存在缓存中，结束时一次写入
+    """
+
+    name = "database"
+    write_deltas_while_streaming = False
+
+    async def load_chat(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        async with in_transaction():
+            session = await self._get_session(user_id, user_role, chat_id)
+            if session is None:
+                return None, None
+
+            records = await ChatMessageRecord.filter(session_id=session.id).order_by("seq")
+        return self._to_chat_data(session, records), str(session.version)
+
+    async def get_chat_version(self, user_id: str, user_role: UserRole, chat_id: str) -> Optional[str]:
+        version = await ChatSession.filter(
+            user_role=user_role.value, user_id=user_id, chat_id=chat_id
+        ).values_list("version", flat=True).first()
+        return str(version) if version is not None else None
+
+    async def save_chat(self, user_id: str, user_role: UserRole, chat_id: str, chat_data: Dict[str, Any]) -> str:
+        async with in_transaction():
+            session = await self._get_session(user_id, user_role, chat_id, for_update=True)
+            if session is None:
+                session = ChatSession(user_role=user_role.value, user_id=user_id, chat_id=chat_id)
+            else:
+                await ChatMessageRecord.filter(session_id=session.id).delete()
+                session.version += 1
+            await self._write_chat_data(session, chat_data)
+
+        return str(session.version)
+
+    async def append_records(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            records: List[Dict[str, Any]],
+            chat_data: Optional[Dict[str, Any]] = None,
+            expected_version: Optional[str] = None
+    ) -> Optional[str]:
+        async with in_transaction():
+            session = await self._get_session(user_id, user_role, chat_id, for_update=True)
+            if session is None:
+                # 对话尚未写入时在同一事务中保存完整数据
+                if chat_data is None:
+                    return None
+                try:
+                    async with in_transaction():
+                        session = ChatSession(user_role=user_role.value, user_id=user_id, chat_id=chat_id)
+                        await self._write_chat_data(session, chat_data)
+                    return str(session.version)
+                except IntegrityError:
+                    # 其他进程已并发创建该对话（唯一索引冲突回滚到保存点），锁定其已提交的行后追加记录
+                    session = await self._get_session(user_id, user_role, chat_id, for_update=True)
+
+            in_sync = expected_version is not None and str(session.version) == expected_version
+            if not records:
+                return str(session.version) if in_sync else None
+
+            last = await ChatMessageRecord.filter(session_id=session.id).order_by("-seq").first()
+            next_seq = last.seq + 1 if last else 0
+            size_delta = 0
+
+            for record in records:
+                op = record.get("op")
+                if op == RECORD_MESSAGE:
+                    last = await ChatMessageRecord.create(
+                        session_id=session.id,
+                        seq=next_seq,
+                        role=record.get("role", "user"),
+                        content=record.get("content", ""),
+                        truncated=bool(record.get("truncated", False))
+                    )
+                    next_seq += 1
+                    size_delta += len(last.content.encode("utf-8"))
+                elif op == RECORD_DELTA and last:
+                    text = record.get("text", "")
+                    last.content += text
+                    size_delta += len(text.encode("utf-8"))
+                    await last.save(update_fields=["content"])
+                elif op == RECORD_SET and last:
+                    content = record.get("content", "")
+                    size_delta += len(content.encode("utf-8")) - len(last.content.encode("utf-8"))
+                    last.content = content
+                    await last.save(update_fields=["content"])
+                elif op == RECORD_PATCH and last:
+                    if "truncated" in record.get("fields", {}):
+                        last.truncated = bool(record["fields"]["truncated"])
+                        await last.save(update_fields=["truncated"])
+                elif op == RECORD_SUMMARY:
+                    session.context_summary = record.get("content", "")
+                    session.summary_covered_count = record.get("covered_count", 0)
+
+                if record.get("ts"):
+                    session.last_updated = record["ts"]
+
+            session.size_bytes += size_delta
+            session.version += 1
+            await session.save(update_fields=[
+                "context_summary", "summary_covered_count", "last_updated", "size_bytes", "version"
+            ])
+
+        return str(session.version) if in_sync else None
+
+    async def get_message_range(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            before: Optional[int],
+            limit: int
+    ) -> Optional[Dict[str, Any]]:
+        async with in_transaction():
+            session = await self._get_session(user_id, user_role, chat_id)
+            if session is None:
+                return None
+
+            # 消息序号连续递增，总数即最大序号加一，借助 (session, seq) 唯一索引按范围读取
+            last = await ChatMessageRecord.filter(session_id=session.id).order_by("-seq").first()
+            total = last.seq + 1 if last else 0
+            start, end = get_message_page_bounds(total, before, limit)
+            records = await ChatMessageRecord.filter(
+                session_id=session.id, seq__gte=start, seq__lt=end
+            ).order_by("seq")
+
+        return build_message_page([_to_message_dict(record) for record in records], start, total)
+
+    async def load_user_chats(self, user_id: str, user_role: UserRole) -> Dict[str, Dict[str, Any]]:
+        sessions = await ChatSession.filter(user_role=user_role.value, user_id=user_id)
+        if not sessions:
+            return {}
+
+        records_by_session: Dict[int, List[ChatMessageRecord]] = {session.id: [] for session in sessions}
+        records = await ChatMessageRecord.filter(session_id__in=list(records_by_session)).order_by("seq")
+        for record in records:
+            records_by_session[record.session_id].append(record)
+
+        return {
+            session.chat_id: self._to_chat_data(session, records_by_session[session.id])
+            for session in sessions
+        }
+
+    async def get_chat_index(self, user_id: str, user_role: UserRole) -> Dict[str, Dict[str, Any]]:
+        sessions = await ChatSession.filter(user_role=user_role.value, user_id=user_id).order_by("-last_updated")
+        return {session.chat_id: _to_index_entry(session) for session in sessions}
+
+    async def update_chat_index(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            chat_data: Dict[str, Any]
+    ) -> None:
+        messages = chat_data.get("messages", [])
+        await ChatSession.filter(user_role=user_role.value, user_id=user_id, chat_id=chat_id).update(
+            preview=get_chat_preview(messages),
+            message_count=count_valid_messages(messages),
+            last_updated=chat_data.get("last_updated", datetime.now().isoformat())
+        )
+
+    def get_storage_location(self, user_id: str, user_role: UserRole) -> str:
+        return f"database:{ChatSession._meta.db_table}/{user_role.value}_{user_id}"
+
+    @staticmethod
+    async def _get_session(
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            for_update: bool = False
+    ) -> Optional[ChatSession]:
+        query = ChatSession.filter(user_role=user_role.value, user_id=user_id, chat_id=chat_id)
+        if for_update:
+            query = query.select_for_update()
+        return await query.first()
+
+    @staticmethod
+    async def _write_chat_data(session: ChatSession, chat_data: Dict[str, Any]) -> None:
+        """在当前事务中写入对话汇总信息与全部消息，调用方负责清除原有消息"""
+        messages = chat_data.get("messages", [])
+        summary = chat_data.get("context_summary") or {}
+        now = datetime.now().isoformat()
+
+        session.created_at = chat_data.get("created_at", now)
+        session.last_updated = chat_data.get("last_updated", session.created_at)
+        session.preview = get_chat_preview(messages)
+        session.message_count = count_valid_messages(messages)
+        session.size_bytes = _message_bytes(messages)
+        session.context_summary = summary.get("content")
+        session.summary_covered_count = summary.get("covered_count", 0)
+        await session.save()
+
+        if messages:
+            await ChatMessageRecord.bulk_create([
+                ChatMessageRecord(
+                    session_id=session.id,
+                    seq=seq,
+                    role=msg.get("role", "user"),
+                    content=msg.get("content", ""),
+                    truncated=bool(msg.get("truncated", False))
+                )
+                for seq, msg in enumerate(messages)
+            ])
+
+    @staticmethod
+    def _to_chat_data(session: ChatSession, records: List[ChatMessageRecord]) -> Dict[str, Any]:
+        chat_data = {
+            "messages": [_to_message_dict(record) for record in records],
+            "created_at": session.created_at,
+            "user_id": session.user_id,
+            "user_role": session.user_role,
+            "last_updated": session.last_updated
+        }
+        if session.context_summary is not None:
+            chat_data["context_summary"] = {
+                "content": session.context_summary,
+                "covered_count": session.summary_covered_count
+            }
+        return chat_data
@@ -0,0 +1,363 @@
+import asyncio
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from filelock import FileLock
+
+from app.config import MEDIA_ROOT, CHAT_FILE_LOCK_TIMEOUT_SECONDS
+from app.core.logger import setup_logger
+from app.models.user_common import UserRole
+from app.services.chat_history.chat_index_svc import (
+    load_chat_index, save_chat_index, upsert_chat_index_entry, get_chat_index_lock
+)
+from app.services.chat_history.chat_log_store_svc import (
+    CHAT_LOG_SUFFIX, ARCHIVE_SUFFIX, LEGACY_CHAT_SUFFIX,
+    write_chat_snapshot, append_chat_records, load_chat_log, load_legacy_chat_file,
+    load_message_index, read_message_range,
+    get_chat_archive_path, load_chat_archive, restore_chat_archive
+)
+from app.services.chat_history.storage_engine_svc import (
+    ChatStorageEngine, build_chat_index_entry, get_message_page_bounds, build_message_page
+)
+
+logger = setup_logger("chat_service")
+
+# 聊天历史存储根目录
+CHAT_HISTORY_ROOT_DIR = MEDIA_ROOT / "chat_history"
+CHAT_HISTORY_ROOT_DIR.mkdir(exist_ok=True, parents=True)
+
+
+def get_user_chat_directory(user_id: str, user_role: UserRole) -> Path:
+    """根据用户角色和ID创建用户专属的聊天历史目录"""
+    # 根据角色和用户ID创建目录名：如 student_1, teacher_2, admin_3
+    folder_name = f"{user_role.value}_{user_id}"
+    user_dir = CHAT_HISTORY_ROOT_DIR / folder_name
+    user_dir.mkdir(exist_ok=True, parents=True)
+    return user_dir
+
+
+def get_chat_file_path(user_id: str, user_role: UserRole, chat_id: str) -> Path:
+    """获取指定用户角色、用户ID和聊天ID的追加式日志文件路径"""
+    user_dir = get_user_chat_directory(user_id, user_role)
+    return user_dir / f"chat_{chat_id}{CHAT_LOG_SUFFIX}"
+
+
+def get_legacy_chat_file_path(user_id: str, user_role: UserRole, chat_id: str) -> Path:
+    """获取旧版整文件JSON格式的聊天文件路径"""
+    user_dir = get_user_chat_directory(user_id, user_role)
+    return user_dir / f"chat_{chat_id}{LEGACY_CHAT_SUFFIX}"
+
+
+def get_chat_lock_path(chat_file: Path) -> Path:
+    """聊天文件对应的锁文件路径"""
+    return chat_file.with_name(chat_file.name + ".lock")
+
+
+def get_chat_lock(chat_file: Path) -> FileLock:
+    """获取聊天文件的跨进程锁，所有读写日志的操作都需持有"""
+    return FileLock(str(get_chat_lock_path(chat_file)), timeout=CHAT_FILE_LOCK_TIMEOUT_SECONDS)
+
+
+def get_chat_file_version(chat_file: Path) -> Optional[str]:
+    """以修改时间与文件大小作为版本号：追加与压缩都会改变二者之一"""
+    try:
+        stat = chat_file.stat()
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def list_chat_files(user_dir: Path) -> List[Path]:
+    """列出用户目录下的所有聊天文件（追加式日志、冷对话归档与旧版JSON文件）"""
+    return list(user_dir.glob(f"chat_*{CHAT_LOG_SUFFIX}")) \
+        + list(user_dir.glob(f"chat_*{CHAT_LOG_SUFFIX}{ARCHIVE_SUFFIX}")) \
+        + list(user_dir.glob(f"chat_*{LEGACY_CHAT_SUFFIX}"))
+
+
+def get_chat_id_from_file(chat_file: Path) -> Optional[str]:
+    """从聊天文件名提取chat_id（去掉 "chat_" 前缀和文件后缀）"""
+    name = chat_file.name
+    if not name.startswith("chat_"):
+        return None
+    for suffix in (CHAT_LOG_SUFFIX + ARCHIVE_SUFFIX, CHAT_LOG_SUFFIX, LEGACY_CHAT_SUFFIX):
+        if name.endswith(suffix):
+            return name[5:-len(suffix)]
+    return None
+
+
+class FileSystemChatStorageEngine(ChatStorageEngine):
+    """
+    文件聊天存储引擎
+
+    每个对话一个追加式JSONL日志，位于 documents/chat_history/<角色>_<用户ID>/ 下，
+    列表信息由同目录的索引文件提供；文件I/O均放到线程中执行
+
+    多个服务进程通过文件锁串行化同一对话的读写，以文件修改时间与大小作为版本号；
+    长期未更新的对话由 chat_archive_svc 压缩为 chat_<id>.jsonl.gz，再次打开时自动解压回日志
+    """
+
+    name = "filesystem"
+
+    async def load_chat(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        return await asyncio.to_thread(self._load_chat, user_id, user_role, chat_id)
+
+    async def get_chat_version(self, user_id: str, user_role: UserRole, chat_id: str) -> Optional[str]:
+        return await asyncio.to_thread(get_chat_file_version, get_chat_file_path(user_id, user_role, chat_id))
+
+    async def save_chat(self, user_id: str, user_role: UserRole, chat_id: str, chat_data: Dict[str, Any]) -> str:
+        chat_file = get_chat_file_path(user_id, user_role, chat_id)
+        version = await asyncio.to_thread(self._save_chat, chat_file, chat_data)
+        logger.debug(f"聊天记录已压缩保存到角色文件夹: {user_role.value}_{user_id}/{chat_file.name}")
+        return version
+
+    async def append_records(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            records: List[Dict[str, Any]],
+            chat_data: Optional[Dict[str, Any]] = None,
+            expected_version: Optional[str] = None
+    ) -> Optional[str]:
+        return await asyncio.to_thread(
+            self._append_records, user_id, user_role, chat_id, records, chat_data, expected_version
+        )
+
+    async def get_message_range(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            before: Optional[int],
+            limit: int
+    ) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get_message_range, user_id, user_role, chat_id, before, limit)
+
+    async def load_user_chats(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            convert_legacy: bool = True
+    ) -> Dict[str, Dict[str, Any]]:
+        """convert_legacy 为False时只读取旧版JSON文件，不转换为追加式日志（供只读统计使用）"""
+        return await asyncio.to_thread(self._load_user_chats, user_id, user_role, convert_legacy)
+
+    async def get_chat_index(self, user_id: str, user_role: UserRole) -> Dict[str, Dict[str, Any]]:
+        """读取用户聊天索引，缺失或损坏时扫描全部聊天文件重建"""
+        user_dir = get_user_chat_directory(user_id, user_role)
+        index = await asyncio.to_thread(load_chat_index, user_dir)
+        if index is None:
+            index = await asyncio.to_thread(self._rebuild_chat_index, user_id, user_role)
+        return index
+
+    async def update_chat_index(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            chat_data: Dict[str, Any]
+    ) -> None:
+        await asyncio.to_thread(self._update_chat_index, user_id, user_role, chat_id, chat_data)
+
+    def get_storage_location(self, user_id: str, user_role: UserRole) -> str:
+        return str(get_user_chat_directory(user_id, user_role))
+
+    def _load_chat(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            restore: bool = True,
+            convert_legacy: bool = True
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        从用户角色专属文件夹加载聊天历史，兼容旧版JSON文件
+
+        对话已归档时，restore 为True则解压回追加式日志（对话被重新打开），否则只在内存中读取归档；
+        convert_legacy 为False时旧版文件只读取不转换
+        """
+        chat_file = get_chat_file_path(user_id, user_role, chat_id)
+        restored = False
+
+        with get_chat_lock(chat_file):
+            if not chat_file.exists() and get_chat_archive_path(chat_file).exists():
+                if not restore:
+                    return load_chat_archive(get_chat_archive_path(chat_file)), None
+                restored = restore_chat_archive(chat_file)
+
+            data = load_chat_log(chat_file)
+
+            if data is None:
+                legacy_file = get_legacy_chat_file_path(user_id, user_role, chat_id)
+                data = load_legacy_chat_file(legacy_file)
+                if data is not None and not convert_legacy:
+                    return data, None
+                if data is not None:
+                    # 旧版文件首次读取时转换为追加式日志
+                    write_chat_snapshot(chat_file, data)
+                    legacy_file.unlink()
+                    logger.info(f"旧版聊天文件已转换为追加式日志: {user_role.value}_{user_id}/{chat_file.name}")
+
+            version = get_chat_file_version(chat_file) if data is not None else None
+
+        if restored:
+            logger.info(f"归档对话已解压: {user_role.value}_{user_id}/{chat_file.name}")
+            if data is not None:
+                # 释放对话锁后再更新索引，避免与重建索引时的加锁顺序相反
+                self._update_chat_index(user_id, user_role, chat_id, data)
+
+        if data is not None:
+            logger.debug(f"从角色文件夹加载聊天记录: {user_role.value}_{user_id}/{chat_file.name}")
+        return data, version
+
+    @staticmethod
+    def _save_chat(chat_file: Path, chat_data: Dict[str, Any]) -> str:
+        with get_chat_lock(chat_file):
+            write_chat_snapshot(chat_file, chat_data)
+            return get_chat_file_version(chat_file)
+
+    @staticmethod
+    def _append_records(
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            records: List[Dict[str, Any]],
+            chat_data: Optional[Dict[str, Any]],
+            expected_version: Optional[str]
+    ) -> Optional[str]:
+        """向聊天日志追加记录，追加量达到阈值且缓存未过期时用缓存中的完整数据压缩日志"""
+        chat_file = get_chat_file_path(user_id, user_role, chat_id)
+
+        with get_chat_lock(chat_file):
+            # 已归档的对话先解压，追加的记录接在归档内容之后
+            if not chat_file.exists():
+                restore_chat_archive(chat_file)
+            current_version = get_chat_file_version(chat_file)
+
+            # 日志尚不存在时直接写入完整快照
+            if current_version is None:
+                if chat_data is None:
+                    return None
+                write_chat_snapshot(chat_file, chat_data)
+                return get_chat_file_version(chat_file)
+
+            in_sync = expected_version is not None and current_version == expected_version
+            needs_compaction = append_chat_records(chat_file, records)
+
+            # 其他进程写入过的日志不能用本进程的缓存数据重写，否则会丢失对方追加的记录
+            if needs_compaction and in_sync and chat_data is not None:
+                write_chat_snapshot(chat_file, chat_data)
+                logger.debug(f"聊天日志已压缩: {user_role.value}_{user_id}/{chat_file.name}")
+
+            if not in_sync:
+                logger.info(f"聊天日志已被其他进程修改，缓存将在下次读取时重新加载: "
+                            f"{user_role.value}_{user_id}/{chat_file.name}")
+                return None
+            return get_chat_file_version(chat_file)
+
+    def _get_message_range(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            before: Optional[int],
+            limit: int
+    ) -> Optional[Dict[str, Any]]:
+        """借助消息偏移索引直接定位到目标范围，只解析该范围内的日志记录"""
+        chat_file = get_chat_file_path(user_id, user_role, chat_id)
+
+        if not chat_file.exists():
+            # 旧版JSON文件先走完整加载流程转换为追加式日志
+            data, _ = self._load_chat(user_id, user_role, chat_id)
+            if data is None:
+                return None
+
+        with get_chat_lock(chat_file):
+            offsets = load_message_index(chat_file)
+            if offsets is None:
+                return None
+
+            total = len(offsets)
+            start, end = get_message_page_bounds(total, before, limit)
+            messages = read_message_range(chat_file, offsets, start, end)
+
+        return build_message_page(messages, start, total)
+
+    def _load_user_chats(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            convert_legacy: bool = True
+    ) -> Dict[str, Dict[str, Any]]:
+        """从用户角色专属文件夹加载所有聊天历史"""
+        user_chats: Dict[str, Dict[str, Any]] = {}
+        folder_name = f"{user_role.value}_{user_id}"
+
+        chat_files = list_chat_files(get_user_chat_directory(user_id, user_role))
+        logger.info(f"在角色目录 {folder_name} 中找到 {len(chat_files)} 个聊天历史文件")
+
+        for chat_file in chat_files:
+            try:
+                chat_id = get_chat_id_from_file(chat_file)
+                if chat_id is None or chat_id in user_chats:
+                    continue
+
+                # 批量加载不解压归档，避免把冷对话全部恢复为日志
+                chat_data, _ = self._load_chat(
+                    user_id, user_role, chat_id, restore=False, convert_legacy=convert_legacy
+                )
+                if isinstance(chat_data, dict) and "created_at" in chat_data:
+                    # 旧版文件可能缺少部分字段
+                    chat_data.setdefault("messages", [])
+                    chat_data.setdefault("user_id", user_id)
+                    chat_data.setdefault("user_role", user_role.value)
+                    chat_data.setdefault("last_updated", chat_data["created_at"])
+                    user_chats[chat_id] = chat_data
+                else:
+                    logger.warning(f"角色目录中聊天文件数据格式不正确: {chat_file}")
+            except Exception as file_error:
+                logger.error(f"加载角色目录中单个聊天文件失败 {chat_file}: {str(file_error)}")
+
+        logger.info(f"用户 {folder_name} 聊天历史从角色专属目录加载完成，共 {len(user_chats)} 条记录")
+        return user_chats
+
+    def _rebuild_chat_index(self, user_id: str, user_role: UserRole) -> Dict[str, Dict[str, Any]]:
+        """扫描用户全部聊天文件重建索引，仅在索引缺失或损坏时执行"""
+        user_dir = get_user_chat_directory(user_id, user_role)
+        folder_name = f"{user_role.value}_{user_id}"
+        logger.info(f"开始重建用户 {folder_name} 的聊天索引")
+
+        with get_chat_index_lock(user_dir):
+            # 等待锁期间其他进程可能已完成重建
+            index = load_chat_index(user_dir)
+            if index is not None:
+                return index
+
+            index = {}
+            for cid, data in self._load_user_chats(user_id, user_role).items():
+                chat_file = get_chat_file_path(user_id, user_role, cid)
+                archive_file = get_chat_archive_path(chat_file)
+                if chat_file.exists():
+                    index[cid] = build_chat_index_entry(cid, data, user_role, chat_file.stat().st_size)
+                elif archive_file.exists():
+                    index[cid] = build_chat_index_entry(
+                        cid, data, user_role, archive_file.stat().st_size, archived=True
+                    )
+                else:
+                    index[cid] = build_chat_index_entry(cid, data, user_role, 0)
+
+            save_chat_index(user_dir, index)
+        logger.info(f"用户 {folder_name} 的聊天索引重建完成，共 {len(index)} 条记录")
+        return index
+
+    @staticmethod
+    def _update_chat_index(user_id: str, user_role: UserRole, chat_id: str, chat_data: Dict[str, Any]) -> None:
+        chat_file = get_chat_file_path(user_id, user_role, chat_id)
+        size_bytes = chat_file.stat().st_size if chat_file.exists() else 0
+        entry = build_chat_index_entry(chat_id, chat_data, user_role, size_bytes)
+        upsert_chat_index_entry(chat_file.parent, entry)
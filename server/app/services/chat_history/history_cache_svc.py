@@ -0,0 +1,184 @@
+import sys
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from app.config import CHAT_CACHE_MAX_ENTRIES, CHAT_CACHE_MAX_BYTES, CHAT_CACHE_MAX_ENTRIES_PER_USER
+from app.core.logger import setup_logger
+
+logger = setup_logger("chat_service")
+
+# 每条消息与每个对话在字典结构上的额外开销估算值（字节）
+_MESSAGE_OVERHEAD_BYTES = 240
+_CHAT_OVERHEAD_BYTES = 600
+
+CacheEntryKey = Tuple[str, str]
+
+
+def estimate_chat_bytes(chat_data: Dict[str, Any]) -> int:
+    """估算单个对话在内存中占用的字节数"""
+    size = _CHAT_OVERHEAD_BYTES
+    for message in chat_data.get("messages", []):
+        size += _MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message.get("content", ""))
+    return size
+
+
+class ChatHistoryCache:
+    """
+    有界LRU聊天历史缓存
+
+    同时受全局条目数、估算字节数和单用户条目数限制，超出时淘汰最久未使用的对话；
+    正在生成回复的对话会被固定，不参与淘汰；每个条目记录其对应的存储版本号，用于发现其他进程的修改
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, max_entries_per_user: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entries_per_user = max_entries_per_user
+
+        # 全局LRU顺序：最久未使用的在前
+        self._entries: "OrderedDict[CacheEntryKey, Dict[str, Any]]" = OrderedDict()
+        # 每个用户自己的LRU顺序
+        self._user_entries: Dict[str, "OrderedDict[str, None]"] = {}
+        self._sizes: Dict[CacheEntryKey, int] = {}
+        self._pins: Dict[CacheEntryKey, int] = {}
+        self._versions: Dict[CacheEntryKey, Optional[str]] = {}
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, cache_key: str, chat_id: str) -> Optional[Dict[str, Any]]:
+        """读取对话并刷新其LRU位置，计入命中统计"""
+        key = (cache_key, chat_id)
+        chat_data = self._entries.get(key)
+        if chat_data is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touch(key)
+        return chat_data
+
+    def peek(self, cache_key: str, chat_id: str) -> Optional[Dict[str, Any]]:
+        """读取对话但不影响LRU顺序与统计，供写回等内部流程使用"""
+        return self._entries.get((cache_key, chat_id))
+
+    def put(self, cache_key: str, chat_id: str, chat_data: Dict[str, Any]) -> None:
+        """写入对话并按需淘汰"""
+        key = (cache_key, chat_id)
+        if key in self._entries:
+            self.total_bytes -= self._sizes[key]
+
+        self._entries[key] = chat_data
+        self._versions[key] = None
+        self._user_entries.setdefault(cache_key, OrderedDict())[chat_id] = None
+        self._sizes[key] = estimate_chat_bytes(chat_data)
+        self.total_bytes += self._sizes[key]
+
+        self._touch(key)
+        self._evict(cache_key)
+
+    def resize(self, cache_key: str, chat_id: str) -> None:
+        """对话内容变化后重新估算其占用并按需淘汰"""
+        key = (cache_key, chat_id)
+        chat_data = self._entries.get(key)
+        if chat_data is None:
+            return
+
+        new_size = estimate_chat_bytes(chat_data)
+        self.total_bytes += new_size - self._sizes[key]
+        self._sizes[key] = new_size
+        self._evict(cache_key)
+
+    def remove(self, cache_key: str, chat_id: str) -> None:
+        """移除对话"""
+        key = (cache_key, chat_id)
+        if key not in self._entries:
+            return
+
+        del self._entries[key]
+        self.total_bytes -= self._sizes.pop(key)
+        self._pins.pop(key, None)
+        self._versions.pop(key, None)
+
+        user_lru = self._user_entries.get(cache_key)
+        if user_lru is not None:
+            user_lru.pop(chat_id, None)
+            if not user_lru:
+                del self._user_entries[cache_key]
+
+    def get_version(self, cache_key: str, chat_id: str) -> Optional[str]:
+        """缓存条目对应的存储版本号，未知或已过期时为None"""
+        return self._versions.get((cache_key, chat_id))
+
+    def set_version(self, cache_key: str, chat_id: str, version: Optional[str]) -> None:
+        """记录缓存条目对应的存储版本号"""
+        key = (cache_key, chat_id)
+        if key in self._entries:
+            self._versions[key] = version
+
+    def pin(self, cache_key: str, chat_id: str) -> None:
+        """固定对话，使其在生成回复期间不被淘汰"""
+        key = (cache_key, chat_id)
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, cache_key: str, chat_id: str) -> None:
+        """解除固定并按需淘汰"""
+        key = (cache_key, chat_id)
+        count = self._pins.get(key, 0) - 1
+        if count > 0:
+            self._pins[key] = count
+        else:
+            self._pins.pop(key, None)
+        self._evict(cache_key)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "users": len(self._user_entries),
+            "pinned_entries": len(self._pins),
+            "total_bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "max_entries_per_user": self.max_entries_per_user,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _touch(self, key: CacheEntryKey) -> None:
+        self._entries.move_to_end(key)
+        self._user_entries[key[0]].move_to_end(key[1])
+
+    def _evict_one(self, key: CacheEntryKey) -> None:
+        self.remove(*key)
+        self.evictions += 1
+        logger.debug(f"聊天缓存淘汰对话: {key[0]}/chat_{key[1]}")
+
+    def _evict(self, cache_key: str) -> None:
+        # 先按单用户上限淘汰该用户最久未使用的对话
+        user_lru = self._user_entries.get(cache_key)
+        while user_lru and len(user_lru) > self.max_entries_per_user:
+            victim = next((cid for cid in user_lru if (cache_key, cid) not in self._pins), None)
+            if victim is None:
+                break
+            self._evict_one((cache_key, victim))
+
+        # 再按全局条目数与字节预算淘汰最久未使用的对话
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            victim = next((key for key in self._entries if key not in self._pins), None)
+            if victim is None:
+                break
+            self._evict_one(victim)
+
+
+# 全局聊天历史缓存
+chat_history_cache = ChatHistoryCache(
+    max_entries=CHAT_CACHE_MAX_ENTRIES,
+    max_bytes=CHAT_CACHE_MAX_BYTES,
+    max_entries_per_user=CHAT_CACHE_MAX_ENTRIES_PER_USER
+)
@@ -0,0 +1,190 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.config import CHAT_STORAGE_ENGINE
+from app.core.logger import setup_logger
+from app.models.user_common import UserRole
+
+logger = setup_logger("chat_service")
+
+
+def get_chat_preview(messages: List[Dict[str, str]]) -> str:
+    """获取聊天预览文本"""
+    if not messages:
+        return "新对话"
+
+    # 优先显示用户的第一条消息
+    for msg in messages:
+        if msg.get("role") == "user":
+            content = msg.get("content", "").strip()
+            if content:
+                return content[:50] + ("..." if len(content) > 50 else "")
+
+    # 如果没有用户消息，找第一条有内容的消息
+    for msg in messages:
+        content = msg.get("content", "").strip()
+        if content:
+            return content[:50] + ("..." if len(content) > 50 else "")
+
+    return "新对话"
+
+
+def count_valid_messages(messages: List[Dict[str, str]]) -> int:
+    """计算有效消息数量（排除空的AI回复）"""
+    valid_message_count = 0
+    for msg in messages:
+        if msg.get("role") == "user":
+            valid_message_count += 1
+        elif msg.get("role") == "assistant" and msg.get("content", "").strip():
+            valid_message_count += 1
+    return valid_message_count
+
+
+def build_chat_index_entry(
+        chat_id: str,
+        chat_data: Dict[str, Any],
+        user_role: UserRole,
+        size_bytes: int,
+        archived: bool = False
+) -> Dict[str, Any]:
+    """根据对话数据生成索引条目，archived 表示对话已压缩归档，size_bytes 为归档文件大小"""
+    messages = chat_data.get("messages", [])
+    return {
+        "chat_id": chat_id,
+        "created_at": chat_data.get("created_at", ""),
+        "last_updated": chat_data.get("last_updated", chat_data.get("created_at", "")),
+        "preview": get_chat_preview(messages),
+        "message_count": count_valid_messages(messages),
+        "user_role": chat_data.get("user_role", user_role.value),
+        "size_bytes": size_bytes,
+        "archived": archived
+    }
+
+
+def get_message_page_bounds(total: int, before: Optional[int], limit: int) -> Tuple[int, int]:
+    """
+    根据游标计算消息分页范围 [start, end)
+
+    before 为上一页第一条消息的序号，为空时从最新消息开始向前取 limit 条
+    """
+    end = total if before is None else max(min(before, total), 0)
+    return max(end - limit, 0), end
+
+
+def build_message_page(messages: List[Dict[str, Any]], start: int, total: int) -> Dict[str, Any]:
+    """组装消息分页结果，为每条消息标注其在对话中的序号"""
+    return {
+        "messages": [dict(msg, seq=start + offset) for offset, msg in enumerate(messages)],
+        "total": total,
+        "next_cursor": start if start > 0 else None
+    }
+
+
+class ChatStorageEngine(ABC):
+    """
+    聊天历史存储引擎接口
+
+    对话数据统一为 {"messages", "created_at", "last_updated", "user_id", "user_role", "context_summary"} 字典；
+    增量写入使用 chat_log_store_svc 中定义的记录格式（msg/delta/set/patch/summary）
+
+    多个服务进程共享同一份存储时，每次写入都会改变对话的版本号；进程内缓存记录自己看到的版本，
+    与存储中的版本不一致即说明对话已被其他进程修改
+    """
+
+    name = ""
+    # 生成回复期间是否由写回任务定期写入增量记录；写入增量需要重写整条消息的引擎设为False，
+    # 回复只在结束时写入一次，避免长回复的写入量随长度平方增长
+    write_deltas_while_streaming = True
+
+    @abstractmethod
+    async def load_chat(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """加载单个对话，返回 (对话数据, 版本号)；不存在时均为None"""
+
+    @abstractmethod
+    async def get_chat_version(self, user_id: str, user_role: UserRole, chat_id: str) -> Optional[str]:
+        """获取对话当前的版本号，不存在时返回None"""
+
+    @abstractmethod
+    async def save_chat(self, user_id: str, user_role: UserRole, chat_id: str, chat_data: Dict[str, Any]) -> str:
+        """写入对话的完整数据，覆盖已有内容，返回写入后的版本号"""
+
+    @abstractmethod
+    async def append_records(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            records: List[Dict[str, Any]],
+            chat_data: Optional[Dict[str, Any]] = None,
+            expected_version: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        向对话追加增量记录
+
+        chat_data 为缓存中的最新完整数据，对话尚未落盘或需要整理存储时使用；
+        expected_version 为缓存对应的版本号，与存储中的版本不一致时不会用 chat_data 覆盖存储
+
+        返回:
+            写入前版本与 expected_version 一致时返回写入后的版本号，否则返回None，表示缓存已过期
+        """
+
+    @abstractmethod
+    async def get_message_range(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            before: Optional[int],
+            limit: int
+    ) -> Optional[Dict[str, Any]]:
+        """
+        读取对话中序号小于 before 的最近 limit 条消息（见 build_message_page），对话不存在时返回None
+
+        只读取目标范围内的消息，不加载整个对话
+        """
+
+    @abstractmethod
+    async def load_user_chats(self, user_id: str, user_role: UserRole) -> Dict[str, Dict[str, Any]]:
+        """加载用户的全部对话，以chat_id为键"""
+
+    @abstractmethod
+    async def get_chat_index(self, user_id: str, user_role: UserRole) -> Dict[str, Dict[str, Any]]:
+        """获取用户全部对话的列表条目（见 build_chat_index_entry），不加载消息内容"""
+
+    @abstractmethod
+    async def update_chat_index(
+            self,
+            user_id: str,
+            user_role: UserRole,
+            chat_id: str,
+            chat_data: Dict[str, Any]
+    ) -> None:
+        """对话写入后同步更新其列表条目"""
+
+    @abstractmethod
+    def get_storage_location(self, user_id: str, user_role: UserRole) -> str:
+        """用户聊天数据的存储位置描述，用于存储信息展示"""
+
+
+_engine: Optional[ChatStorageEngine] = None
+
+
+def get_chat_storage_engine() -> ChatStorageEngine:
+    """按 CHAT_STORAGE_ENGINE 配置获取聊天存储引擎"""
+    global _engine
+    if _engine is None:
+        if CHAT_STORAGE_ENGINE == "database":
+            from app.services.chat_history.db_storage_engine_svc import DatabaseChatStorageEngine
+            _engine = DatabaseChatStorageEngine()
+        else:
+            if CHAT_STORAGE_ENGINE != "filesystem":
+                logger.warning(f"未知的聊天存储引擎 {CHAT_STORAGE_ENGINE}，使用文件存储")
+            from app.services.chat_history.fs_storage_engine_svc import FileSystemChatStorageEngine
+            _engine = FileSystemChatStorageEngine()
+        logger.info(f"聊天存储引擎: {_engine.name}")
+    return _engine
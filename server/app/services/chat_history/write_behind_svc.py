@@ -0,0 +1,91 @@
+import asyncio
+from contextlib import suppress
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.config import CHAT_FLUSH_INTERVAL_SECONDS, CHAT_FLUSH_MAX_PENDING_BYTES
+from app.core.logger import setup_logger
+
+logger = setup_logger("chat_service")
+
+
+class ChatWriteBehindFlusher:
+    """
+    聊天记录写回缓冲器
+
+    流式循环只登记待写入的对话，由后台任务按时间间隔或待写入数据量批量落盘，
+    数据丢失窗口不超过一个刷新间隔
+    """
+
+    def __init__(self, interval: float, max_pending_bytes: int):
+        self.interval = interval
+        self.max_pending_bytes = max_pending_bytes
+        # 每个对话只保留最新一次登记的写入操作及其待写入字节数
+        self._pending: Dict[Hashable, Tuple[Callable[[], Awaitable[None]], int]] = {}
+        self._pending_bytes = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self, key: Hashable, flush_fn: Callable[[], Awaitable[None]], pending_bytes: int = 0) -> None:
+        """登记对话的待写入操作（返回协程的可调用对象），不做任何I/O"""
+        previous = self._pending.get(key)
+        if previous:
+            self._pending_bytes -= previous[1]
+
+        self._pending[key] = (flush_fn, pending_bytes)
+        self._pending_bytes += pending_bytes
+
+        if self._pending_bytes >= self.max_pending_bytes:
+            self._wakeup.set()
+
+    async def flush(self, keys: Optional[Iterable[Hashable]] = None) -> None:
+        """执行指定（默认全部）对话的待写入操作，不同对话的写入并发进行"""
+        async with self._flush_lock:
+            if keys is None:
+                batch = list(self._pending.values())
+                self._pending.clear()
+                self._pending_bytes = 0
+            else:
+                batch = []
+                for key in keys:
+                    item = self._pending.pop(key, None)
+                    if item:
+                        batch.append(item)
+                        self._pending_bytes -= item[1]
+
+            if batch:
+                results = await asyncio.gather(*(flush_fn() for flush_fn, _ in batch), return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        logger.error(f"聊天记录批量落盘失败: {str(result)}")
+
+    async def _run(self) -> None:
+        while True:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        """启动后台刷新任务，需在事件循环中调用"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"聊天记录写回任务已启动: 刷新间隔={self.interval}s, 数据量阈值={self.max_pending_bytes}B")
+
+    async def stop(self) -> None:
+        """停止后台任务并落盘全部剩余数据"""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+        await self.flush()
+        logger.info("聊天记录写回任务已停止，剩余数据已落盘")
+
+
+# 全局聊天记录写回缓冲器
+chat_write_behind = ChatWriteBehindFlusher(
+    interval=CHAT_FLUSH_INTERVAL_SECONDS,
+    max_pending_bytes=CHAT_FLUSH_MAX_PENDING_BYTES
+)
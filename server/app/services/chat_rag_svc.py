@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.config import (
+    CHAT_RAG_TOP_K, CHAT_RAG_TOKEN_BUDGET, CHAT_RAG_CACHE_TTL_SECONDS, CHAT_RAG_CACHE_MAX_ENTRIES
+)
+from app.core.logger import setup_logger
+from app.services.chat_context_svc import estimate_tokens
+
+logger = setup_logger("chat_service")
+
+RetrievalKey = Tuple[str, Tuple[str, ...], str]
+
+
+class RetrievalCache:
+    """
+    文档检索结果缓存
+
+    以 (文档归属, 文档ID集合, 问题) 为键缓存检索到的片段；同一轮提问重新生成回答时直接复用，
+    不再重复计算问题向量与查询向量库。条目超过TTL后失效，超出容量时淘汰最久未使用的条目
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[RetrievalKey, Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: RetrievalKey) -> Optional[List[Dict[str, str]]]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: RetrievalKey, chunks: List[Dict[str, str]]) -> None:
+        self._entries[key] = (time.monotonic(), chunks)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# 全局文档检索缓存
+chat_retrieval_cache = RetrievalCache(
+    ttl_seconds=CHAT_RAG_CACHE_TTL_SECONDS,
+    max_entries=CHAT_RAG_CACHE_MAX_ENTRIES
+)
+
+
+async def _retrieve_chunks(owner_id: str, document_ids: List[str], query: str) -> List[Dict[str, str]]:
+    """
+    从多个文档中检索相关片段
+
+    每个文档各取 top-k，按排名交替合并并去重，使每个文档的最相关片段都排在前面
+    """
+    # 延迟导入：向量库与嵌入模型加载较慢，只在文档问答时才需要
+    from app.services.doc_vector.document_vectorization_svc import retrieve_document_context, get_document_info
+
+    # 只检索属于当前用户的文档
+    infos = await asyncio.gather(*(get_document_info(owner_id, doc_id) for doc_id in document_ids))
+    documents = [info for info in infos if info]
+    if len(documents) < len(document_ids):
+        logger.warning(f"忽略不存在或无权访问的文档: 用户={owner_id}, "
+                       f"请求{len(document_ids)}个, 有效{len(documents)}个")
+    if not documents:
+        return []
+
+    results = await asyncio.gather(*(
+        retrieve_document_context(owner_id, doc["document_id"], query, n_results=CHAT_RAG_TOP_K)
+        for doc in documents
+    ))
+
+    chunks = []
+    seen = set()
+    for rank in range(max((len(contexts) for contexts in results), default=0)):
+        for doc, contexts in zip(documents, results):
+            if rank < len(contexts) and contexts[rank] not in seen:
+                seen.add(contexts[rank])
+                chunks.append({"title": doc.get("title", ""), "content": contexts[rank]})
+    return chunks
+
+
+async def retrieve_chat_references(owner_id: str, document_ids: List[str], query: str) -> List[Dict[str, str]]:
+    """检索问题相关的文档片段，同一问题在缓存有效期内只检索一次"""
+    key = (owner_id, tuple(sorted(set(document_ids))), query.strip())
+
+    chunks = chat_retrieval_cache.get(key)
+    if chunks is not None:
+        logger.info(f"文档检索命中缓存: 用户={owner_id}, 片段数={len(chunks)}")
+        return chunks
+
+    chunks = await _retrieve_chunks(owner_id, list(key[1]), query)
+    # 检索失败或无结果时不缓存，重新生成回答时再次尝试
+    if chunks:
+        chat_retrieval_cache.put(key, chunks)
+    logger.info(f"文档检索完成: 用户={owner_id}, 文档数={len(key[1])}, 片段数={len(chunks)}")
+    return chunks
+
+
+def build_reference_context(chunks: List[Dict[str, str]], token_budget: int = CHAT_RAG_TOKEN_BUDGET) -> Optional[str]:
+    """把检索到的片段按相关度顺序拼接为参考资料，超出token预算的片段被丢弃"""
+    parts = []
+    used_tokens = 0
+    for index, chunk in enumerate(chunks, start=1):
+        part = f"[资料{index}]《{chunk['title']}》\n{chunk['content']}"
+        cost = estimate_tokens(part)
+        if used_tokens + cost > token_budget:
+            break
+        parts.append(part)
+        used_tokens += cost
+
+    if not parts:
+        return None
+
+    return (
+        "以下是用户所选文档中与问题相关的内容，请优先依据这些资料回答；"
+        "资料未涉及的内容可以结合自身知识补充，并说明哪些内容来自资料：\n\n" + "\n\n".join(parts)
+    )
@@ -1,48 +1,47 @@
+import asyncio
+import time
 import uuid
-import json
 from datetime import datetime
-from typing import List, Dict, Any, Optional, AsyncGenerator
-from pathlib import Path
+from functools import partial
+from typing import List, Dict, Any, Optional, AsyncGenerator, Tuple, Callable, Awaitable
 
-from openai import OpenAI
-
-from app.config import DEEPSEEK_API_KEY, MEDIA_ROOT
+from app.config import CHAT_DISCONNECT_CHECK_INTERVAL_SECONDS, CHAT_ANSWER_CACHE_REPLAY_CHUNK_CHARS
+from app.core.llm_gateway import llm_gateway
+from app.core.llm_metrics import llm_metrics
+from app.core.llm_scheduler import llm_scheduler, LLMPriority
 from app.core.logger import setup_logger
 from app.models.user_common import UserRole
 from app.schemas.chat_sch import (
     ChatMessage, ChatRequest, ChatStreamResponse, ChatMessageRole
 )
+from app.services.chat_history.chat_log_store_svc import (
+    build_message_record, build_delta_record, build_set_record, build_summary_record, build_patch_record
+)
+from app.services.chat_history.chat_search_svc import index_chat_messages, search_chat_messages
+from app.services.chat_history.history_cache_svc import chat_history_cache
+from app.services.chat_history.storage_engine_svc import (
+    get_chat_storage_engine, get_message_page_bounds, build_message_page
+)
+from app.services.chat_history.write_behind_svc import chat_write_behind
+from app.services.chat_answer_cache_svc import semantic_answer_cache
+from app.services.chat_rag_svc import retrieve_chat_references, build_reference_context
+from app.services.chat_context_svc import build_chat_context, strip_context_state
 
 # 设置日志
 logger = setup_logger("chat_service")
 
-# 聊天历史存储根目录
-CHAT_HISTORY_ROOT_DIR = MEDIA_ROOT / "chat_history"
-CHAT_HISTORY_ROOT_DIR.mkdir(exist_ok=True, parents=True)
-
-# 创建 API 客户端
-client = OpenAI(
-    api_key=DEEPSEEK_API_KEY,
-    base_url="https://api.deepseek.com"
-)
-
-# 内存缓存聊天历史
-chat_history_cache = {}
+# 正在生成的AI回复已落盘的内容，用于计算增量记录
+_persisted_responses: Dict[Tuple[str, str], str] = {}
 
-
-def get_user_chat_directory(user_id: str, user_role: UserRole) -> Path:
-    """根据用户角色和ID创建用户专属的聊天历史目录"""
-    # 根据角色和用户ID创建目录名：如 student_1, teacher_2, admin_3
-    folder_name = f"{user_role.value}_{user_id}"
-    user_dir = CHAT_HISTORY_ROOT_DIR / folder_name
-    user_dir.mkdir(exist_ok=True, parents=True)
-    return user_dir
+# 请求被取消后仍需完成的收尾任务（关闭上游连接、落盘），保留引用防止被回收
+_background_tasks = set()
 
 
-def get_chat_file_path(user_id: str, user_role: UserRole, chat_id: str) -> Path:
-    """获取指定用户角色、用户ID和聊天ID的文件路径"""
-    user_dir = get_user_chat_directory(user_id, user_role)
-    return user_dir / f"chat_{chat_id}.json"
+def _run_in_background(coro) -> None:
+    """在独立任务中执行协程，不受当前请求取消的影响"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 
 def get_user_cache_key(user_id: str, user_role: UserRole) -> str:
@@ -62,150 +61,190 @@ def get_system_prompt(user_role: UserRole) -> str:
         return base_prompt + "你将提供全面的教育服务支持。"
 
 
-def save_chat_to_file(user_id: str, user_role: UserRole, chat_id: str, chat_data: Dict[str, Any]) -> None:
-    """保存聊天数据到用户角色专属文件夹"""
+async def save_chat_to_storage(user_id: str, user_role: UserRole, chat_id: str, chat_data: Dict[str, Any]) -> None:
+    """将完整聊天数据写入存储引擎（仅用于创建对话），并记录缓存对应的版本"""
     try:
-        chat_file = get_chat_file_path(user_id, user_role, chat_id)
+        version = await get_chat_storage_engine().save_chat(user_id, user_role, chat_id, chat_data)
+        chat_history_cache.set_version(get_user_cache_key(user_id, user_role), chat_id, version)
+    except Exception as e:
+        logger.error(f"保存聊天历史失败: {str(e)}")
+
 
-        # 确保目录存在
-        chat_file.parent.mkdir(exist_ok=True, parents=True)
+async def append_records_to_storage(
+        user_id: str,
+        user_role: UserRole,
+        chat_id: str,
+        records: List[Dict[str, Any]],
+        snapshot: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    向存储引擎追加记录
 
-        with open(chat_file, "w", encoding="utf-8") as f:
-            json.dump(chat_data, f, ensure_ascii=False, indent=2)
+    snapshot 为与本次写入后存储状态一致的完整数据，供引擎在对话未落盘或整理存储时使用，
+    默认取缓存中的数据；写入后更新缓存对应的版本，发现其他进程修改过该对话时将缓存标记为过期
+    """
+    cache_key = get_user_cache_key(user_id, user_role)
+    if snapshot is None:
+        snapshot = chat_history_cache.peek(cache_key, chat_id)
 
-        folder_name = f"{user_role.value}_{user_id}"
-        logger.debug(f"聊天记录已保存到角色文件夹: {folder_name}/chat_{chat_id}.json")
+    try:
+        version = await get_chat_storage_engine().append_records(
+            user_id, user_role, chat_id, records, snapshot,
+            expected_version=chat_history_cache.get_version(cache_key, chat_id)
+        )
+        chat_history_cache.set_version(cache_key, chat_id, version)
     except Exception as e:
-        logger.error(f"保存聊天历史到文件失败: {str(e)}")
+        logger.error(f"追加聊天记录失败: {str(e)}")
 
 
-def load_chat_history_from_file(user_id: str, user_role: UserRole, chat_id: str) -> Optional[Dict[str, Any]]:
-    """从用户角色专属文件夹加载聊天历史"""
+async def load_chat_history_from_storage(
+        user_id: str,
+        user_role: UserRole,
+        chat_id: str
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """从存储引擎加载聊天历史，返回 (对话数据, 版本号)"""
     try:
-        chat_file = get_chat_file_path(user_id, user_role, chat_id)
-        if chat_file.exists():
-            with open(chat_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                logger.debug(f"从角色文件夹加载聊天记录: {user_role.value}_{user_id}/chat_{chat_id}.json")
-                return data
+        return await get_chat_storage_engine().load_chat(user_id, user_role, chat_id)
     except Exception as e:
-        logger.error(f"从文件加载聊天历史失败: {str(e)}")
-    return None
+        logger.error(f"加载聊天历史失败: {str(e)}")
+    return None, None
 
 
-def get_chat_messages_history(user_id: str, user_role: UserRole, chat_id: str) -> List[Dict[str, str]]:
-    """获取指定对话的历史消息"""
+async def get_cached_chat(user_id: str, user_role: UserRole, chat_id: str) -> Optional[Dict[str, Any]]:
+    """
+    优先从缓存获取对话，未命中或已被其他进程修改时从存储加载并放入缓存
+
+    正在本进程中生成回复的对话以缓存为准，不做版本校验
+    """
     cache_key = get_user_cache_key(user_id, user_role)
 
-    # 先从缓存中查找
-    if cache_key in chat_history_cache and chat_id in chat_history_cache[cache_key]:
-        return chat_history_cache[cache_key][chat_id].get("messages", [])
+    chat_data = chat_history_cache.get(cache_key, chat_id)
+    if chat_data is not None:
+        if (cache_key, chat_id) in _persisted_responses:
+            return chat_data
+
+        version = chat_history_cache.get_version(cache_key, chat_id)
+        current_version = await get_chat_storage_engine().get_chat_version(user_id, user_role, chat_id)
+        if version is not None and version == current_version:
+            return chat_data
+        logger.info(f"缓存中的对话已被其他进程修改，重新加载: {cache_key}/chat_{chat_id}")
+
+    chat_data, version = await load_chat_history_from_storage(user_id, user_role, chat_id)
+    if chat_data:
+        # 加载期间其他请求可能已在本进程开始生成回复，以缓存中的数据为准
+        if (cache_key, chat_id) in _persisted_responses:
+            cached = chat_history_cache.peek(cache_key, chat_id)
+            if cached is not None:
+                return cached
+        chat_history_cache.put(cache_key, chat_id, chat_data)
+        chat_history_cache.set_version(cache_key, chat_id, version)
+        return chat_data
+
+    return None
 
-    # 从文件中加载
-    history_data = load_chat_history_from_file(user_id, user_role, chat_id)
-    if history_data:
-        # 加载到缓存
-        if cache_key not in chat_history_cache:
-            chat_history_cache[cache_key] = {}
-        chat_history_cache[cache_key][chat_id] = history_data
-        return history_data.get("messages", [])
 
-    return []
+async def get_chat_messages_history(user_id: str, user_role: UserRole, chat_id: str) -> List[Dict[str, str]]:
+    """获取指定对话的历史消息"""
+    chat_data = await get_cached_chat(user_id, user_role, chat_id)
+    return chat_data.get("messages", []) if chat_data else []
 
 
-def create_initial_chat_history(
+async def create_initial_chat_history(
         chat_id: str,
         user_id: str,
         user_role: UserRole,
         user_messages: List[ChatMessage]
 ) -> None:
-    """在用户角色专属文件夹中创建初始聊天历史记录"""
+    """创建初始聊天历史记录"""
     cache_key = get_user_cache_key(user_id, user_role)
 
-    if cache_key not in chat_history_cache:
-        chat_history_cache[cache_key] = {}
-
     # 创建初始历史记录
     chat_data = {
-        "messages": [msg.model_dump() for msg in user_messages],
+        "messages": [msg.model_dump(mode="json") for msg in user_messages],
         "created_at": datetime.now().isoformat(),
         "user_id": user_id,
         "user_role": user_role.value,  # 保存用户角色信息
         "last_updated": datetime.now().isoformat()
     }
 
-    chat_history_cache[cache_key][chat_id] = chat_data
+    chat_history_cache.put(cache_key, chat_id, chat_data)
 
-    # 立即保存到用户角色专属文件夹
-    save_chat_to_file(user_id, user_role, chat_id, chat_data)
+    # 立即保存
+    await save_chat_to_storage(user_id, user_role, chat_id, chat_data)
+    await update_chat_index(user_id, user_role, chat_id, chat_data)
+    _run_in_background(index_chat_messages(user_id, user_role, chat_id, 0, list(chat_data["messages"])))
 
-    folder_name = f"{user_role.value}_{user_id}"
-    logger.info(f"初始聊天历史已创建并保存到角色目录: {folder_name}/chat_{chat_id}.json")
+    logger.info(f"初始聊天历史已创建并保存: {cache_key}/chat_{chat_id}")
 
 
-def append_user_messages_to_history(
+async def append_user_messages_to_history(
         chat_id: str,
         user_id: str,
         user_role: UserRole,
         user_messages: List[ChatMessage]
 ) -> None:
-    """向用户角色专属文件夹的聊天历史追加用户消息"""
+    """向聊天历史追加用户消息"""
     cache_key = get_user_cache_key(user_id, user_role)
 
-    if cache_key not in chat_history_cache:
-        chat_history_cache[cache_key] = {}
-
-    if chat_id not in chat_history_cache[cache_key]:
-        history_data = load_chat_history_from_file(user_id, user_role, chat_id)
-        if history_data:
-            chat_history_cache[cache_key][chat_id] = history_data
-        else:
-            chat_history_cache[cache_key][chat_id] = {
-                "messages": [],
-                "created_at": datetime.now().isoformat(),
-                "user_id": user_id,
-                "user_role": user_role.value,
-                "last_updated": datetime.now().isoformat()
-            }
+    chat_data = await get_cached_chat(user_id, user_role, chat_id)
+    if chat_data is None:
+        chat_data = {
+            "messages": [],
+            "created_at": datetime.now().isoformat(),
+            "user_id": user_id,
+            "user_role": user_role.value,
+            "last_updated": datetime.now().isoformat()
+        }
+        chat_history_cache.put(cache_key, chat_id, chat_data)
 
     # 追加用户消息
-    new_user_messages = [msg.model_dump() for msg in user_messages]
-    chat_history_cache[cache_key][chat_id]["messages"].extend(new_user_messages)
+    new_user_messages = [msg.model_dump(mode="json") for msg in user_messages]
+    start_seq = len(chat_data["messages"])
+    chat_data["messages"].extend(new_user_messages)
 
     # 更新最后修改时间
-    chat_history_cache[cache_key][chat_id]["last_updated"] = datetime.now().isoformat()
+    chat_data["last_updated"] = datetime.now().isoformat()
+    chat_history_cache.resize(cache_key, chat_id)
 
-    # 立即保存到用户角色专属文件夹
-    save_chat_to_file(user_id, user_role, chat_id, chat_history_cache[cache_key][chat_id])
+    # 立即以追加记录的方式写入
+    await append_records_to_storage(
+        user_id, user_role, chat_id,
+        [build_message_record(msg) for msg in new_user_messages]
+    )
+    await update_chat_index(user_id, user_role, chat_id, chat_data)
+    _run_in_background(index_chat_messages(user_id, user_role, chat_id, start_seq, new_user_messages))
 
-    folder_name = f"{user_role.value}_{user_id}"
-    logger.info(f"用户消息已追加并保存到角色目录: {folder_name}/chat_{chat_id}.json")
+    logger.info(f"用户消息已追加并保存: {cache_key}/chat_{chat_id}")
 
 
-def initialize_assistant_response_in_history(
+async def initialize_assistant_response_in_history(
         chat_id: str,
         user_id: str,
         user_role: UserRole
 ) -> None:
-    """在用户角色专属历史记录中初始化AI回复位置"""
+    """在历史记录中初始化AI回复位置"""
     cache_key = get_user_cache_key(user_id, user_role)
+    chat_data = chat_history_cache.peek(cache_key, chat_id)
 
-    if cache_key in chat_history_cache and chat_id in chat_history_cache[cache_key]:
+    if chat_data is not None:
         # 添加空的AI回复作为占位符
         empty_assistant_message = {
             "role": "assistant",
             "content": ""
         }
-        chat_history_cache[cache_key][chat_id]["messages"].append(empty_assistant_message)
+        chat_data["messages"].append(empty_assistant_message)
 
         # 更新最后修改时间
-        chat_history_cache[cache_key][chat_id]["last_updated"] = datetime.now().isoformat()
+        chat_data["last_updated"] = datetime.now().isoformat()
 
-        # 立即保存到用户角色专属文件夹
-        save_chat_to_file(user_id, user_role, chat_id, chat_history_cache[cache_key][chat_id])
+        # 立即以追加记录的方式写入
+        _persisted_responses[(cache_key, chat_id)] = ""
+        await append_records_to_storage(
+            user_id, user_role, chat_id,
+            [build_message_record(empty_assistant_message)]
+        )
 
-        folder_name = f"{user_role.value}_{user_id}"
-        logger.info(f"AI回复位置已在角色目录中初始化: {folder_name}/chat_{chat_id}.json")
+        logger.info(f"AI回复位置已初始化: {cache_key}/chat_{chat_id}")
 
 
 def update_assistant_response_in_history(
@@ -213,276 +252,338 @@ def update_assistant_response_in_history(
         user_id: str,
         user_role: UserRole,
         content: str,
-        force_save: bool = False
+        truncated: bool = False,
+        final: bool = False
 ) -> None:
-    """实时更新用户角色专属文件夹中的AI回复内容"""
+    """
+    实时更新缓存中的AI回复内容，并登记由后台任务写回存储
+
+    存储引擎不适合在生成过程中写入增量时，只更新缓存，final 为True（回复结束）时才登记写入
+    """
     cache_key = get_user_cache_key(user_id, user_role)
+    chat_data = chat_history_cache.peek(cache_key, chat_id)
 
-    if cache_key in chat_history_cache and chat_id in chat_history_cache[cache_key]:
-        messages = chat_history_cache[cache_key][chat_id]["messages"]
+    if chat_data is not None:
+        messages = chat_data["messages"]
 
         # 找到最后一条AI回复消息并更新
         for i in reversed(range(len(messages))):
             if messages[i].get("role") == "assistant":
                 messages[i]["content"] = content
+                if truncated:
+                    messages[i]["truncated"] = True
                 break
 
         # 更新最后修改时间
-        chat_history_cache[cache_key][chat_id]["last_updated"] = datetime.now().isoformat()
-
-        # 根据内容长度或强制保存标志决定是否写入文件
-        # 每100个字符保存一次，或者强制保存
-        if force_save or len(content) % 100 < 10:
-            save_chat_to_file(user_id, user_role, chat_id, chat_history_cache[cache_key][chat_id])
-            folder_name = f"{user_role.value}_{user_id}"
-            logger.debug(
-                f"AI回复已实时更新并保存到角色目录: {folder_name}/chat_{chat_id}.json, 内容长度={len(content)}")
-
-
-def load_user_chat_histories(user_id: str, user_role: UserRole) -> None:
-    """从用户角色专属文件夹加载所有聊天历史到缓存"""
-    try:
-        cache_key = get_user_cache_key(user_id, user_role)
-
-        # 确保用户在缓存中有记录
-        if cache_key not in chat_history_cache:
-            chat_history_cache[cache_key] = {}
-
-        # 获取用户角色专属目录
-        user_dir = get_user_chat_directory(user_id, user_role)
-
-        # 查找用户目录下的所有聊天文件
-        pattern = "chat_*.json"
-        chat_files = list(user_dir.glob(pattern))
-
-        folder_name = f"{user_role.value}_{user_id}"
-        logger.info(f"在角色目录 {folder_name} 中找到 {len(chat_files)} 个聊天历史文件")
-
-        # 重置用户的聊天缓存，重新加载所有文件
-        chat_history_cache[cache_key] = {}
-
-        for chat_file in chat_files:
-            try:
-                # 从文件名提取chat_id (去掉 "chat_" 前缀和 ".json" 后缀)
-                filename = chat_file.stem
-                if filename.startswith("chat_"):
-                    chat_id = filename[5:]  # 去掉 "chat_" 前缀
-
-                    with open(chat_file, "r", encoding="utf-8") as f:
-                        chat_data = json.load(f)
-
-                    # 验证数据有效性
-                    if isinstance(chat_data, dict) and "created_at" in chat_data:
-                        # 确保messages字段存在
-                        if "messages" not in chat_data:
-                            chat_data["messages"] = []
+        chat_data["last_updated"] = datetime.now().isoformat()
+
+        if not final and not get_chat_storage_engine().write_deltas_while_streaming:
+            return
+
+        # 不在流式循环中写存储，只登记待写入内容，由写回任务批量追加
+        key = (cache_key, chat_id)
+        pending_bytes = max(len(content) - len(_persisted_responses.get(key, "")), 0)
+        chat_write_behind.mark_dirty(
+            key,
+            partial(_persist_assistant_response, chat_id, user_id, user_role, content, truncated),
+            pending_bytes
+        )
 
-                        # 确保有用户ID和角色信息
-                        if "user_id" not in chat_data:
-                            chat_data["user_id"] = user_id
-                        if "user_role" not in chat_data:
-                            chat_data["user_role"] = user_role.value
 
-                        # 确保有最后更新时间
-                        if "last_updated" not in chat_data:
-                            chat_data["last_updated"] = chat_data.get("created_at", datetime.now().isoformat())
+async def _persist_assistant_response(
+        chat_id: str,
+        user_id: str,
+        user_role: UserRole,
+        content: str,
+        truncated: bool = False
+) -> None:
+    """将AI回复相对上次落盘内容的变化以增量记录追加到存储"""
+    key = (get_user_cache_key(user_id, user_role), chat_id)
+    persisted = _persisted_responses.get(key, "")
+
+    records = []
+    # 正常流式输出只追加新文本；内容被替换（如错误信息）时写入覆盖记录
+    if content != persisted:
+        if content.startswith(persisted):
+            records.append(build_delta_record(content[len(persisted):]))
+        else:
+            records.append(build_set_record(content))
+    if truncated:
+        records.append(build_patch_record({"truncated": True}))
+
+    await append_records_to_storage(
+        user_id, user_role, chat_id, records,
+        snapshot=_build_persisted_snapshot(key, content, truncated)
+    )
+    _persisted_responses[key] = content
+
+
+def _build_persisted_snapshot(key: Tuple[str, str], content: str, truncated: bool) -> Optional[Dict[str, Any]]:
+    """
+    构造与本次写入后存储内容一致的对话快照
+
+    流式生成过程中缓存里的回复可能已超出本次写入的内容，直接用缓存压缩日志会导致后续增量重复
+    """
+    chat_data = chat_history_cache.peek(*key)
+    if chat_data is None:
+        return None
+
+    messages = list(chat_data["messages"])
+    for i in reversed(range(len(messages))):
+        if messages[i].get("role") == "assistant":
+            messages[i] = dict(messages[i], content=content)
+            if truncated:
+                messages[i]["truncated"] = True
+            break
+    return dict(chat_data, messages=messages)
+
+
+async def finalize_assistant_response_in_history(
+        chat_id: str,
+        user_id: str,
+        user_role: UserRole,
+        content: str,
+        truncated: bool = False
+) -> None:
+    """AI回复结束：立即落盘尚未写入的内容并释放增量跟踪状态；客户端中途断开时标记为截断"""
+    update_assistant_response_in_history(chat_id, user_id, user_role, content, truncated, final=True)
 
-                        chat_history_cache[cache_key][chat_id] = chat_data
-                        logger.debug(
-                            f"成功从角色目录加载聊天记录: {folder_name}/chat_{chat_id}.json, 消息数: {len(chat_data.get('messages', []))}")
-                    else:
-                        logger.warning(f"角色目录中聊天文件数据格式不正确: {chat_file}")
+    cache_key = get_user_cache_key(user_id, user_role)
+    key = (cache_key, chat_id)
+    await chat_write_behind.flush([key])
+    _persisted_responses.pop(key, None)
+    chat_history_cache.resize(cache_key, chat_id)
+
+    chat_data = chat_history_cache.peek(cache_key, chat_id)
+    if chat_data is not None:
+        await update_chat_index(user_id, user_role, chat_id, chat_data)
+
+        # 回复完整后再写入检索索引，流式生成过程中不索引
+        messages = chat_data["messages"]
+        for seq in reversed(range(len(messages))):
+            if messages[seq].get("role") == "assistant":
+                _run_in_background(index_chat_messages(user_id, user_role, chat_id, seq, [dict(messages[seq])]))
+                break
 
-            except Exception as file_error:
-                logger.error(f"加载角色目录中单个聊天文件失败 {chat_file}: {str(file_error)}")
-                continue
+    logger.debug(f"AI回复已写入: {cache_key}/chat_{chat_id}, 内容长度={len(content)}")
 
-        logger.info(
-            f"用户 {folder_name} 聊天历史从角色专属目录加载完成，共 {len(chat_history_cache.get(cache_key, {}))} 条记录")
 
+async def update_chat_index(user_id: str, user_role: UserRole, chat_id: str, chat_data: Dict[str, Any]) -> None:
+    """对话写入后同步更新用户聊天列表中的对应条目"""
+    try:
+        await get_chat_storage_engine().update_chat_index(user_id, user_role, chat_id, chat_data)
     except Exception as e:
-        logger.error(f"从用户角色专属目录加载聊天历史失败: {str(e)}")
-
+        logger.error(f"更新聊天索引失败: {str(e)}")
 
-def get_chat_preview(messages: List[Dict[str, str]]) -> str:
-    """获取聊天预览文本"""
-    if not messages:
-        return "新对话"
 
-    # 优先显示用户的第一条消息
-    for msg in messages:
-        if msg.get("role") == "user":
-            content = msg.get("content", "").strip()
-            if content:
-                return content[:50] + ("..." if len(content) > 50 else "")
-
-    # 如果没有用户消息，找第一条有内容的消息
-    for msg in messages:
-        content = msg.get("content", "").strip()
-        if content:
-            return content[:50] + ("..." if len(content) > 50 else "")
-
-    return "新对话"
-
-
-def get_user_storage_info(user_id: str, user_role: UserRole) -> Dict[str, Any]:
-    """获取用户角色存储信息统计"""
+def get_user_storage_info(
+        user_id: str,
+        user_role: UserRole,
+        chat_index: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """根据聊天索引汇总用户角色存储信息，分别统计活跃对话（hot）与已压缩归档对话（cold）的占用"""
+    folder_name = f"{user_role.value}_{user_id}"
     try:
-        user_dir = get_user_chat_directory(user_id, user_role)
-        chat_files = list(user_dir.glob("chat_*.json"))
-
-        total_size = sum(f.stat().st_size for f in chat_files if f.exists())
-        folder_name = f"{user_role.value}_{user_id}"
-
+        hot_size = sum(entry.get("size_bytes", 0) for entry in chat_index.values() if not entry.get("archived"))
+        cold_size = sum(entry.get("size_bytes", 0) for entry in chat_index.values() if entry.get("archived"))
+        total_size = hot_size + cold_size
         return {
             "user_id": user_id,
             "user_role": user_role.value,
             "folder_name": folder_name,
-            "chat_count": len(chat_files),
-            "storage_path": str(user_dir),
+            "chat_count": len(chat_index),
+            "archived_chat_count": sum(1 for entry in chat_index.values() if entry.get("archived")),
+            "storage_path": get_chat_storage_engine().get_storage_location(user_id, user_role),
             "total_size_bytes": total_size,
-            "total_size_mb": round(total_size / 1024 / 1024, 2)
+            "total_size_mb": round(total_size / 1024 / 1024, 2),
+            "hot_size_bytes": hot_size,
+            "cold_size_bytes": cold_size
         }
     except Exception as e:
         logger.error(f"获取用户角色存储信息失败: {str(e)}")
         return {
             "user_id": user_id,
             "user_role": user_role.value,
-            "folder_name": f"{user_role.value}_{user_id}",
+            "folder_name": folder_name,
             "chat_count": 0,
+            "archived_chat_count": 0,
             "storage_path": "",
             "total_size_bytes": 0,
-            "total_size_mb": 0
+            "total_size_mb": 0,
+            "hot_size_bytes": 0,
+            "cold_size_bytes": 0
         }
 
 
 async def get_chat_history(user_id: str, user_role: UserRole, chat_id: Optional[str] = None, limit: int = 20) -> Dict[
     str, Any]:
-    """从用户角色专属目录获取聊天历史"""
-    cache_key = get_user_cache_key(user_id, user_role)
+    """获取聊天历史"""
     folder_name = f"{user_role.value}_{user_id}"
 
-    logger.info(f"从角色专属目录获取聊天历史: {folder_name}, chat_id={chat_id}, limit={limit}")
-
-    # 确保缓存中有用户数据
-    if cache_key not in chat_history_cache:
-        logger.info(f"用户 {folder_name} 不在缓存中，开始从角色专属目录加载历史记录")
-        chat_history_cache[cache_key] = {}
+    logger.info(f"获取聊天历史: {folder_name}, chat_id={chat_id}, limit={limit}")
 
-    # 总是重新加载用户的所有聊天历史，确保数据最新
-    load_user_chat_histories(user_id, user_role)
-
-    # 如果请求特定聊天ID
+    # 如果请求特定聊天ID：优先读取缓存，未命中时从存储加载
     if chat_id:
-        if chat_id in chat_history_cache[cache_key]:
-            logger.info(f"从缓存返回聊天记录: {folder_name}/chat_{chat_id}.json")
-            return chat_history_cache[cache_key][chat_id]
-
-        # 从用户角色专属文件夹加载
-        history_data = load_chat_history_from_file(user_id, user_role, chat_id)
+        history_data = await get_cached_chat(user_id, user_role, chat_id)
         if history_data:
-            chat_history_cache[cache_key][chat_id] = history_data
-            logger.info(f"从角色专属目录加载聊天记录: {folder_name}/chat_{chat_id}.json")
-            return history_data
+            logger.info(f"返回聊天记录: {folder_name}/chat_{chat_id}")
+            return strip_context_state(history_data)
 
-        logger.warning(f"在角色专属目录中未找到聊天记录: {folder_name}/chat_{chat_id}.json")
+        logger.warning(f"未找到聊天记录: {folder_name}/chat_{chat_id}")
         return {"messages": [], "created_at": ""}
 
-    # 返回用户的所有对话历史列表
-    user_chats = chat_history_cache[cache_key]
-    logger.info(f"用户 {folder_name} 角色专属目录缓存中有 {len(user_chats)} 条聊天记录")
-
-    if not user_chats:
-        logger.info(f"用户 {folder_name} 角色专属目录中没有聊天历史")
-        return {
-            "chats": [],
-            "storage_info": get_user_storage_info(user_id, user_role)
-        }
-
-    # 按创建时间排序，返回最近的聊天记录
+    # 返回用户的所有对话历史列表：只读取聊天索引，不加载消息内容
     try:
-        valid_chats = []
-        for cid, data in user_chats.items():
-            # 检查数据有效性
-            if not isinstance(data, dict):
-                continue
-
-            messages = data.get("messages", [])
-            created_at = data.get("created_at", "")
-
-            # 只要有created_at就认为是有效对话
-            if created_at:
-                # 计算有效消息数量（排除空的AI回复）
-                valid_message_count = 0
-                for msg in messages:
-                    if msg.get("role") == "user":
-                        valid_message_count += 1
-                    elif msg.get("role") == "assistant" and msg.get("content", "").strip():
-                        valid_message_count += 1
-
-                valid_chats.append((cid, data, valid_message_count))
+        chat_index = await get_chat_storage_engine().get_chat_index(user_id, user_role)
+        logger.info(f"用户 {folder_name} 聊天索引中有 {len(chat_index)} 条聊天记录")
+
+        # 只要有created_at就认为是有效对话
+        valid_chats = [entry for entry in chat_index.values() if entry.get("created_at")]
 
         # 按最后更新时间或创建时间排序
         sorted_chats = sorted(
             valid_chats,
-            key=lambda x: x[1].get("last_updated", x[1].get("created_at", "")),
+            key=lambda x: x.get("last_updated") or x.get("created_at", ""),
             reverse=True
         )[:limit]
 
         result = {
             "chats": [
                 {
-                    "chat_id": cid,
-                    "created_at": data.get("created_at", ""),
-                    "last_updated": data.get("last_updated", data.get("created_at", "")),
-                    "preview": get_chat_preview(data.get("messages", [])),
-                    "message_count": valid_count,
-                    "user_role": data.get("user_role", user_role.value)
+                    "chat_id": entry["chat_id"],
+                    "created_at": entry.get("created_at", ""),
+                    "last_updated": entry.get("last_updated") or entry.get("created_at", ""),
+                    "preview": entry.get("preview", "新对话"),
+                    "message_count": entry.get("message_count", 0),
+                    "user_role": entry.get("user_role", user_role.value),
+                    "archived": entry.get("archived", False)
                 }
-                for cid, data, valid_count in sorted_chats
+                for entry in sorted_chats
             ],
-            "storage_info": get_user_storage_info(user_id, user_role)
+            "storage_info": get_user_storage_info(user_id, user_role, chat_index)
         }
 
-        logger.info(f"从角色专属目录返回 {len(result['chats'])} 条聊天历史，总共找到 {len(valid_chats)} 条有效对话")
+        logger.info(f"返回 {len(result['chats'])} 条聊天历史，总共找到 {len(valid_chats)} 条有效对话")
         return result
 
     except Exception as e:
-        logger.error(f"处理角色专属目录聊天历史时出错: {str(e)}")
+        logger.error(f"处理聊天历史列表时出错: {str(e)}")
         return {
             "chats": [],
-            "storage_info": get_user_storage_info(user_id, user_role)
+            "storage_info": get_user_storage_info(user_id, user_role, {})
         }
 
 
+async def get_chat_message_page(
+        user_id: str,
+        user_role: UserRole,
+        chat_id: str,
+        before: Optional[int] = None,
+        limit: int = 50
+) -> Optional[Dict[str, Any]]:
+    """
+    按游标分页获取对话消息：before 为空时返回最新的 limit 条，之后以返回的 next_cursor 向前翻页
+
+    缓存中的对话有效时直接切片；否则由存储引擎只读取目标范围，不把整个对话载入缓存
+    """
+    cache_key = get_user_cache_key(user_id, user_role)
+
+    chat_data = chat_history_cache.peek(cache_key, chat_id)
+    if chat_data is not None:
+        fresh = (cache_key, chat_id) in _persisted_responses
+        if not fresh:
+            version = chat_history_cache.get_version(cache_key, chat_id)
+            current_version = await get_chat_storage_engine().get_chat_version(user_id, user_role, chat_id)
+            fresh = version is not None and version == current_version
+        if fresh:
+            messages = chat_data.get("messages", [])
+            start, end = get_message_page_bounds(len(messages), before, limit)
+            return build_message_page(messages[start:end], start, len(messages))
+
+    try:
+        return await get_chat_storage_engine().get_message_range(user_id, user_role, chat_id, before, limit)
+    except Exception as e:
+        logger.error(f"分页读取聊天消息失败: {cache_key}/chat_{chat_id}, {str(e)}")
+        return None
+
+
+async def search_chat_history(user_id: str, user_role: UserRole, query: str, limit: int = 20) -> Dict[str, Any]:
+    """在用户的全部聊天消息中检索关键词"""
+    folder_name = f"{user_role.value}_{user_id}"
+    started = time.perf_counter()
+
+    try:
+        results = await search_chat_messages(user_id, user_role, query, limit)
+    except Exception as e:
+        logger.error(f"检索聊天历史失败: {folder_name}, {str(e)}")
+        results = []
+
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+    logger.info(f"检索聊天历史: {folder_name}, 关键词={query}, 命中 {len(results)} 条, 耗时 {took_ms}ms")
+    return {"query": query, "results": results, "took_ms": took_ms}
+
+
+async def _replay_cached_answer(
+        chat_id: str,
+        user_id: str,
+        user_role: UserRole,
+        answer: str,
+        delta_stream: bool
+) -> AsyncGenerator[ChatStreamResponse, None]:
+    """以流式响应的形式回放缓存的答案，并像正常回复一样写入聊天历史"""
+    content = ""
+    for start in range(0, len(answer), CHAT_ANSWER_CACHE_REPLAY_CHUNK_CHARS):
+        piece = answer[start:start + CHAT_ANSWER_CACHE_REPLAY_CHUNK_CHARS]
+        content += piece
+        if delta_stream:
+            yield ChatStreamResponse(chat_id=chat_id, delta=piece, is_complete=False)
+        else:
+            yield ChatStreamResponse(chat_id=chat_id, content=content, is_complete=False)
+        # 让出事件循环，使各段作为独立事件发送
+        await asyncio.sleep(0)
+
+    await finalize_assistant_response_in_history(chat_id, user_id, user_role, answer)
+    yield ChatStreamResponse(chat_id=chat_id, content=answer, is_complete=True)
+
+
 async def process_chat_request(
         request: ChatRequest,
         user_id: str,
-        user_role: UserRole
+        user_role: UserRole,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        document_owner_id: Optional[str] = None
 ) -> AsyncGenerator[ChatStreamResponse, None]:
-    """处理聊天请求并将历史保存到用户角色专属文件夹"""
+    """
+    处理聊天请求并将历史保存到用户角色专属文件夹
+
+    is_disconnected 用于检测客户端是否已断开；断开后立即关闭上游流，停止消耗额度，
+    已生成的部分内容以截断状态保存
+
+    请求指定 document_ids 时，从 document_owner_id（教师工号或学号）名下的向量化文档中检索
+    与本轮问题相关的片段作为参考资料
+    """
     folder_name = f"{user_role.value}_{user_id}"
     logger.info(f"处理聊天请求: 用户角色目录={folder_name}")
 
-    # 记录用户角色专属目录信息
-    user_dir = get_user_chat_directory(user_id, user_role)
-    logger.info(f"用户 {folder_name} 的聊天记录将保存到: {user_dir}")
-
     # 确定聊天ID：如果请求中有chat_id则使用，否则生成新的
     chat_id = request.chat_id if request.chat_id else str(uuid.uuid4())
     is_new_chat = not request.chat_id
 
-    # 如果是新对话，立即创建初始历史记录到用户角色专属文件夹
+    # 生成回复期间固定该对话，避免被缓存淘汰
+    cache_key = get_user_cache_key(user_id, user_role)
+    chat_history_cache.pin(cache_key, chat_id)
+
+    # 如果是新对话，立即创建初始历史记录
     if is_new_chat:
-        create_initial_chat_history(chat_id, user_id, user_role, request.messages)
+        await create_initial_chat_history(chat_id, user_id, user_role, request.messages)
     else:
-        # 现有对话：立即追加用户消息到用户角色专属文件夹
-        append_user_messages_to_history(chat_id, user_id, user_role, request.messages)
+        # 现有对话：立即追加用户消息
+        await append_user_messages_to_history(chat_id, user_id, user_role, request.messages)
 
     # 只在没有AI回复占位符时才初始化
-    cache_key = get_user_cache_key(user_id, user_role)
-    if cache_key in chat_history_cache and chat_id in chat_history_cache[cache_key]:
-        messages = chat_history_cache[cache_key][chat_id]["messages"]
+    chat_data = chat_history_cache.peek(cache_key, chat_id)
+    if chat_data is not None:
+        messages = chat_data["messages"]
         # 检查最后一条消息是否为空的AI回复
         has_empty_assistant = (
                 messages and
@@ -491,108 +592,185 @@ async def process_chat_request(
         )
 
         if not has_empty_assistant:
-            initialize_assistant_response_in_history(chat_id, user_id, user_role)
+            await initialize_assistant_response_in_history(chat_id, user_id, user_role)
     else:
-        initialize_assistant_response_in_history(chat_id, user_id, user_role)
+        await initialize_assistant_response_in_history(chat_id, user_id, user_role)
+
+    response = None
+    full_content = ""
+    slot_acquired = False
+    llm_call = None
+    question_embedding = None
+    # 回复已完整写入历史；之后生成器在最后一次 yield 处被关闭时不再按断开处理
+    finalized = False
+
+    # 新对话的第一轮提问可以使用语义答案缓存；基于文档的回答依赖所选文档，不参与缓存
+    user_messages = [msg for msg in request.messages if msg.role == ChatMessageRole.USER]
+    use_documents = bool(request.document_ids) and document_owner_id is not None
+    cacheable_question = (
+        user_messages[0].content.strip()
+        if semantic_answer_cache.enabled and is_new_chat and len(user_messages) == 1 and not use_documents else ""
+    )
 
     try:
+        if cacheable_question:
+            cached_answer, question_embedding = await semantic_answer_cache.lookup(
+                user_role.value, cacheable_question
+            )
+            if cached_answer is not None:
+                full_content = cached_answer
+                async for chunk in _replay_cached_answer(
+                        chat_id, user_id, user_role, cached_answer, request.delta_stream
+                ):
+                    # 回放在发送最终事件之前已写入历史
+                    if chunk.is_complete:
+                        finalized = True
+                    yield chunk
+                return
+
+        # 文档问答：以本轮最后一条用户消息检索参考资料（在获取调用名额之前完成，不占用名额）
+        reference_context = None
+        if use_documents and user_messages:
+            chunks = await retrieve_chat_references(
+                document_owner_id, request.document_ids, user_messages[-1].content
+            )
+            reference_context = build_reference_context(chunks)
+
+        # 获取大模型调用名额：交互式聊天优先于批量生成，同一用户的并发调用受限
+        await llm_scheduler.acquire(cache_key, LLMPriority.INTERACTIVE, feature="chat")
+        slot_acquired = True
+
         # 准备系统提示词
         system_prompt = get_system_prompt(user_role)
 
-        # 构建完整消息列表，包括系统提示
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-
-        # 如果是现有对话，加载历史消息（排除刚刚初始化的空AI回复）
-        if not is_new_chat:
-            history_messages = get_chat_messages_history(user_id, user_role, chat_id)
-            # 过滤掉系统消息和空的AI回复，只保留用户和有内容的助手对话
-            for msg in history_messages:
-                if (msg.get("role") in ["user", "assistant"] and
-                        not (msg.get("role") == "assistant" and not msg.get("content", "").strip())):
-                    messages.append(msg)
-
-        # 添加当前用户消息
-        for msg in request.messages:
-            messages.append({
-                "role": msg.role.value,
-                "content": msg.content
-            })
+        # 在token预算内构建上下文：历史中已包含本轮用户消息，较早的对话以滚动摘要代替
+        chat_data = chat_history_cache.peek(cache_key, chat_id) or {
+            "messages": [msg.model_dump(mode="json") for msg in request.messages]
+        }
+        messages, summary_updated = await build_chat_context(system_prompt, chat_data, reference_context)
+        if summary_updated:
+            await append_records_to_storage(
+                user_id, user_role, chat_id,
+                [build_summary_record(chat_data["context_summary"])]
+            )
 
         logger.info(f"发送到AI的消息数量: {len(messages)}")
 
-        # 调用AI服务获取回答
-        response = client.chat.completions.create(
+        # 经网关调用AI服务获取回答（共享异步客户端，建立流失败时重试，上游异常时熔断快速失败）
+        llm_call = llm_metrics.start("chat")
+        response = await llm_gateway.chat_completion(
             model="deepseek-chat",
             messages=messages,
             temperature=request.temperature,
             max_tokens=request.max_tokens,
-            stream=True
+            stream=True,
+            stream_options={"include_usage": True}
         )
 
         # 处理流式响应
-        full_content = ""
-        chunk_count = 0
+        usage = None
+        last_disconnect_check = time.monotonic()
+
+        async for chunk in response:
+            # 定期检测客户端是否断开，断开则关闭上游流并保存截断的回复
+            if is_disconnected is not None and \
+                    time.monotonic() - last_disconnect_check >= CHAT_DISCONNECT_CHECK_INTERVAL_SECONDS:
+                last_disconnect_check = time.monotonic()
+                if await is_disconnected():
+                    logger.info(f"客户端已断开，停止生成: 聊天ID={chat_id}, 已生成长度={len(full_content)}")
+                    await response.close()
+                    llm_call.finish("ClientDisconnected")
+                    await finalize_assistant_response_in_history(
+                        chat_id, user_id, user_role, full_content, truncated=True
+                    )
+                    return
+
+            # 开启include_usage后，最后一个数据块只携带用量信息
+            if getattr(chunk, "usage", None):
+                usage = {
+                    "prompt_tokens": chunk.usage.prompt_tokens,
+                    "completion_tokens": chunk.usage.completion_tokens,
+                    "total_tokens": chunk.usage.total_tokens
+                }
+                llm_call.set_usage(usage)
 
-        for chunk in response:
-            if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
+            if chunk.choices and getattr(chunk.choices[0].delta, 'content', None):
                 content_chunk = chunk.choices[0].delta.content
+                llm_call.mark_first_token()
                 full_content += content_chunk
-                chunk_count += 1
 
-                # 实时保存：每5个chunk或者内容长度达到100的倍数时保存一次到用户角色专属文件夹
-                should_save = (chunk_count % 5 == 0) or (len(full_content) % 100 < 20)
+                # 实时更新缓存，由写回任务定期批量落盘
                 update_assistant_response_in_history(
                     chat_id,
                     user_id,
                     user_role,
-                    full_content,
-                    force_save=should_save
+                    full_content
                 )
 
-                # 返回当前累积的响应
-                yield ChatStreamResponse(
-                    chat_id=chat_id,
-                    content=full_content,
-                    is_complete=False
-                )
-
-        # 最终完整响应 - 强制保存最终结果到用户角色专属文件夹
-        update_assistant_response_in_history(
-            chat_id,
-            user_id,
-            user_role,
-            full_content,
-            force_save=True
-        )
+                # 增量模式只返回新增文本，兼容模式返回当前累积的响应
+                if request.delta_stream:
+                    yield ChatStreamResponse(
+                        chat_id=chat_id,
+                        delta=content_chunk,
+                        is_complete=False
+                    )
+                else:
+                    yield ChatStreamResponse(
+                        chat_id=chat_id,
+                        content=full_content,
+                        is_complete=False
+                    )
+
+        llm_call.finish()
+
+        # 最终完整响应 - 写入剩余内容到用户角色专属文件夹
+        await finalize_assistant_response_in_history(chat_id, user_id, user_role, full_content)
+        finalized = True
+
+        if question_embedding is not None and full_content.strip():
+            semantic_answer_cache.store(user_role.value, cacheable_question, question_embedding, full_content)
 
         yield ChatStreamResponse(
             chat_id=chat_id,
             content=full_content,
-            is_complete=True
+            is_complete=True,
+            usage=usage
         )
 
         # 记录完成信息
-        chat_file_path = get_chat_file_path(user_id, user_role, chat_id)
         logger.info(f"聊天请求处理完成: 角色目录={folder_name}, 聊天ID={chat_id}, 最终内容长度={len(full_content)}")
-        logger.info(f"聊天记录已保存到: {chat_file_path}")
+
+    except (asyncio.CancelledError, GeneratorExit):
+        if finalized:
+            # 最终事件已发送，调用方关闭生成器属于正常结束
+            raise
+
+        # 响应流被框架取消（客户端断开）：当前任务已不能再等待，收尾工作交给独立任务完成
+        logger.info(f"聊天流被取消: 聊天ID={chat_id}, 已生成长度={len(full_content)}")
+        if llm_call is not None:
+            llm_call.finish("ClientDisconnected")
+        if response is not None:
+            _run_in_background(response.close())
+        _run_in_background(finalize_assistant_response_in_history(
+            chat_id, user_id, user_role, full_content, truncated=True
+        ))
+        raise
 
     except Exception as e:
         logger.error(f"聊天请求处理失败: {str(e)}")
+        if llm_call is not None:
+            llm_call.finish(type(e).__name__)
 
         # 即使出错也要保存错误信息到用户角色专属文件夹
         error_content = f"处理请求时发生错误: {str(e)}"
-        update_assistant_response_in_history(
-            chat_id,
-            user_id,
-            user_role,
-            error_content,
-            force_save=True
-        )
+        await finalize_assistant_response_in_history(chat_id, user_id, user_role, error_content)
 
         yield ChatStreamResponse(
             chat_id=chat_id,
             content=error_content,
             is_complete=True
-        )
\ No newline at end of file
+        )
+    finally:
+        if slot_acquired:
+            llm_scheduler.release(cache_key)
+        chat_history_cache.unpin(cache_key, chat_id)
\ No newline at end of file
@@ -1,25 +1,31 @@
+import asyncio
+import functools
 import os
 import re
 import hashlib
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
 from datetime import datetime
 
-import chromadb
 from chromadb.utils import embedding_functions
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from pdfminer.high_level import extract_text
 from docx import Document
 from fastapi import HTTPException, UploadFile
 
-from app.config import MEDIA_ROOT
+from app.config import (
+    MEDIA_ROOT, VECTOR_STORE_MAX_COLLECTIONS, DOCUMENT_INGEST_WORKERS,
+    DOCUMENT_EMBED_BATCH_SIZE, DOCUMENT_EMBED_MAX_PENDING_BATCHES
+)
 from app.core.logger import setup_logger
+from app.services.doc_vector.vector_store_svc import VectorStore
 
 logger = setup_logger("document_vectorization_service")
 
 # 常量配置
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 上传文件每次读取并写入磁盘的字节数
 ALLOWED_EXTENSIONS = {'.txt', '.docx'}
 VECTOR_DB_PATH = Path(MEDIA_ROOT) / "vector_db" # 向量数据库存储路径
 METADATA_PATH = Path(MEDIA_ROOT) / "documents" / "metadata" # 文档元数据存储路径
@@ -62,6 +68,21 @@ def _initialize_embedding_function():
 # 全局嵌入函数和文本分割器
 embedding_function = _initialize_embedding_function()
 
+# 全局向量库：进程内共享的客户端与集合句柄缓存
+vector_store = VectorStore(
+    path=VECTOR_DB_PATH,
+    embedding_function=embedding_function,
+    max_collections=VECTOR_STORE_MAX_COLLECTIONS
+)
+
+# 文档处理线程池：文本提取、分块与向量化都在池中执行，不阻塞事件循环；
+# 线程数即同时处理的文档数上限。嵌入模型与向量库客户端无法跨进程共享，因此使用线程池
+_ingest_executor = ThreadPoolExecutor(max_workers=DOCUMENT_INGEST_WORKERS, thread_name_prefix="doc_ingest")
+
+# 文档处理阶段
+INGEST_STAGE_EXTRACTING = "extracting"  # 提取文本并分块
+INGEST_STAGE_EMBEDDING = "embedding"  # 向量化并写入向量库
+
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=800,  # 增加块大小，适合教学内容
     chunk_overlap=100,  # 增加重叠，保持语义连贯
@@ -86,9 +107,106 @@ def _generate_content_hash(content: str) -> str:
     return hashlib.md5(content.encode('utf-8')).hexdigest()
 
 
-def _get_chromadb_client() -> chromadb.PersistentClient:
-    """获取ChromaDB客户端"""
-    return chromadb.PersistentClient(path=str(VECTOR_DB_PATH))
+async def _run_in_ingest_pool(func: Callable[..., Any], *args: Any) -> Any:
+    """在文档处理线程池中执行同步函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_ingest_executor, functools.partial(func, *args))
+
+
+def shutdown_ingest_pool() -> None:
+    """关闭文档处理线程池，丢弃尚未开始的任务，供应用关闭时调用"""
+    _ingest_executor.shutdown(wait=False, cancel_futures=True)
+    logger.info("文档处理线程池已关闭")
+
+
+async def _store_document_chunks(
+    collection_id: str,
+    document_id: str,
+    title: str,
+    staff_id: str,
+    chunks: List[str],
+    owned_chunk_ids: List[str],
+    on_progress: Callable[[int, int], Awaitable[None]]
+) -> None:
+    """
+    分批向量化并写入集合，每批写入后回调 on_progress(已写入块数, 总块数)
+
+    向量化在文档处理线程池中执行，写入在另一线程中进行，两者流水线并行；
+    等待写入的批次数有上限，写入跟不上时暂停向量化，内存中最多保留有限批次的向量。
+    文本块ID由文档ID与序号确定，使用 upsert 写入，中断后重新处理同一文档不会产生重复块。
+
+    owned_chunk_ids 记录由本任务新建的文本块（含中断前的运行），新建的ID先追加到其中并回调 on_progress
+    供调用方持久化，再写入集合；任一批次失败时删除其中全部文本块，不留下元数据中不存在的半成品文档，
+    本任务开始前已存在的同ID文本块（如其他任务已完成的同一文档）不受回滚影响
+    """
+    collection = await asyncio.to_thread(vector_store.get_collection, collection_id, True)
+    max_batch_size = await asyncio.to_thread(vector_store.get_max_batch_size)
+    batch_size = max(min(DOCUMENT_EMBED_BATCH_SIZE, max_batch_size), 1)
+
+    # 已向量化、等待写入的批次；None 表示全部批次已向量化
+    pending: asyncio.Queue = asyncio.Queue(maxsize=DOCUMENT_EMBED_MAX_PENDING_BATCHES)
+    owned = set(owned_chunk_ids)
+
+    async def embed_batches() -> None:
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            embeddings = await _run_in_ingest_pool(embedding_function, batch)
+            await pending.put((start, batch, embeddings))
+        await pending.put(None)
+
+    async def write_batches() -> None:
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            start, batch, embeddings = item
+            ids = [f"{document_id}_chunk_{i}" for i in range(start, start + len(batch))]
+            existing = await asyncio.to_thread(collection.get, ids=ids, include=[])
+            existing_ids = set(existing["ids"])
+            new_ids = [chunk_id for chunk_id in ids if chunk_id not in existing_ids and chunk_id not in owned]
+            if new_ids:
+                # 先登记并持久化再写入：写入中途中断或失败时，恢复后的任务仍能认出并回滚这些文本块
+                owned.update(new_ids)
+                owned_chunk_ids.extend(new_ids)
+                await on_progress(start, len(chunks))
+            await asyncio.to_thread(
+                collection.upsert,
+                ids=ids,
+                embeddings=embeddings,
+                documents=batch,
+                metadatas=[{
+                    "document_id": document_id,
+                    "title": title,
+                    "chunk_index": i,
+                    "staff_id": staff_id
+                } for i in range(start, start + len(batch))]
+            )
+            await on_progress(start + len(batch), len(chunks))
+
+    embed_task = asyncio.create_task(embed_batches())
+    write_task = asyncio.create_task(write_batches())
+    try:
+        # 任一方失败时取消另一方，避免向量化在写入失败后继续进行或写入一直等待
+        done, _ = await asyncio.wait({embed_task, write_task}, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+        await asyncio.gather(embed_task, write_task)
+    except asyncio.CancelledError:
+        # 应用关闭：保留已写入的文本块，任务重启后以相同ID覆盖写入
+        embed_task.cancel()
+        write_task.cancel()
+        raise
+    except Exception:
+        embed_task.cancel()
+        write_task.cancel()
+        await asyncio.gather(embed_task, write_task, return_exceptions=True)
+        logger.error(f"文档{document_id}向量化写入失败，回滚本任务写入的{len(owned_chunk_ids)}个文本块")
+        try:
+            if owned_chunk_ids:
+                await asyncio.to_thread(collection.delete, ids=list(owned_chunk_ids))
+        except Exception as e:
+            logger.error(f"回滚文档{document_id}的文本块失败: {str(e)}")
+        raise
 
 
 def _extract_text_from_file(file_path: str, file_extension: str) -> str:
@@ -212,9 +330,9 @@ def _save_teacher_metadata(staff_id: str, documents: List[Dict[str, Any]]) -> No
         raise
 
 
-async def validate_uploaded_file(file: UploadFile) -> bytes:
+def validate_upload_filename(file: UploadFile) -> str:
     """
-    验证上传的文件
+    验证上传文件的文件名与扩展名，返回小写扩展名
     """
     # 检查文件扩展名
     if not file.filename:
@@ -226,134 +344,168 @@ async def validate_uploaded_file(file: UploadFile) -> bytes:
             status_code=400,
             detail=f"不支持的文件类型，仅支持: {', '.join(ALLOWED_EXTENSIONS)}"
         )
+    return file_extension
 
-    # 读取并检查文件大小
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail=f"文件大小超过 {MAX_FILE_SIZE // 1024 // 1024}MB 限制"
-        )
-
-    # 检查文件是否为空
-    if len(content) == 0:
-        raise HTTPException(status_code=400, detail="文件内容为空")
 
-    return content
+async def save_uploaded_file(file: UploadFile, dest_path: Path) -> Tuple[int, str]:
+    """
+    验证上传的文件并分块写入 dest_path
 
+    边读边写边计算SHA-256，超过大小限制时立即停止读取，内存占用与文件大小无关；
+    验证失败时删除已写入的部分文件
 
-async def process_and_store_document(
-    file: UploadFile,
-    staff_id: str,
-    title: str
-) -> Dict[str, Any]:
-    """
-    处理并存储文档到向量数据库
+    Returns:
+        (文件大小, 文件内容的SHA-256)
     """
-    logger.info(f"开始处理教师{staff_id}的文档: {title}")
+    validate_upload_filename(file)
 
-    # 验证文件
-    content_bytes = await validate_uploaded_file(file)
-    file_extension = Path(file.filename).suffix.lower()
-
-    # 创建临时文件进行处理
-    temp_file_path = None
+    size = 0
+    sha256 = hashlib.sha256()
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp:
-            temp_file_path = temp.name
-            temp.write(content_bytes)
+        with open(dest_path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                # 检查文件大小
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"文件大小超过 {MAX_FILE_SIZE // 1024 // 1024}MB 限制"
+                    )
+
+                sha256.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+
+        # 检查文件是否为空
+        if size == 0:
+            raise HTTPException(status_code=400, detail="文件内容为空")
+    except BaseException:
+        dest_path.unlink(missing_ok=True)
+        raise
 
-        # 提取文本内容
-        content = _extract_text_from_file(temp_file_path, file_extension)
+    return size, sha256.hexdigest()
 
-        # 检查提取的文本是否为空
-        if not content.strip():
-            raise HTTPException(status_code=400, detail="无法从文件中提取有效文本内容")
 
-        # 生成内容哈希
-        content_hash = _generate_content_hash(content)
-        document_id = f"doc_{staff_id}_{content_hash[:12]}"
-        collection_id = f"teacher_{staff_id}_docs"
+async def ingest_document(
+    staff_id: str,
+    title: str,
+    filename: str,
+    file_path: Path,
+    file_size: int,
+    file_sha256: Optional[str],
+    owned_chunk_ids: List[str],
+    on_stage: Callable[[str], Awaitable[None]],
+    on_progress: Callable[[int, int], Awaitable[None]]
+) -> Dict[str, Any]:
+    """
+    处理已保存的上传文件并存储到向量数据库
 
-        # 检查是否已存在相同内容的文档
-        existing_docs = _load_teacher_metadata(staff_id)
-        for doc in existing_docs:
-            if doc["content_hash"] == content_hash:
-                logger.info(f"发现已存在的文档: {doc['title']} (ID: {doc['document_id']})")
+    Args:
+        staff_id: 文档所有者（教师工号或学号）
+        title: 文档标题
+        filename: 原始文件名
+        file_path: 上传文件的保存路径
+        file_size: 文件大小（字节）
+        file_sha256: 文件内容的SHA-256，与已有文档相同时跳过处理
+        owned_chunk_ids: 本任务新建的文本块ID，处理过程中追加；调用方在 on_progress 中随任务状态持久化，
+            任务中断后恢复时传回，失败时据此回滚
+        on_stage: 进入新处理阶段时调用
+        on_progress: 登记新文本块与每批文本块写入后调用，参数为已写入块数与总块数
+
+    Returns:
+        处理结果；内容无法处理时抛出 ValueError
+    """
+    logger.info(f"开始处理{staff_id}的文档: {title}")
+    file_extension = file_path.suffix.lower()
+
+    # 文件与已有文档完全相同时无需提取文本
+    if file_sha256:
+        for doc in _load_teacher_metadata(staff_id):
+            if doc.get("file_sha256") == file_sha256:
+                logger.info(f"发现已存在的相同文件: {doc['title']} (ID: {doc['document_id']})")
                 return {
                     "document_id": doc["document_id"],
                     "title": doc["title"],
                     "is_new": False,
+                    "chunk_count": doc["chunk_count"],
                     "message": "文档已存在，无需重复处理"
                 }
 
-        # 获取ChromaDB客户端
-        client = _get_chromadb_client()
+    # 提取文本内容
+    await on_stage(INGEST_STAGE_EXTRACTING)
+    content = await _run_in_ingest_pool(_extract_text_from_file, str(file_path), file_extension)
 
-        # 获取或创建集合
-        try:
-            collection = client.get_collection(
-                name=collection_id,
-                embedding_function=embedding_function
-            )
-        except:
-            collection = client.create_collection(
-                name=collection_id,
-                embedding_function=embedding_function
-            )
+    # 检查提取的文本是否为空
+    if not content.strip():
+        raise ValueError("无法从文件中提取有效文本内容")
 
-        # 分割文本
-        chunks = text_splitter.split_text(content)
-        if not chunks:
-            raise HTTPException(status_code=400, detail="文档内容过短，无法生成有效的文本块")
-
-        # 添加到向量数据库
-        chunk_ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
-        collection.add(
-            documents=chunks,
-            ids=chunk_ids,
-            metadatas=[{
-                "document_id": document_id,
-                "title": title,
-                "chunk_index": i,
-                "staff_id": staff_id
-            } for i in range(len(chunks))]
-        )
+    # 生成内容哈希
+    content_hash = _generate_content_hash(content)
+    document_id = f"doc_{staff_id}_{content_hash[:12]}"
+    collection_id = f"teacher_{staff_id}_docs"
 
-        # 保存文档元数据
-        doc_metadata = {
-            "document_id": document_id,
-            "title": title,
-            "filename": file.filename,
-            "content_hash": content_hash,
-            "created_at": datetime.now().isoformat(),
-            "chunk_count": len(chunks),
-            "file_size": len(content_bytes),
-            "collection_id": collection_id
-        }
-
-        existing_docs.append(doc_metadata)
-        _save_teacher_metadata(staff_id, existing_docs)
-
-        logger.info(f"文档处理完成: {title}, 生成{len(chunks)}个文本块")
-
-        return {
-            "document_id": document_id,
-            "title": title,
-            "is_new": True,
-            "chunk_count": len(chunks),
-            "message": "文档处理并存储成功"
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"处理文档失败: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"处理文档失败: {str(e)}")
-    finally:
-        # 清理临时文件
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
+    # 检查是否已存在相同内容的文档
+    existing_docs = _load_teacher_metadata(staff_id)
+    for doc in existing_docs:
+        if doc["content_hash"] == content_hash:
+            logger.info(f"发现已存在的文档: {doc['title']} (ID: {doc['document_id']})")
+            return {
+                "document_id": doc["document_id"],
+                "title": doc["title"],
+                "is_new": False,
+                "chunk_count": doc["chunk_count"],
+                "message": "文档已存在，无需重复处理"
+            }
+
+    # 分割文本
+    chunks = await _run_in_ingest_pool(text_splitter.split_text, content)
+    if not chunks:
+        raise ValueError("文档内容过短，无法生成有效的文本块")
+
+    # 分批写入向量数据库
+    await on_stage(INGEST_STAGE_EMBEDDING)
+    await on_progress(0, len(chunks))
+    await _store_document_chunks(collection_id, document_id, title, staff_id, chunks, owned_chunk_ids, on_progress)
+
+    # 处理期间同一用户的其他上传可能已更新元数据，重新加载后再追加
+    existing_docs = _load_teacher_metadata(staff_id)
+    for doc in existing_docs:
+        if doc["document_id"] == document_id:
+            # 相同内容的文档已由其他任务先完成入库
+            logger.info(f"文档处理期间已由其他任务入库: {doc['title']} (ID: {document_id})")
+            return {
+                "document_id": doc["document_id"],
+                "title": doc["title"],
+                "is_new": False,
+                "chunk_count": doc["chunk_count"],
+                "message": "文档已存在，无需重复处理"
+            }
+
+    existing_docs.append({
+        "document_id": document_id,
+        "title": title,
+        "filename": filename,
+        "content_hash": content_hash,
+        "created_at": datetime.now().isoformat(),
+        "chunk_count": len(chunks),
+        "file_size": file_size,
+        "file_sha256": file_sha256,
+        "collection_id": collection_id
+    })
+    _save_teacher_metadata(staff_id, existing_docs)
+
+    logger.info(f"文档处理完成: {title}, 生成{len(chunks)}个文本块")
+
+    return {
+        "document_id": document_id,
+        "title": title,
+        "is_new": True,
+        "chunk_count": len(chunks),
+        "message": "文档处理并存储成功"
+    }
 
 
 async def list_teacher_documents(staff_id: str) -> List[Dict[str, Any]]:
@@ -386,14 +538,14 @@ async def retrieve_document_context(
     collection_id = f"teacher_{staff_id}_docs"
 
     try:
-        client = _get_chromadb_client()
-        collection = client.get_collection(
-            name=collection_id,
-            embedding_function=embedding_function
-        )
+        collection = await asyncio.to_thread(vector_store.get_collection, collection_id)
+        if collection is None:
+            logger.warning(f"向量库中不存在集合{collection_id}，无法检索文档{document_id}")
+            return []
 
-        # 检索指定文档的相关内容
-        results = collection.query(
+        # 检索指定文档的相关内容；问题向量化在线程中执行，不使用文档处理线程池，避免排在大文档之后
+        results = await asyncio.to_thread(
+            collection.query,
             query_texts=[query],
             n_results=n_results * 2,  # 获取更多结果用于过滤
             where={"document_id": document_id}
@@ -425,20 +577,18 @@ async def delete_document(staff_id: str, document_id: str) -> bool:
     """
     try:
         collection_id = f"teacher_{staff_id}_docs"
-        client = _get_chromadb_client()
 
         # 从向量数据库中删除文档块
         try:
-            collection = client.get_collection(
-                name=collection_id,
-                embedding_function=embedding_function
-            )
-
-            # 查找并删除属于该文档的所有块
-            results = collection.get(where={"document_id": document_id})
-            if results and "ids" in results and results["ids"]:
-                collection.delete(ids=results["ids"])
-                logger.info(f"已从向量数据库删除文档{document_id}的{len(results['ids'])}个文本块")
+            collection = await asyncio.to_thread(vector_store.get_collection, collection_id)
+            if collection is None:
+                logger.warning(f"向量库中不存在集合{collection_id}，跳过删除文档块")
+            else:
+                # 查找并删除属于该文档的所有块
+                results = await asyncio.to_thread(collection.get, where={"document_id": document_id})
+                if results and "ids" in results and results["ids"]:
+                    await asyncio.to_thread(collection.delete, ids=results["ids"])
+                    logger.info(f"已从向量数据库删除文档{document_id}的{len(results['ids'])}个文本块")
         except Exception as e:
             logger.warning(f"从向量数据库删除文档块时出错: {str(e)}")
 
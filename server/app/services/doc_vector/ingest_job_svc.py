@@ -0,0 +1,268 @@
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import suppress
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastapi import UploadFile
+from filelock import FileLock, Timeout
+
+from app.config import MEDIA_ROOT, DOCUMENT_INGEST_WORKERS, DOCUMENT_INGEST_JOB_RETENTION_DAYS
+from app.core.logger import setup_logger
+from app.services.doc_vector.document_vectorization_svc import (
+    ingest_document, validate_upload_filename, save_uploaded_file,
+    INGEST_STAGE_EXTRACTING, INGEST_STAGE_EMBEDDING
+)
+
+logger = setup_logger("document_vectorization_service")
+
+# 任务状态文件与待处理的上传文件存储目录
+INGEST_JOBS_DIR = Path(MEDIA_ROOT) / "documents" / "ingest_jobs"
+INGEST_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_EXTRACTING = INGEST_STAGE_EXTRACTING
+JOB_EMBEDDING = INGEST_STAGE_EMBEDDING
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+UNFINISHED_JOB_STATUSES = {JOB_QUEUED, JOB_EXTRACTING, JOB_EMBEDDING}
+
+_JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _get_job_path(job_id: str) -> Path:
+    return INGEST_JOBS_DIR / f"{job_id}.json"
+
+
+def _get_job_lock_path(job_id: str) -> Path:
+    return INGEST_JOBS_DIR / f"{job_id}.lock"
+
+
+def _get_upload_path(job: Dict[str, Any]) -> Path:
+    return INGEST_JOBS_DIR / f"{job['job_id']}{job['file_extension']}"
+
+
+def _write_job(job: Dict[str, Any]) -> None:
+    """原子写入任务状态：先写临时文件再替换"""
+    job_path = _get_job_path(job["job_id"])
+    temp_path = job_path.with_suffix(".json.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(temp_path, job_path)
+
+
+def _read_job(job_id: str) -> Optional[Dict[str, Any]]:
+    if not _JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(_get_job_path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"读取文档处理任务状态失败 {job_id}: {str(e)}")
+        return None
+
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """任务的对外展示字段"""
+    total = job["chunks_total"]
+    return {
+        "job_id": job["job_id"],
+        "title": job["title"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "chunks_total": total,
+        "chunks_embedded": job["chunks_embedded"],
+        "progress": round(job["chunks_embedded"] / total, 4) if total else (1.0 if job["status"] == JOB_DONE else 0.0),
+        "document_id": job["document_id"],
+        "is_new": job["is_new"],
+        "message": job["message"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+class IngestJobQueue:
+    """
+    文档处理任务队列
+
+    上传接口保存文件并创建任务后立即返回任务ID，后台工作协程依次执行提取、分块与向量化，
+    任务状态（queued/extracting/embedding/done/failed）与进度持久化到状态文件；
+    应用重启时未完成的任务重新入队。任务执行期间持有任务文件锁，多进程部署时同一任务只由一个进程处理
+    """
+
+    def __init__(self, workers: int, retention_days: int):
+        self.workers = workers
+        self.retention_days = retention_days
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        # 本进程中正在排队或处理的任务，查询进度时优先读取
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    async def start(self) -> None:
+        """启动工作协程并恢复未完成的任务，需在事件循环中调用"""
+        if self._queue is not None:
+            return
+
+        self._queue = asyncio.Queue()
+        pending = await asyncio.to_thread(self._scan_jobs)
+        for job in pending:
+            self._queue.put_nowait(job["job_id"])
+
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"文档处理任务队列已启动: 工作协程={self.workers}, 恢复未完成任务={len(pending)}")
+
+    async def stop(self) -> None:
+        """停止工作协程；处理中的任务保留当前状态，下次启动时重新处理"""
+        for task in self._worker_tasks:
+            task.cancel()
+        for task in self._worker_tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._worker_tasks = []
+        self._queue = None
+        self._jobs.clear()
+        logger.info("文档处理任务队列已停止")
+
+    def _scan_jobs(self) -> List[Dict[str, Any]]:
+        """返回未完成的任务（按创建时间排序），并清理超过保留期的已结束任务"""
+        pending = []
+        expire_before = time.time() - self.retention_days * 86400
+
+        for job_path in INGEST_JOBS_DIR.glob("*.json"):
+            job = _read_job(job_path.stem)
+            if job is None:
+                continue
+
+            if job["status"] in UNFINISHED_JOB_STATUSES:
+                pending.append(job)
+            elif job_path.stat().st_mtime < expire_before:
+                job_path.unlink(missing_ok=True)
+                _get_job_lock_path(job["job_id"]).unlink(missing_ok=True)
+
+        return sorted(pending, key=lambda job: job["created_at"])
+
+    async def submit(self, owner_id: str, title: str, file: UploadFile) -> Dict[str, Any]:
+        """把上传文件分块保存到任务目录并创建排队中的任务"""
+        if self._queue is None:
+            raise RuntimeError("文档处理任务队列未启动")
+
+        now = datetime.now().isoformat()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "owner_id": owner_id,
+            "title": title,
+            "filename": file.filename,
+            "file_extension": validate_upload_filename(file),
+            "file_size": 0,
+            "file_sha256": None,
+            "status": JOB_QUEUED,
+            "chunks_total": 0,
+            "chunks_embedded": 0,
+            # 本任务新建的文本块ID，随进度持久化，任务中断恢复后失败时仍能完整回滚
+            "owned_chunk_ids": [],
+            "document_id": None,
+            "is_new": None,
+            "message": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        job["file_size"], job["file_sha256"] = await save_uploaded_file(file, _get_upload_path(job))
+        await asyncio.to_thread(_write_job, job)
+
+        self._jobs[job["job_id"]] = job
+        self._queue.put_nowait(job["job_id"])
+        logger.info(f"文档处理任务已创建: {job['job_id']}, 所有者={owner_id}, 标题={title}, "
+                    f"大小={job['file_size']}字节")
+        return job_view(job)
+
+    async def get_job(self, owner_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务，不存在或不属于该用户时返回None"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = await asyncio.to_thread(_read_job, job_id)
+        if job is None or job["owner_id"] != owner_id:
+            return None
+        return job_view(job)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._process(job_id)
+            except Exception as e:
+                logger.error(f"执行文档处理任务出错 {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job_id: str) -> None:
+        lock = FileLock(str(_get_job_lock_path(job_id)), timeout=0)
+        try:
+            lock.acquire()
+        except Timeout:
+            logger.info(f"文档处理任务正由其他进程执行，跳过: {job_id}")
+            return
+
+        try:
+            # 以状态文件为准：等待期间任务可能已被其他进程完成
+            job = await asyncio.to_thread(_read_job, job_id)
+            if job is None or job["status"] not in UNFINISHED_JOB_STATUSES:
+                return
+            self._jobs[job_id] = job
+
+            async def on_stage(stage: str) -> None:
+                job["status"] = stage
+                job["updated_at"] = datetime.now().isoformat()
+                await asyncio.to_thread(_write_job, job)
+
+            async def on_progress(embedded: int, total: int) -> None:
+                job["chunks_embedded"] = embedded
+                job["chunks_total"] = total
+                job["updated_at"] = datetime.now().isoformat()
+                await asyncio.to_thread(_write_job, job)
+
+            upload_path = _get_upload_path(job)
+            try:
+                result = await ingest_document(
+                    job["owner_id"], job["title"], job["filename"], upload_path, job["file_size"],
+                    job.get("file_sha256"), job.setdefault("owned_chunk_ids", []),
+                    on_stage=on_stage, on_progress=on_progress
+                )
+                job.update(
+                    status=JOB_DONE,
+                    document_id=result["document_id"],
+                    is_new=result["is_new"],
+                    message=result["message"],
+                    chunks_total=result["chunk_count"],
+                    chunks_embedded=result["chunk_count"]
+                )
+                logger.info(f"文档处理任务完成: {job_id}, 文档={result['document_id']}")
+            except Exception as e:
+                job.update(status=JOB_FAILED, error=str(e))
+                logger.error(f"文档处理任务失败: {job_id}, {str(e)}")
+
+            # 任务已结束，文本块归属只在处理期间需要
+            job["owned_chunk_ids"] = []
+            job["updated_at"] = datetime.now().isoformat()
+            await asyncio.to_thread(_write_job, job)
+            upload_path.unlink(missing_ok=True)
+        finally:
+            self._jobs.pop(job_id, None)
+            lock.release()
+
+
+# 全局文档处理任务队列
+ingest_job_queue = IngestJobQueue(
+    workers=DOCUMENT_INGEST_WORKERS,
+    retention_days=DOCUMENT_INGEST_JOB_RETENTION_DAYS
+)
@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import chromadb
+from chromadb.api.models.Collection import Collection
+from chromadb.errors import NotFoundError
+
+from app.core.logger import setup_logger
+
+logger = setup_logger("document_vectorization_service")
+
+
+class VectorStore:
+    """
+    进程内共享的向量库
+
+    整个进程只创建一个 ChromaDB 客户端（应用启动时初始化，未初始化时在首次使用时创建），
+    集合句柄按最近使用缓存，避免每次上传、检索、删除都重新打开客户端与集合。
+    方法可在工作线程中调用
+    """
+
+    def __init__(self, path: Path, embedding_function: Any, max_collections: int):
+        self.path = path
+        self.embedding_function = embedding_function
+        self.max_collections = max_collections
+
+        self._client: Optional[chromadb.ClientAPI] = None
+        self._max_batch_size: Optional[int] = None
+        self._collections: "OrderedDict[str, Collection]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def start(self) -> None:
+        """创建客户端，供应用启动时调用"""
+        with self._lock:
+            self._get_client()
+
+    def _get_client(self) -> chromadb.ClientAPI:
+        """调用方需持有 self._lock"""
+        if self._client is None:
+            self._client = chromadb.PersistentClient(path=str(self.path))
+            logger.info(f"向量库客户端已创建: 路径={self.path}, 集合句柄缓存上限={self.max_collections}")
+        return self._client
+
+    def get_collection(self, name: str, create: bool = False) -> Optional[Collection]:
+        """
+        获取集合句柄
+
+        集合不存在时：create=True 则创建，否则返回 None
+        """
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is not None:
+                self._collections.move_to_end(name)
+                self.hits += 1
+                return collection
+
+            self.misses += 1
+            client = self._get_client()
+            if create:
+                collection = client.get_or_create_collection(
+                    name=name,
+                    embedding_function=self.embedding_function
+                )
+            else:
+                try:
+                    collection = client.get_collection(
+                        name=name,
+                        embedding_function=self.embedding_function
+                    )
+                except NotFoundError:
+                    return None
+
+            self._collections[name] = collection
+            while len(self._collections) > self.max_collections:
+                self._collections.popitem(last=False)
+                self.evictions += 1
+            return collection
+
+    def get_max_batch_size(self) -> int:
+        """向量库单次写入允许的最大记录数"""
+        with self._lock:
+            if self._max_batch_size is None:
+                self._max_batch_size = self._get_client().get_max_batch_size()
+            return self._max_batch_size
+
+    def close(self) -> None:
+        """释放集合句柄与客户端，供应用关闭时调用"""
+        with self._lock:
+            self._collections.clear()
+            if self._client is not None:
+                # 客户端没有单独的关闭方法，清理共享的系统缓存以停止后台组件并关闭数据库连接
+                self._client.clear_system_cache()
+                self._client = None
+                logger.info("向量库客户端已关闭")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "initialized": self._client is not None,
+            "cached_collections": len(self._collections),
+            "max_collections": self.max_collections,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
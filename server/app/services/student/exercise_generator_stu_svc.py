@@ -5,9 +5,12 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 from fastapi import HTTPException
-from openai import OpenAI
 
-from app.config import DEEPSEEK_API_KEY, MEDIA_ROOT
+from app.config import MEDIA_ROOT
+from app.core.llm_gateway import llm_gateway
+from app.core.llm_metrics import llm_metrics
+from app.core.llm_scheduler import llm_scheduler, LLMPriority
+from app.core.llm_singleflight import llm_singleflight, make_request_key
 from app.core.logger import setup_logger
 from app.models.exercise import ExerciseType
 from app.services.doc_vector.document_vectorization_svc import (
@@ -27,14 +30,6 @@ STUDENT_JSON_DIR.mkdir(parents=True, exist_ok=True)
 STUDENT_MD_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def _get_ai_client() -> OpenAI:
-    """获取AI客户端"""
-    return OpenAI(
-        api_key=DEEPSEEK_API_KEY,
-        base_url="https://api.deepseek.com"
-    )
-
-
 async def _extract_knowledge_points_from_student_document(
     student_id: str,
     document_id: str,
@@ -158,26 +153,36 @@ def _build_student_enhanced_prompt(
 只返回JSON数据，不要有其他说明文字。"""
 
 
-async def _call_ai_api(prompt: str) -> str:
-    """调用AI API生成习题"""
+async def _call_ai_api(prompt: str, user_key: str) -> str:
+    """调用AI API生成习题，user_key 用于调用名额的单用户限流"""
     logger.info("开始调用AI API生成学生习题")
+    params = dict(
+        model="deepseek-chat",
+        messages=[
+            {
+                "role": "system",
+                "content": "你是一位专业的教育教学助手，擅长为学生创建适合练习的习题。你会根据学生的学习材料生成难度适中、有助于理解和巩固知识的练习题。"
+            },
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.6,
+        max_tokens=7168,
+        stream=False
+    )
+
+    async def call_llm() -> str:
+        # 批量生成优先级排队获取调用名额，经网关调用（共享连接池、失败重试与熔断）
+        async with llm_scheduler.slot(user_key, LLMPriority.BATCH, feature="student_exercise"):
+            with llm_metrics.start("student_exercise") as llm_call:
+                response = await llm_gateway.chat_completion(**params)
+                llm_call.set_usage(response.usage)
+        return response.choices[0].message.content
+
     try:
-        client = _get_ai_client()
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "你是一位专业的教育教学助手，擅长为学生创建适合练习的习题。你会根据学生的学习材料生成难度适中、有助于理解和巩固知识的练习题。"
-                },
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6,
-            max_tokens=7168,
-            stream=False
-        )
+        # 重复点击或前端重试产生的相同请求合并为一次上游调用，共享生成结果
+        content = await llm_singleflight.do(make_request_key("student_exercise", user_key, **params), call_llm)
         logger.info("AI API调用成功")
-        return response.choices[0].message.content
+        return content
     except Exception as e:
         logger.error(f"AI API调用失败: {str(e)}")
         raise Exception(f"AI API调用失败: {str(e)}")
@@ -281,6 +286,7 @@ def _generate_student_markdown(exercises_data: List[Dict[str, Any]], title: str)
 async def generate_student_exercises(
     content: Optional[str],
     student_id: str,
+    user_key: str,
     title: str = "我的练习题",
     count: int = 5,
     types: List[ExerciseType] = None,
@@ -315,7 +321,7 @@ async def generate_student_exercises(
     prompt = _build_student_enhanced_prompt(content, types, count, knowledge_contexts)
 
     try:
-        response_text = await _call_ai_api(prompt)
+        response_text = await _call_ai_api(prompt, user_key)
         exercises_data = _parse_response(response_text)
 
         if not exercises_data:
@@ -5,9 +5,12 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 from fastapi import HTTPException
-from openai import OpenAI
 
-from app.config import DEEPSEEK_API_KEY, MEDIA_ROOT
+from app.config import MEDIA_ROOT
+from app.core.llm_gateway import llm_gateway
+from app.core.llm_metrics import llm_metrics
+from app.core.llm_scheduler import llm_scheduler, LLMPriority
+from app.core.llm_singleflight import llm_singleflight, make_request_key
 from app.core.logger import setup_logger
 from app.models.exercise import ExerciseType
 from app.services.doc_vector.document_vectorization_svc import (
@@ -28,15 +31,6 @@ JSON_DIR.mkdir(parents=True, exist_ok=True)
 MD_DIR.mkdir(parents=True, exist_ok=True)
 
 
-# 初始化AI客户端
-def _get_ai_client() -> OpenAI:
-    """获取AI客户端"""
-    return OpenAI(
-        api_key=DEEPSEEK_API_KEY,
-        base_url="https://api.deepseek.com"
-    )
-
-
 async def _extract_knowledge_points_from_document(
         staff_id: str,
         document_id: str,
@@ -180,26 +174,36 @@ def _build_enhanced_prompt(
 只返回JSON数据，不要有其他说明文字。"""
 
 
-async def _call_ai_api(prompt: str) -> str:
-    """调用AI API生成习题"""
+async def _call_ai_api(prompt: str, user_key: str) -> str:
+    """调用AI API生成习题，user_key 用于调用名额的单用户限流"""
     logger.info("开始调用AI API生成习题")
+    params = dict(
+        model="deepseek-chat",
+        messages=[
+            {
+                "role": "system",
+                "content": "你是一位专业的教育教学助手，擅长基于教学材料创建高质量的习题。你会仔细分析提供的知识点，生成准确、有针对性的习题。"
+            },
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.6,  # 稍微降低随机性，提高一致性
+        max_tokens=7168,
+        stream=False
+    )
+
+    async def call_llm() -> str:
+        # 批量生成优先级排队获取调用名额，经网关调用（共享连接池、失败重试与熔断）
+        async with llm_scheduler.slot(user_key, LLMPriority.BATCH, feature="teacher_exercise"):
+            with llm_metrics.start("teacher_exercise") as llm_call:
+                response = await llm_gateway.chat_completion(**params)
+                llm_call.set_usage(response.usage)
+        return response.choices[0].message.content
+
     try:
-        client = _get_ai_client()
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "你是一位专业的教育教学助手，擅长基于教学材料创建高质量的习题。你会仔细分析提供的知识点，生成准确、有针对性的习题。"
-                },
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6,  # 稍微降低随机性，提高一致性
-            max_tokens=7168,
-            stream=False
-        )
+        # 重复点击或前端重试产生的相同请求合并为一次上游调用，共享生成结果
+        content = await llm_singleflight.do(make_request_key("teacher_exercise", user_key, **params), call_llm)
         logger.info("AI API调用成功")
-        return response.choices[0].message.content
+        return content
     except Exception as e:
         logger.error(f"AI API调用失败: {str(e)}")
         raise Exception(f"AI API调用失败: {str(e)}")
@@ -300,6 +304,7 @@ def _generate_markdown(exercises_data: List[Dict[str, Any]], title: str) -> str:
 async def generate_exercises(
         content: Optional[str],
         staff_id: str,
+        user_key: str,
         title: str = "未命名习题集",
         count: int = 5,
         types: List[ExerciseType] = None,
@@ -312,6 +317,7 @@ async def generate_exercises(
     Args:
         content: 用户提供的内容
         staff_id: 教师工号
+        user_key: 调用名额的用户键，与聊天共用 get_user_cache_key 的结果
         title: 习题集标题
         count: 生成习题数量
         types: 习题类型列表
@@ -347,7 +353,7 @@ async def generate_exercises(
 
     try:
         # 调用AI API
-        response_text = await _call_ai_api(prompt)
+        response_text = await _call_ai_api(prompt, user_key)
 
         # 解析响应
         exercises_data = _parse_response(response_text)
@@ -4,7 +4,6 @@ from datetime import datetime
 from typing import Dict, List
 
 from fastapi import HTTPException
-from openai import OpenAI
 
 from pptx import Presentation
 from pptx.util import Inches, Pt
@@ -12,7 +11,11 @@ from pptx.dml.color import RGBColor
 from pptx.enum.text import PP_ALIGN
 from pptx.enum.shapes import MSO_SHAPE
 
-from app.config import DEEPSEEK_API_KEY, SERVER_DIR
+from app.config import SERVER_DIR
+from app.core.llm_gateway import llm_gateway
+from app.core.llm_metrics import llm_metrics
+from app.core.llm_scheduler import llm_scheduler, LLMPriority
+from app.core.llm_singleflight import llm_singleflight, make_request_key
 from app.core.logger import setup_logger
 from app.schemas.teacher.ppt_generator_sch import (
     PPTGenerationRequest, PPTGenerationResponse, PPTSlide,
@@ -28,16 +31,9 @@ PPT_OUTLINE_DIR = SERVER_DIR / "app" / "documents" / "ppt_outlines"
 PPT_FILES_DIR.mkdir(exist_ok=True, parents=True)
 PPT_OUTLINE_DIR.mkdir(exist_ok=True, parents=True)
 
-# 创建 API 客户端
-client = OpenAI(
-    api_key=DEEPSEEK_API_KEY,
-    base_url="https://api.deepseek.com"
-)
-
-
-async def generate_ppt_outline(request: PPTGenerationRequest, staff_id: str) -> PPTOutlineResponse:
+async def generate_ppt_outline(request: PPTGenerationRequest, staff_id: str, user_key: str) -> PPTOutlineResponse:
     """
-    生成PPT的Markdown格式大纲
+    生成PPT的Markdown格式大纲，user_key 用于调用名额的单用户限流
     """
     logger.info(f"开始生成PPT大纲: 标题={request.title}")
 
@@ -68,20 +64,28 @@ async def generate_ppt_outline(request: PPTGenerationRequest, staff_id: str) ->
     请确保生成了符合要求的幻灯片数量，字数适中且内容有教学价值。
     """
 
-    try:
-        # 使用 OpenAI 客户端调用 API
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "你是一个专业的教育资源制作助手，擅长生成教学PPT内容。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=8000,
-            stream=False
-        )
+    params = dict(
+        model="deepseek-chat",
+        messages=[
+            {"role": "system", "content": "你是一个专业的教育资源制作助手，擅长生成教学PPT内容。"},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=8000,
+        stream=False
+    )
 
-        md_content = response.choices[0].message.content
+    async def call_llm() -> str:
+        # 批量生成优先级排队获取调用名额，经网关调用（共享连接池、失败重试与熔断）
+        async with llm_scheduler.slot(user_key, LLMPriority.BATCH, feature="ppt_outline"):
+            with llm_metrics.start("ppt_outline") as llm_call:
+                response = await llm_gateway.chat_completion(**params)
+                llm_call.set_usage(response.usage)
+        return response.choices[0].message.content
+
+    try:
+        # 重复点击或前端重试产生的相同请求合并为一次上游调用，共享生成的大纲
+        md_content = await llm_singleflight.do(make_request_key("ppt_outline", user_key, **params), call_llm)
         logger.info(f"成功从API获取大纲内容")
 
         # 保存大纲到文件
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 本地 OpenAI 兼容的大模型模拟服务，用于离线压测聊天、习题生成与PPT大纲生成流程
+# 输出内容由请求内容确定（相同请求得到相同结果），首个token延迟与生成速度可配置
+# 用法（在 server 目录下）:
+#   python -m llm_stub.llm_stub_server --port 9100 --ttft-ms 300 --tokens-per-second 50
+#   DEEPSEEK_BASE_URL=http://127.0.0.1:9100 uvicorn app.main:app
+
+# 普通问答使用的文本片段，按请求内容的哈希确定选取顺序
+_PHRASES = [
+    "这个问题可以从基本概念入手。", "首先需要明确定义，", "然后结合具体的例子来理解，",
+    "在实际教学中，", "常见的误区是忽略前提条件。", "我们可以把它分成几个步骤：",
+    "第一步是梳理已知条件，", "第二步是建立联系，", "最后进行归纳总结。",
+    "建议多做练习巩固。", "理解原理比记忆结论更重要，", "可以参考教材中的相关章节。",
+]
+
+
+class StubSettings:
+    """模拟服务的延迟与输出长度配置"""
+
+    def __init__(
+            self,
+            ttft_ms: float = 300,
+            tokens_per_second: float = 50,
+            completion_tokens: int = 200,
+            jitter: float = 0.0
+    ):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.jitter = jitter
+
+    def delay(self, seconds: float) -> float:
+        """在基础延迟上叠加随机抖动（比例）"""
+        if self.jitter <= 0:
+            return seconds
+        return max(seconds * (1 + random.uniform(-self.jitter, self.jitter)), 0)
+
+
+settings = StubSettings()
+app = FastAPI(title="LuminoEdu LLM Stub")
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(len(text) // 2, 1)
+
+
+def _build_exercises(seed: int) -> str:
+    """习题生成请求：返回可被习题服务解析的JSON数组"""
+    exercises = []
+    for index in range(5):
+        exercises.append({
+            "title": f"模拟题目{index + 1}",
+            "content": f"下列关于知识点{(seed + index) % 97}的说法，正确的是？",
+            "type": 1,
+            "options": ["说法A", "说法B", "说法C", "说法D"],
+            "answer": "ABCD"[(seed + index) % 4],
+            "explanation": "这是模拟服务生成的解析。",
+            "knowledge_source": ""
+        })
+    return json.dumps(exercises, ensure_ascii=False, indent=2)
+
+
+def _build_outline(seed: int, prompt: str) -> str:
+    """PPT大纲请求：返回Markdown大纲，幻灯片数量取自提示词"""
+    slide_count = 10
+    marker = "幻灯片数量:"
+    if marker in prompt:
+        digits = prompt.split(marker, 1)[1].strip().split()[0]
+        if digits.isdigit():
+            slide_count = int(digits)
+
+    slides = ["# 模拟课件大纲"]
+    for index in range(1, slide_count + 1):
+        slides.append(f"## 幻灯片{index}: 第{index}部分")
+        slides.append(f"- 要点{index}.1: 模拟内容{(seed + index) % 89}")
+        slides.append(f"- 要点{index}.2: 示例与练习")
+    return "\n".join(slides)
+
+
+def _build_answer(seed: int, max_tokens: int) -> str:
+    """普通问答：按哈希确定的顺序拼接文本片段，直到达到目标token数"""
+    rng = random.Random(seed)
+    target_chars = min(settings.completion_tokens, max_tokens) * 2
+    parts = []
+    length = 0
+    while length < target_chars:
+        phrase = rng.choice(_PHRASES)
+        parts.append(phrase)
+        length += len(phrase)
+    return "".join(parts)[:target_chars]
+
+
+def build_completion(messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> str:
+    """根据请求内容确定输出：相同的消息列表总是得到相同的内容"""
+    prompt = "\n".join(str(message.get("content", "")) for message in messages)
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    last_message = str(messages[-1].get("content", "")) if messages else ""
+
+    if "JSON" in last_message and "习题" in prompt:
+        return _build_exercises(seed)
+    if "PPT" in last_message and "大纲" in last_message:
+        return _build_outline(seed, last_message)
+    return _build_answer(seed, max_tokens or settings.completion_tokens)
+
+
+def _split_tokens(content: str) -> List[str]:
+    """按约两个字符一个token切分，用于流式输出"""
+    return [content[i:i + 2] for i in range(0, len(content), 2)]
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+async def _stream_completion(completion_id: str, model: str, tokens: List[str], prompt_tokens: int,
+                             include_usage: bool):
+    created = int(time.time())
+
+    def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    await asyncio.sleep(settings.delay(settings.ttft_ms / 1000))
+    yield chunk({"role": "assistant", "content": ""})
+
+    interval = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+    for token in tokens:
+        yield chunk({"content": token})
+        if interval:
+            await asyncio.sleep(settings.delay(interval))
+
+    yield chunk({}, finish_reason="stop")
+
+    # 与OpenAI一致：开启include_usage时最后一个数据块只携带用量
+    if include_usage:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [],
+            "usage": _usage(prompt_tokens, len(tokens))
+        }
+        yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "deepseek-chat")
+    content = build_completion(messages, body.get("max_tokens"))
+    tokens = _split_tokens(content)
+    prompt_tokens = sum(_estimate_tokens(str(message.get("content", ""))) for message in messages)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(
+            _stream_completion(completion_id, model, tokens, prompt_tokens, include_usage),
+            media_type="text/event-stream"
+        )
+
+    # 非流式请求按完整生成耗时返回
+    generation_seconds = len(tokens) / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+    await asyncio.sleep(settings.delay(settings.ttft_ms / 1000 + generation_seconds))
+    return JSONResponse({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": _usage(prompt_tokens, len(tokens))
+    })
+
+
+@app.get("/models")
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "deepseek-chat", "object": "model", "owned_by": "llm-stub"}]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容的大模型模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="首个token延迟（毫秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="每秒输出的token数，0表示不限速")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="普通问答的输出token数")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机抖动比例，如0.2表示±20%%")
+    args = parser.parse_args()
+
+    settings.ttft_ms = args.ttft_ms
+    settings.tokens_per_second = args.tokens_per_second
+    settings.completion_tokens = args.completion_tokens
+    settings.jitter = args.jitter
+
+    print(f"模拟服务启动: http://{args.host}:{args.port}, 首token延迟={args.ttft_ms}ms, "
+          f"速度={args.tokens_per_second} token/s, 问答长度={args.completion_tokens} token")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
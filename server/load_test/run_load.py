@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Callable, Awaitable, Dict, List, Optional
+
+import httpx
+
+# 压测聊天、习题生成与PPT大纲生成接口，输出吞吐量与延迟分位数
+# 建议配合本地大模型模拟服务使用，避免消耗真实接口额度：
+#   python -m llm_stub.llm_stub_server --port 9100
+#   DEEPSEEK_BASE_URL=http://127.0.0.1:9100 uvicorn app.main:app --port 8000
+# 用法（在 server 目录下）:
+#   python -m load_test.run_load --scenario all --concurrency 20 --requests 200
+
+SCENARIOS = ["chat", "teacher_exercise", "student_exercise", "ppt_outline"]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩法计算分位数，输入需已排序"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * q), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class ScenarioResult:
+    """单个场景的请求耗时与错误统计"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.started = 0.0
+        self.finished = 0.0
+
+    def record_error(self, error: str) -> None:
+        self.errors[error] = self.errors.get(error, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        ttfts = sorted(self.ttfts)
+        elapsed = max(self.finished - self.started, 1e-9)
+        total = len(self.latencies) + sum(self.errors.values())
+        return {
+            "scenario": self.name,
+            "requests": total,
+            "succeeded": len(self.latencies),
+            "errors": dict(self.errors),
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(self.latencies) / elapsed, 2),
+            "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "latency_p90_ms": round(percentile(latencies, 0.90) * 1000, 1),
+            "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "latency_max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+            "ttft_p50_ms": round(percentile(ttfts, 0.50) * 1000, 1) if ttfts else None,
+            "ttft_p99_ms": round(percentile(ttfts, 0.99) * 1000, 1) if ttfts else None,
+        }
+
+
+async def login(client: httpx.AsyncClient, user_id: str, password: str) -> str:
+    resp = await client.post("/auth/login", json={"user_id": user_id, "password": password})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+async def run_chat(client: httpx.AsyncClient, token: str, index: int, result: ScenarioResult) -> None:
+    """流式聊天：记录首个数据事件的到达时间与完整耗时"""
+    payload = {
+        "messages": [{"role": "user", "content": f"请解释一下第{index}个知识点的基本概念。({uuid.uuid4().hex[:8]})"}],
+        "delta_stream": True
+    }
+    started = time.perf_counter()
+    first_event = None
+
+    async with client.stream("POST", "/chat/stream", json=payload,
+                             headers={"Authorization": f"Bearer {token}"}) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[6:]
+            if data == "[DONE]":
+                break
+            if first_event is None:
+                first_event = time.perf_counter()
+            event = json.loads(data)
+            if "error" in event:
+                raise RuntimeError(event["error"])
+
+    finished = time.perf_counter()
+    result.latencies.append(finished - started)
+    if first_event is not None:
+        result.ttfts.append(first_event - started)
+
+
+async def run_teacher_exercise(client: httpx.AsyncClient, token: str, index: int, result: ScenarioResult) -> None:
+    payload = {
+        "content": f"函数的定义与性质，第{index}节：定义域、值域、单调性与奇偶性。",
+        "title": f"压测习题{index}",
+        "count": 5,
+        "use_knowledge_matching": False
+    }
+    await _timed_post(client, "/teacher/exercise_generator/generate", payload, token, result)
+
+
+async def run_student_exercise(client: httpx.AsyncClient, token: str, index: int, result: ScenarioResult) -> None:
+    payload = {
+        "content": f"牛顿运动定律，第{index}节：惯性、加速度与作用力和反作用力。",
+        "title": f"压测练习{index}",
+        "count": 5,
+        "use_knowledge_matching": False
+    }
+    await _timed_post(client, "/student/exercise_generator/generate", payload, token, result)
+
+
+async def run_ppt_outline(client: httpx.AsyncClient, token: str, index: int, result: ScenarioResult) -> None:
+    payload = {
+        "title": f"压测课件{index}",
+        "subject": "数学",
+        "teaching_target": "理解函数的基本概念",
+        "key_points": ["定义域", "值域", "单调性"],
+        "target_grade": "高一",
+        "slide_count": 8
+    }
+    await _timed_post(client, "/teacher/ppt/generate_outline", payload, token, result)
+
+
+async def _timed_post(client: httpx.AsyncClient, path: str, payload: Dict[str, Any], token: str,
+                      result: ScenarioResult) -> None:
+    started = time.perf_counter()
+    resp = await client.post(path, json=payload, headers={"Authorization": f"Bearer {token}"})
+    resp.raise_for_status()
+    result.latencies.append(time.perf_counter() - started)
+
+
+async def run_scenario(
+        name: str,
+        request_fn: Callable[[httpx.AsyncClient, str, int, ScenarioResult], Awaitable[None]],
+        client: httpx.AsyncClient,
+        token: str,
+        total_requests: int,
+        concurrency: int
+) -> ScenarioResult:
+    """以固定并发数发送 total_requests 个请求"""
+    result = ScenarioResult(name)
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(total_requests):
+        queue.put_nowait(index)
+
+    async def worker():
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await request_fn(client, token, index, result)
+            except httpx.HTTPStatusError as e:
+                result.record_error(f"HTTP {e.response.status_code}")
+            except Exception as e:
+                result.record_error(type(e).__name__)
+
+    result.started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.finished = time.perf_counter()
+    return result
+
+
+def print_report(results: List[ScenarioResult]) -> None:
+    header = f"{'场景':<18}{'请求':>6}{'成功':>6}{'吞吐(req/s)':>13}{'p50(ms)':>10}{'p90(ms)':>10}" \
+             f"{'p99(ms)':>10}{'max(ms)':>10}{'TTFT p50':>10}{'TTFT p99':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        s = result.summary()
+        print(f"{s['scenario']:<18}{s['requests']:>6}{s['succeeded']:>6}{s['throughput_rps']:>13}"
+              f"{s['latency_p50_ms']:>10}{s['latency_p90_ms']:>10}{s['latency_p99_ms']:>10}"
+              f"{s['latency_max_ms']:>10}{str(s['ttft_p50_ms'] or '-'):>10}{str(s['ttft_p99_ms'] or '-'):>10}")
+        if s["errors"]:
+            print(f"  错误: {s['errors']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="LuminoEdu 大模型相关接口压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/api", help="后端接口地址")
+    parser.add_argument("--scenario", choices=SCENARIOS + ["all"], default="all")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景的请求总数")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发请求数")
+    parser.add_argument("--teacher", default="T2025001", help="教师工号")
+    parser.add_argument("--student", default="S2025001", help="学生学号")
+    parser.add_argument("--password", default="mmmm123")
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求超时（秒）")
+    parser.add_argument("--json", dest="json_output", help="把结果另存为JSON文件")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS if args.scenario == "all" else [args.scenario]
+    request_fns = {
+        "chat": run_chat,
+        "teacher_exercise": run_teacher_exercise,
+        "student_exercise": run_student_exercise,
+        "ppt_outline": run_ppt_outline,
+    }
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        teacher_token: Optional[str] = None
+        student_token: Optional[str] = None
+        if any(name in ("chat", "teacher_exercise", "ppt_outline") for name in scenarios):
+            teacher_token = await login(client, args.teacher, args.password)
+        if "student_exercise" in scenarios:
+            student_token = await login(client, args.student, args.password)
+
+        results = []
+        for name in scenarios:
+            token = student_token if name == "student_exercise" else teacher_token
+            print(f"开始压测 {name}: 请求数={args.requests}, 并发={args.concurrency}")
+            results.append(await run_scenario(name, request_fns[name], client, token,
+                                              args.requests, args.concurrency))
+
+    print()
+    print_report(results)
+
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as f:
+            json.dump([result.summary() for result in results], f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.json_output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
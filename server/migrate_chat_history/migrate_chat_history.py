@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+
+from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+
+from app.database import TORTOISE_ORM
+from app.models.chat_history import ChatSession
+from app.models.user_common import UserRole
+from app.services.chat_history.db_storage_engine_svc import DatabaseChatStorageEngine
+from app.services.chat_history.fs_storage_engine_svc import CHAT_HISTORY_ROOT_DIR, FileSystemChatStorageEngine
+
+# 将 documents/chat_history 下的聊天文件迁移到数据库聊天存储引擎的数据表
+# 聊天数据表由 aerich 迁移创建，运行前先在 server 目录下执行 aerich upgrade
+# 用法（在 server 目录下）: python -m migrate_chat_history.migrate_chat_history [--overwrite] [--dry-run]
+
+
+async def init():
+    # 初始化数据库连接（不建表，试运行不修改数据库）
+    await Tortoise.init(config=TORTOISE_ORM)
+
+
+def iter_user_directories():
+    """遍历聊天历史根目录下的 <角色>_<用户ID> 目录"""
+    for user_dir in sorted(CHAT_HISTORY_ROOT_DIR.iterdir()):
+        if not user_dir.is_dir() or "_" not in user_dir.name:
+            continue
+
+        role_value, user_id = user_dir.name.split("_", 1)
+        try:
+            yield UserRole(role_value), user_id
+        except ValueError:
+            print(f"跳过无法识别角色的目录: {user_dir.name}")
+
+
+async def migrate(overwrite: bool, dry_run: bool):
+    fs_engine = FileSystemChatStorageEngine()
+    db_engine = DatabaseChatStorageEngine()
+    migrated = skipped = failed = 0
+
+    for user_role, user_id in iter_user_directories():
+        # 试运行不修改文件：旧版JSON文件只读取，不转换为追加式日志
+        chats = await fs_engine.load_user_chats(user_id, user_role, convert_legacy=not dry_run)
+        for chat_id, chat_data in chats.items():
+            exists = await ChatSession.filter(
+                user_role=user_role.value, user_id=user_id, chat_id=chat_id
+            ).exists()
+            if exists and not overwrite:
+                skipped += 1
+                continue
+
+            if dry_run:
+                migrated += 1
+                continue
+
+            try:
+                await db_engine.save_chat(user_id, user_role, chat_id, chat_data)
+                migrated += 1
+            except Exception as e:
+                failed += 1
+                print(f"迁移失败: {user_role.value}_{user_id}/chat_{chat_id}: {str(e)}")
+
+        print(f"已处理 {user_role.value}_{user_id}: {len(chats)} 个对话")
+
+    action = "待迁移" if dry_run else "已迁移"
+    print(f"迁移完成: {action} {migrated} 个对话, 已存在跳过 {skipped} 个, 失败 {failed} 个")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="将文件中的聊天历史迁移到数据库")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖数据库中已存在的对话")
+    parser.add_argument("--dry-run", action="store_true", help="只统计待迁移的对话，不写入数据库")
+    args = parser.parse_args()
+
+    await init()
+    try:
+        await migrate(args.overwrite, args.dry_run)
+    except OperationalError as e:
+        print(f"查询聊天数据表失败，请先执行 aerich upgrade 创建数据表: {str(e)}")
+    finally:
+        await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS `admin` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `username` VARCHAR(50) NOT NULL UNIQUE,
+    `password_hash` VARCHAR(128) NOT NULL,
+    `role` VARCHAR(7) NOT NULL COMMENT 'STUDENT: student\nTEACHER: teacher\nADMIN: admin' DEFAULT 'student',
+    `created_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    `updated_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    `admin_id` VARCHAR(20) NOT NULL UNIQUE COMMENT '管理员编号',
+    `permissions` LONGTEXT COMMENT '权限描述'
+) CHARACTER SET utf8mb4 COMMENT='管理员信息表';
+        CREATE TABLE IF NOT EXISTS `student` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `username` VARCHAR(50) NOT NULL UNIQUE,
+    `password_hash` VARCHAR(128) NOT NULL,
+    `role` VARCHAR(7) NOT NULL COMMENT 'STUDENT: student\nTEACHER: teacher\nADMIN: admin' DEFAULT 'student',
+    `created_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    `updated_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    `student_id` VARCHAR(20) NOT NULL UNIQUE COMMENT '学号',
+    `college` VARCHAR(100) NOT NULL COMMENT '学院',
+    `major` VARCHAR(100) NOT NULL COMMENT '专业',
+    `grade` VARCHAR(20) NOT NULL COMMENT '年级',
+    `enrollment_year` INT NOT NULL COMMENT '入学年份',
+    `intro` LONGTEXT COMMENT '个人简介',
+    `contact_email` VARCHAR(100) COMMENT '联系邮箱'
+) CHARACTER SET utf8mb4 COMMENT='学生信息表';
+        CREATE TABLE IF NOT EXISTS `teacher` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `username` VARCHAR(50) NOT NULL UNIQUE,
+    `password_hash` VARCHAR(128) NOT NULL,
+    `role` VARCHAR(7) NOT NULL COMMENT 'STUDENT: student\nTEACHER: teacher\nADMIN: admin' DEFAULT 'student',
+    `created_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    `updated_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    `staff_id` VARCHAR(20) NOT NULL UNIQUE COMMENT '教工号',
+    `department` VARCHAR(100) NOT NULL COMMENT '所属院系',
+    `expertise` VARCHAR(255) COMMENT '专业领域',
+    `intro` LONGTEXT COMMENT '个人简介',
+    `contact_email` VARCHAR(100) COMMENT '联系邮箱',
+    `office_location` VARCHAR(100) COMMENT '办公室位置'
+) CHARACTER SET utf8mb4 COMMENT='教师信息表';
+        CREATE TABLE IF NOT EXISTS `course` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `name` VARCHAR(100) NOT NULL COMMENT '课程名称',
+    `description` LONGTEXT COMMENT '课程描述',
+    `semester` VARCHAR(20) NOT NULL COMMENT '学期',
+    `credit` DOUBLE NOT NULL COMMENT '学分' DEFAULT 0,
+    `start_date` DATE COMMENT '开始日期',
+    `end_date` DATE COMMENT '结束日期',
+    `created_at` DATETIME(6) NOT NULL COMMENT '创建时间' DEFAULT CURRENT_TIMESTAMP(6),
+    `updated_at` DATETIME(6) NOT NULL COMMENT '更新时间' DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    `teacher_id` INT NOT NULL COMMENT '课程教师',
+    CONSTRAINT `fk_course_teacher_2de38fe7` FOREIGN KEY (`teacher_id`) REFERENCES `teacher` (`id`) ON DELETE CASCADE
+) CHARACTER SET utf8mb4 COMMENT='课程信息表';
+        CREATE TABLE IF NOT EXISTS `course_notification` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `title` VARCHAR(200) NOT NULL COMMENT '通知标题',
+    `content` LONGTEXT NOT NULL COMMENT '通知内容',
+    `priority` SMALLINT NOT NULL COMMENT '通知优先级' DEFAULT 1,
+    `require_confirmation` BOOL NOT NULL COMMENT '是否需要学生确认' DEFAULT 0,
+    `publish_time` DATETIME(6) NOT NULL COMMENT '发布时间' DEFAULT CURRENT_TIMESTAMP(6),
+    `created_at` DATETIME(6) NOT NULL COMMENT '创建时间' DEFAULT CURRENT_TIMESTAMP(6),
+    `updated_at` DATETIME(6) NOT NULL COMMENT '更新时间' DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    `course_id` INT NOT NULL COMMENT '所属课程',
+    `teacher_id` INT NOT NULL COMMENT '发布教师',
+    CONSTRAINT `fk_course_n_course_da5ded08` FOREIGN KEY (`course_id`) REFERENCES `course` (`id`) ON DELETE CASCADE,
+    CONSTRAINT `fk_course_n_teacher_68b32412` FOREIGN KEY (`teacher_id`) REFERENCES `teacher` (`id`) ON DELETE CASCADE
+) CHARACTER SET utf8mb4 COMMENT='课程通知表';
+        CREATE TABLE IF NOT EXISTS `course_student` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `course_id` INT NOT NULL,
+    `student_id` INT NOT NULL,
+    UNIQUE KEY `uid_course_stud_course__80e093` (`course_id`, `student_id`),
+    CONSTRAINT `fk_course_s_course_736c4d18` FOREIGN KEY (`course_id`) REFERENCES `course` (`id`) ON DELETE CASCADE,
+    CONSTRAINT `fk_course_s_student_135715d0` FOREIGN KEY (`student_id`) REFERENCES `student` (`id`) ON DELETE CASCADE
+) CHARACTER SET utf8mb4 COMMENT='课程-学生关联表';
+        CREATE TABLE IF NOT EXISTS `notification_confirmation` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `confirmed_at` DATETIME(6) NOT NULL COMMENT '确认时间' DEFAULT CURRENT_TIMESTAMP(6),
+    `notification_id` INT NOT NULL COMMENT '通知',
+    `student_id` INT NOT NULL COMMENT '确认学生',
+    UNIQUE KEY `uid_notificatio_notific_63ca42` (`notification_id`, `student_id`),
+    CONSTRAINT `fk_notifica_course_n_b8f7869b` FOREIGN KEY (`notification_id`) REFERENCES `course_notification` (`id`) ON DELETE CASCADE,
+    CONSTRAINT `fk_notifica_student_a4b70310` FOREIGN KEY (`student_id`) REFERENCES `student` (`id`) ON DELETE CASCADE
+) CHARACTER SET utf8mb4 COMMENT='通知确认记录表';
+        CREATE TABLE IF NOT EXISTS `aerich` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `version` VARCHAR(255) NOT NULL,
+    `app` VARCHAR(100) NOT NULL,
+    `content` JSON NOT NULL
+) CHARACTER SET utf8mb4;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        """
@@ -0,0 +1,37 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS `chat_session` (
+    `id` INT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `user_role` VARCHAR(16) NOT NULL COMMENT '用户角色',
+    `user_id` VARCHAR(50) NOT NULL COMMENT '用户ID',
+    `chat_id` VARCHAR(64) NOT NULL COMMENT '对话ID',
+    `preview` VARCHAR(64) NOT NULL COMMENT '对话预览' DEFAULT '新对话',
+    `message_count` INT NOT NULL COMMENT '有效消息数' DEFAULT 0,
+    `size_bytes` BIGINT NOT NULL COMMENT '消息内容总字节数' DEFAULT 0,
+    `context_summary` LONGTEXT COMMENT '上下文摘要',
+    `summary_covered_count` INT NOT NULL COMMENT '摘要覆盖的消息数' DEFAULT 0,
+    `version` INT NOT NULL COMMENT '数据版本号' DEFAULT 0,
+    `created_at` VARCHAR(32) NOT NULL COMMENT '创建时间',
+    `last_updated` VARCHAR(32) NOT NULL COMMENT '最后更新时间',
+    UNIQUE KEY `uid_chat_sessio_user_ro_bff1f8` (`user_role`, `user_id`, `chat_id`),
+    KEY `idx_chat_sessio_user_ro_210cd8` (`user_role`, `user_id`, `last_updated`)
+) CHARACTER SET utf8mb4 COMMENT='聊天对话表';
+        CREATE TABLE IF NOT EXISTS `chat_message` (
+    `id` BIGINT NOT NULL PRIMARY KEY AUTO_INCREMENT,
+    `seq` INT NOT NULL COMMENT '消息在对话中的序号',
+    `role` VARCHAR(16) NOT NULL COMMENT '消息角色',
+    `content` LONGTEXT NOT NULL COMMENT '消息内容',
+    `truncated` BOOL NOT NULL COMMENT '回复是否因客户端断开而截断' DEFAULT 0,
+    `session_id` INT NOT NULL COMMENT '所属对话',
+    UNIQUE KEY `uid_chat_messag_session_d12596` (`session_id`, `seq`),
+    CONSTRAINT `fk_chat_mes_chat_ses_677511f0` FOREIGN KEY (`session_id`) REFERENCES `chat_session` (`id`) ON DELETE CASCADE
+) CHARACTER SET utf8mb4 COMMENT='聊天消息表';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS `chat_message`;
+        DROP TABLE IF EXISTS `chat_session`;"""
@@ -0,0 +1,118 @@
+import pytest
+
+from app.models.user_common import UserRole
+from app.services import chat_context_svc, chat_svc
+from app.services.chat_context_svc import estimate_tokens, build_chat_context
+
+
+def test_estimate_tokens_is_conservative():
+    """估算不低于DeepSeek文档给出的比例：中文每字约0.6个token，英文每字符约0.3个token"""
+    chinese = "请解释一下牛顿第二定律，并举一个生活中的例子。"
+    english = "Explain Newton's second law with an everyday example."
+    code = "for i in range(10): print(i ** 2)"
+
+    assert estimate_tokens("") == 0
+    assert estimate_tokens(chinese) >= len(chinese) * 0.6
+    assert estimate_tokens(english) >= len(english) * 0.3
+    assert estimate_tokens(code) >= len(code) * 0.3
+    assert estimate_tokens("한국어 😀") >= len("한국어😀")
+
+
+def make_long_chat(message_count=40, chars_per_message=2000):
+    return {
+        "messages": [
+            {"role": "user" if seq % 2 == 0 else "assistant", "content": "内容" * (chars_per_message // 2)}
+            for seq in range(message_count)
+        ]
+    }
+
+
+@pytest.fixture
+def summarize_calls(monkeypatch):
+    calls = []
+    results = []
+
+    async def fake_summarize(previous_summary, messages):
+        calls.append(len(messages))
+        return results.pop(0) if results else None
+
+    monkeypatch.setattr(chat_context_svc, "_summarize_messages", fake_summarize)
+    return calls, results
+
+
+@pytest.mark.asyncio
+async def test_summary_failure_backs_off(summarize_calls, monkeypatch):
+    """摘要失败后在退避期内不再请求摘要，退避结束后重试，成功后清除失败记录"""
+    calls, results = summarize_calls
+    now = [1000.0]
+    monkeypatch.setattr(chat_context_svc.time, "time", lambda: now[0])
+    chat_data = make_long_chat()
+
+    _, updated = await build_chat_context("系统提示", chat_data)
+    assert not updated
+    assert len(calls) == 1
+
+    await build_chat_context("系统提示", chat_data)
+    assert len(calls) == 1
+
+    now[0] += chat_context_svc.CHAT_SUMMARY_RETRY_BASE_SECONDS
+    await build_chat_context("系统提示", chat_data)
+    assert len(calls) == 2
+    assert chat_data["context_summary_failure"]["failures"] == 2
+
+    # 连续失败后退避时间翻倍
+    now[0] += chat_context_svc.CHAT_SUMMARY_RETRY_BASE_SECONDS
+    await build_chat_context("系统提示", chat_data)
+    assert len(calls) == 2
+
+    now[0] += chat_context_svc.CHAT_SUMMARY_RETRY_BASE_SECONDS
+    results.append("较早对话的摘要")
+    messages, updated = await build_chat_context("系统提示", chat_data)
+    assert updated
+    assert len(calls) == 3
+    assert "context_summary_failure" not in chat_data
+    assert "较早对话的摘要" in messages[1]["content"]
+
+
+@pytest.mark.asyncio
+async def test_evicted_messages_always_covered_by_summary(summarize_calls, monkeypatch):
+    """有消息移出窗口即生成摘要并多覆盖若干条，之后移出的消息仍在摘要内，不必每轮重新生成"""
+    calls, results = summarize_calls
+    monkeypatch.setattr(chat_context_svc, "CHAT_SUMMARY_REFRESH_MESSAGES", 4)
+    # 每条消息约1004个token，预算内只能保留最近的15条
+    chat_data = make_long_chat(message_count=16, chars_per_message=1000)
+    results.append("第一份摘要")
+
+    messages, updated = await build_chat_context("系统提示", chat_data)
+    assert updated
+    assert calls == [4]
+    assert chat_data["context_summary"]["covered_count"] == 4
+    assert messages[1]["content"].endswith("第一份摘要")
+    assert len(messages) == 2 + 12
+
+    # 再移出两条消息：仍被已有摘要覆盖，不重新生成，也没有既不在摘要中又不在窗口中的消息
+    chat_data["messages"].extend(make_long_chat(message_count=2, chars_per_message=1000)["messages"])
+    messages, updated = await build_chat_context("系统提示", chat_data)
+    assert not updated
+    assert calls == [4]
+    assert len(messages) == 2 + 14
+
+
+@pytest.mark.asyncio
+async def test_chat_history_response_omits_context_state(monkeypatch):
+    """获取单个对话时不返回摘要与摘要失败状态，缓存中的数据保持不变"""
+    chat_data = {
+        "messages": [{"role": "user", "content": "你好"}],
+        "created_at": "2025-01-01T00:00:00",
+        "context_summary": {"content": "摘要", "covered_count": 1},
+        "context_summary_failure": {"failures": 1, "retry_at": 0}
+    }
+
+    async def fake_get_cached_chat(user_id, user_role, chat_id):
+        return chat_data
+
+    monkeypatch.setattr(chat_svc, "get_cached_chat", fake_get_cached_chat)
+    history = await chat_svc.get_chat_history("1", UserRole.STUDENT, "c1")
+
+    assert history == {"messages": chat_data["messages"], "created_at": "2025-01-01T00:00:00"}
+    assert "context_summary" in chat_data
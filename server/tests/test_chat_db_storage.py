@@ -0,0 +1,56 @@
+import pytest
+import pytest_asyncio
+from tortoise import Tortoise
+
+from app.models.user_common import UserRole
+from app.services.chat_history import db_storage_engine_svc
+from app.services.chat_history.chat_log_store_svc import RECORD_MESSAGE
+from app.services.chat_history.db_storage_engine_svc import DatabaseChatStorageEngine
+
+CHAT_DATA = {"messages": [{"role": "user", "content": "你好"}], "created_at": "2025-01-01T00:00:00"}
+REPLY_RECORD = {"op": RECORD_MESSAGE, "role": "assistant", "content": "你好，有什么可以帮你？"}
+
+
+@pytest_asyncio.fixture
+async def db_engine():
+    """聊天数据表建在内存SQLite中"""
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.models.chat_history"]})
+    await Tortoise.generate_schemas()
+    yield DatabaseChatStorageEngine()
+    await Tortoise.close_connections()
+
+
+@pytest.mark.asyncio
+async def test_append_records_creates_missing_chat(db_engine):
+    """对话尚未写入时保存完整数据，之后的记录追加到同一对话"""
+    version = await db_engine.append_records("1", UserRole.STUDENT, "c1", [], CHAT_DATA)
+    assert version == "0"
+
+    await db_engine.append_records("1", UserRole.STUDENT, "c1", [REPLY_RECORD], CHAT_DATA, version)
+
+    chat_data, _ = await db_engine.load_chat("1", UserRole.STUDENT, "c1")
+    assert [msg["role"] for msg in chat_data["messages"]] == ["user", "assistant"]
+
+
+@pytest.mark.asyncio
+async def test_append_records_appends_when_chat_created_concurrently(db_engine, monkeypatch):
+    """检查与插入之间对话已由其他进程创建时，回滚插入并追加到已有对话"""
+    await db_engine.save_chat("1", UserRole.STUDENT, "c1", CHAT_DATA)
+
+    original_get_session = DatabaseChatStorageEngine._get_session
+    calls = []
+
+    async def created_after_first_check(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            return None
+        return await original_get_session(*args, **kwargs)
+
+    monkeypatch.setattr(DatabaseChatStorageEngine, "_get_session", staticmethod(created_after_first_check))
+
+    await db_engine.append_records("1", UserRole.STUDENT, "c1", [REPLY_RECORD], CHAT_DATA)
+
+    chat_data, version = await db_engine.load_chat("1", UserRole.STUDENT, "c1")
+    assert [msg["content"] for msg in chat_data["messages"]] == ["你好", REPLY_RECORD["content"]]
+    assert version == "1"
+    assert await db_storage_engine_svc.ChatSession.all().count() == 1
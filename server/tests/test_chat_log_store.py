@@ -0,0 +1,252 @@
+import json
+import os
+
+import pytest
+
+from app.models.user_common import UserRole
+from app.services.chat_history import chat_archive_svc, fs_storage_engine_svc
+from app.services.chat_history.chat_archive_svc import ChatArchiver
+from app.services.chat_history import chat_log_store_svc
+from app.services.chat_history.chat_log_store_svc import (
+    append_chat_records, build_delta_record, build_message_record, build_patch_record, build_set_record,
+    get_chat_archive_path, get_message_index_path, load_chat_log, load_message_index, read_message_range,
+    write_chat_snapshot
+)
+from app.services.chat_history.fs_storage_engine_svc import (
+    FileSystemChatStorageEngine, get_chat_file_path, get_chat_file_version, get_chat_lock, get_chat_lock_path,
+    get_legacy_chat_file_path
+)
+from app.services.chat_history.storage_engine_svc import get_message_page_bounds
+
+
+@pytest.fixture
+def chat_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(fs_storage_engine_svc, "CHAT_HISTORY_ROOT_DIR", tmp_path)
+    monkeypatch.setattr(chat_archive_svc, "CHAT_HISTORY_ROOT_DIR", tmp_path)
+    monkeypatch.setattr(chat_archive_svc, "_ARCHIVE_SCAN_LOCK_PATH", tmp_path / ".archive.lock")
+    return tmp_path
+
+
+def make_chat(message_count):
+    return {
+        "messages": [
+            {"role": "user" if seq % 2 == 0 else "assistant", "content": f"消息{seq}"}
+            for seq in range(message_count)
+        ],
+        "created_at": "2025-01-01T00:00:00",
+        "last_updated": "2025-01-01T00:00:00",
+        "user_id": "1",
+        "user_role": UserRole.STUDENT.value
+    }
+
+
+def count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def test_append_records_replay(tmp_path):
+    """追加的增量、覆盖与附加字段记录按顺序回放到最后一条消息"""
+    log_path = tmp_path / "chat_1.jsonl"
+    write_chat_snapshot(log_path, make_chat(2))
+
+    append_chat_records(log_path, [
+        build_message_record({"role": "user", "content": "新问题"}),
+        build_message_record({"role": "assistant", "content": ""}),
+        build_delta_record("部分"),
+        build_delta_record("回答"),
+    ])
+    assert load_chat_log(log_path)["messages"][-1] == {"role": "assistant", "content": "部分回答"}
+
+    append_chat_records(log_path, [build_set_record("错误信息"), build_patch_record({"truncated": True})])
+    assert load_chat_log(log_path)["messages"][-1] == {"role": "assistant", "content": "错误信息", "truncated": True}
+
+
+def test_replay_ignores_incomplete_last_line(tmp_path):
+    """写入中崩溃留下的不完整末行被忽略"""
+    log_path = tmp_path / "chat_1.jsonl"
+    write_chat_snapshot(log_path, make_chat(2))
+    with open(log_path, "ab") as f:
+        f.write(b'{"op":"delta","text":"\xe5')
+
+    assert load_chat_log(log_path)["messages"] == make_chat(2)["messages"]
+
+
+def test_append_after_incomplete_last_line(tmp_path):
+    """追加前截掉不完整的末行，新记录可正常回放并计入索引"""
+    log_path = tmp_path / "chat_1.jsonl"
+    write_chat_snapshot(log_path, make_chat(2))
+    load_message_index(log_path)
+    with open(log_path, "ab") as f:
+        f.write(b'{"op":"delta","text":"\xe5')
+
+    append_chat_records(log_path, [build_message_record({"role": "user", "content": "新问题"})])
+
+    assert load_chat_log(log_path)["messages"][-1] == {"role": "user", "content": "新问题"}
+    offsets = load_message_index(log_path)
+    assert offsets.tolist() == _message_offsets(log_path)
+    assert read_message_range(log_path, offsets, 2, 3) == [{"role": "user", "content": "新问题"}]
+
+
+@pytest.mark.asyncio
+async def test_append_compacts_log_at_threshold(chat_root, monkeypatch):
+    """追加记录达到阈值且缓存版本一致时，日志被重写为快照，内容不变"""
+    monkeypatch.setattr(chat_log_store_svc, "COMPACT_RECORD_THRESHOLD", 5)
+    engine = FileSystemChatStorageEngine()
+    chat_data = make_chat(2)
+    chat_data["messages"].append({"role": "assistant", "content": ""})
+    version = await engine.save_chat("1", UserRole.STUDENT, "c", chat_data)
+    chat_file = get_chat_file_path("1", UserRole.STUDENT, "c")
+
+    for piece in ["一", "二", "三", "四"]:
+        chat_data["messages"][-1]["content"] += piece
+        version = await engine.append_records(
+            "1", UserRole.STUDENT, "c", [build_delta_record(piece)], chat_data, expected_version=version
+        )
+    assert count_lines(chat_file) == 1 + 3 + 4
+
+    chat_data["messages"][-1]["content"] += "五"
+    version = await engine.append_records(
+        "1", UserRole.STUDENT, "c", [build_delta_record("五")], chat_data, expected_version=version
+    )
+
+    assert count_lines(chat_file) == 1 + 3
+    assert version == get_chat_file_version(chat_file)
+    loaded, _ = await engine.load_chat("1", UserRole.STUDENT, "c")
+    assert loaded["messages"][-1]["content"] == "一二三四五"
+    assert load_message_index(chat_file).tolist() == _message_offsets(chat_file)
+
+
+@pytest.mark.asyncio
+async def test_append_skips_compaction_when_log_changed_elsewhere(chat_root, monkeypatch):
+    """日志已被其他进程修改时不用本进程的缓存重写，避免丢失对方追加的记录"""
+    monkeypatch.setattr(chat_log_store_svc, "COMPACT_RECORD_THRESHOLD", 1)
+    engine = FileSystemChatStorageEngine()
+    await engine.save_chat("1", UserRole.STUDENT, "c", make_chat(2))
+    chat_file = get_chat_file_path("1", UserRole.STUDENT, "c")
+
+    stale_cache = make_chat(2)
+    version = await engine.append_records(
+        "1", UserRole.STUDENT, "c", [build_message_record({"role": "user", "content": "追加"})],
+        stale_cache, expected_version="stale"
+    )
+
+    assert version is None
+    assert count_lines(chat_file) == 1 + 2 + 1
+    loaded, _ = await engine.load_chat("1", UserRole.STUDENT, "c")
+    assert loaded["messages"][-1]["content"] == "追加"
+
+
+def _message_offsets(log_path):
+    """逐行扫描得到消息记录的起始偏移"""
+    offsets, position = [], 0
+    with open(log_path, "rb") as f:
+        for line in f:
+            if json.loads(line)["op"] == "msg":
+                offsets.append(position)
+            position += len(line)
+    return offsets
+
+
+@pytest.mark.asyncio
+async def test_load_user_chats_without_converting_legacy_files(chat_root):
+    """只读加载时旧版JSON文件保持原样，不转换为追加式日志"""
+    legacy_file = get_legacy_chat_file_path("1", UserRole.STUDENT, "old")
+    legacy_file.write_text(json.dumps(make_chat(2), ensure_ascii=False), encoding="utf-8")
+
+    chats = await FileSystemChatStorageEngine().load_user_chats("1", UserRole.STUDENT, convert_legacy=False)
+
+    assert chats["old"]["messages"] == make_chat(2)["messages"]
+    assert legacy_file.exists()
+    assert not get_chat_file_path("1", UserRole.STUDENT, "old").exists()
+
+    await FileSystemChatStorageEngine().load_user_chats("1", UserRole.STUDENT)
+
+    assert not legacy_file.exists()
+    assert get_chat_file_path("1", UserRole.STUDENT, "old").exists()
+
+
+@pytest.mark.asyncio
+async def test_archive_removes_log_and_index(chat_root):
+    """归档后删除日志与消息偏移索引，锁文件保留（持有锁时删除会破坏互斥），再次打开时解压回日志"""
+    chat_file = get_chat_file_path("1", UserRole.STUDENT, "cold")
+    with get_chat_lock(chat_file):
+        write_chat_snapshot(chat_file, make_chat(4))
+    assert load_message_index(chat_file) is not None
+    os.utime(chat_file, (0, 0))
+
+    assert ChatArchiver(after_days=1, interval=3600).archive_cold_chats() == 1
+
+    assert get_chat_archive_path(chat_file).exists()
+    assert not chat_file.exists()
+    assert not get_message_index_path(chat_file).exists()
+    assert get_chat_lock_path(chat_file).exists()
+
+    chat_data, _ = await FileSystemChatStorageEngine().load_chat("1", UserRole.STUDENT, "cold")
+    assert chat_data["messages"] == make_chat(4)["messages"]
+    assert chat_file.exists()
+
+
+def test_message_page_bounds():
+    """游标为空时取最新一页，之后以上一页第一条消息的序号向前翻页"""
+    assert get_message_page_bounds(10, None, 4) == (6, 10)
+    assert get_message_page_bounds(10, 6, 4) == (2, 6)
+    assert get_message_page_bounds(10, 2, 4) == (0, 2)
+    assert get_message_page_bounds(10, 50, 4) == (6, 10)
+    assert get_message_page_bounds(0, None, 4) == (0, 0)
+
+
+def test_read_message_range_applies_following_records(tmp_path):
+    """读取范围内的最后一条消息时，其后的增量记录一并回放，不越过下一条消息"""
+    log_path = tmp_path / "chat_1.jsonl"
+    write_chat_snapshot(log_path, make_chat(3))
+    append_chat_records(log_path, [build_delta_record("补充")])
+    append_chat_records(log_path, [
+        build_message_record({"role": "assistant", "content": "回答"}),
+        build_delta_record("继续"),
+    ])
+
+    offsets = load_message_index(log_path)
+    assert len(offsets) == 4
+    assert read_message_range(log_path, offsets, 2, 3) == [{"role": "user", "content": "消息2补充"}]
+    assert read_message_range(log_path, offsets, 1, 4) == [
+        {"role": "assistant", "content": "消息1"},
+        {"role": "user", "content": "消息2补充"},
+        {"role": "assistant", "content": "回答继续"},
+    ]
+    assert read_message_range(log_path, offsets, 2, 2) == []
+
+
+def test_message_index_catches_up_and_rebuilds(tmp_path):
+    """索引落后于日志时补齐新增部分，损坏时全量重建"""
+    log_path = tmp_path / "chat_1.jsonl"
+    write_chat_snapshot(log_path, make_chat(3))
+
+    # 绕过 append_chat_records 写入的记录不会扩展索引，读取时扫描补齐
+    with open(log_path, "ab") as f:
+        f.write('{"op":"msg","role":"user","content":"外部追加"}\n'.encode("utf-8"))
+    assert load_message_index(log_path).tolist() == _message_offsets(log_path)
+
+    get_message_index_path(log_path).write_bytes(b"\x00")
+    assert load_message_index(log_path).tolist() == _message_offsets(log_path)
+
+
+@pytest.mark.asyncio
+async def test_engine_message_pages(chat_root):
+    """存储引擎按游标分页返回消息，标注序号与下一页游标"""
+    engine = FileSystemChatStorageEngine()
+    await engine.save_chat("1", UserRole.STUDENT, "c", make_chat(5))
+
+    page = await engine.get_message_range("1", UserRole.STUDENT, "c", None, 2)
+    assert [msg["seq"] for msg in page["messages"]] == [3, 4]
+    assert page["total"] == 5
+    assert page["next_cursor"] == 3
+
+    page = await engine.get_message_range("1", UserRole.STUDENT, "c", page["next_cursor"], 2)
+    assert [msg["content"] for msg in page["messages"]] == ["消息1", "消息2"]
+
+    page = await engine.get_message_range("1", UserRole.STUDENT, "c", page["next_cursor"], 2)
+    assert [msg["seq"] for msg in page["messages"]] == [0]
+    assert page["next_cursor"] is None
+
+    assert await engine.get_message_range("1", UserRole.STUDENT, "missing", None, 2) is None
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import types
+import uuid
+
+import pytest
+import pytest_asyncio
+
+from app.core.llm_scheduler import LLMPriority
+from app.models.user_common import UserRole
+from app.routers import chat_rt
+from app.routers.student import exercise_generator_stu_rt
+from app.schemas.chat_sch import ChatRequest
+from app.schemas.student.exercise_generator_stu_sch import StudentExerciseGenerateRequest
+from app.services import chat_svc
+from app.services.chat_history import fs_storage_engine_svc, chat_search_svc
+from app.services.chat_history.storage_engine_svc import get_chat_storage_engine
+
+REPLY_PIECES = ["你好，", "这是一段", "完整的回答。"]
+REPLY = "".join(REPLY_PIECES)
+
+
+class FakeStream:
+    """模拟大模型流式响应：逐块返回内容，最后返回用量"""
+
+    def __init__(self, pieces, on_chunk=None):
+        self.pieces = pieces
+        self.on_chunk = on_chunk
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for index, piece in enumerate(self.pieces):
+            if self.on_chunk is not None:
+                self.on_chunk(index)
+            delta = types.SimpleNamespace(content=piece)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+            await asyncio.sleep(0)
+        usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+        yield types.SimpleNamespace(choices=[], usage=usage)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeHttpRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+@pytest_asyncio.fixture
+async def chat_env(tmp_path, monkeypatch):
+    """聊天历史与检索索引写入临时目录，大模型调用替换为本地模拟流"""
+    monkeypatch.setattr(fs_storage_engine_svc, "CHAT_HISTORY_ROOT_DIR", tmp_path / "chat_history")
+    monkeypatch.setattr(chat_search_svc, "CHAT_SEARCH_ROOT_DIR", tmp_path / "chat_search")
+    (tmp_path / "chat_search").mkdir()
+
+    env = types.SimpleNamespace(stream=None, http_request=FakeHttpRequest(), on_chunk=None)
+
+    async def fake_chat_completion(**kwargs):
+        env.stream = FakeStream(REPLY_PIECES, env.on_chunk)
+        return env.stream
+
+    monkeypatch.setattr(chat_svc.llm_gateway, "chat_completion", fake_chat_completion)
+    yield env
+
+    # 等待断开后转入后台的收尾任务，避免影响其他测试
+    await drain_background_tasks()
+
+
+async def drain_background_tasks():
+    while chat_svc._background_tasks:
+        await asyncio.gather(*list(chat_svc._background_tasks), return_exceptions=True)
+
+
+def make_user():
+    return types.SimpleNamespace(id=uuid.uuid4().hex, role=UserRole.STUDENT, student_id="2023001", username="学生")
+
+
+async def open_stream(env, user, **request_fields):
+    request = ChatRequest(messages=[{"role": "user", "content": "请介绍一下自己"}], **request_fields)
+    response = await chat_rt.stream_message(request=request, http_request=env.http_request, user=user)
+    return response.body_iterator
+
+
+def parse_events(events):
+    return [json.loads(event[len("data: "):]) for event in events if event != "data: [DONE]\n\n"]
+
+
+async def load_stored_chat(user, chat_id):
+    chat_data, _ = await get_chat_storage_engine().load_chat(str(user.id), user.role, chat_id)
+    return chat_data
+
+
+def assistant_messages(chat_data):
+    return [msg for msg in chat_data["messages"] if msg["role"] == "assistant"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("delta_stream", [False, True])
+async def test_stream_completion_stores_single_untruncated_reply(chat_env, delta_stream):
+    """完整输出后路由关闭生成器，历史中只保存一份未截断的回复"""
+    user = make_user()
+    events = [event async for event in await open_stream(chat_env, user, delta_stream=delta_stream)]
+    await drain_background_tasks()
+
+    assert events[-1] == "data: [DONE]\n\n"
+    final = parse_events(events)[-1]
+    assert final["is_complete"] is True
+    assert final["content"] == REPLY
+
+    chat_data = await load_stored_chat(user, final["chat_id"])
+    replies = assistant_messages(chat_data)
+    assert len(replies) == 1
+    assert replies[0]["content"] == REPLY
+    assert not replies[0].get("truncated")
+
+
+@pytest.mark.asyncio
+async def test_stream_cache_hit_stores_single_untruncated_reply(chat_env, monkeypatch):
+    """语义缓存命中时回放答案，历史中同样只保存一份未截断的回复"""
+    cached_answer = "缓存中的答案" * 10
+
+    async def fake_lookup(role, question):
+        return cached_answer, None
+
+    monkeypatch.setattr(chat_svc.semantic_answer_cache, "enabled", True)
+    monkeypatch.setattr(chat_svc.semantic_answer_cache, "lookup", fake_lookup)
+
+    user = make_user()
+    events = [event async for event in await open_stream(chat_env, user)]
+    await drain_background_tasks()
+
+    assert chat_env.stream is None
+    final = parse_events(events)[-1]
+    assert final["is_complete"] is True
+    assert final["content"] == cached_answer
+
+    chat_data = await load_stored_chat(user, final["chat_id"])
+    replies = assistant_messages(chat_data)
+    assert len(replies) == 1
+    assert replies[0]["content"] == cached_answer
+    assert not replies[0].get("truncated")
+
+
+@pytest.mark.asyncio
+async def test_stream_client_disconnect_stores_truncated_reply(chat_env, monkeypatch):
+    """检测到客户端断开后关闭上游流，已生成的部分以截断状态保存"""
+    monkeypatch.setattr(chat_svc, "CHAT_DISCONNECT_CHECK_INTERVAL_SECONDS", 0)
+
+    def disconnect_after_first_chunk(index):
+        if index == 1:
+            chat_env.http_request.disconnected = True
+
+    chat_env.on_chunk = disconnect_after_first_chunk
+
+    user = make_user()
+    events = [event async for event in await open_stream(chat_env, user)]
+    await drain_background_tasks()
+
+    assert chat_env.stream.closed
+    payloads = parse_events(events)
+    assert all(not payload["is_complete"] for payload in payloads)
+
+    chat_data = await load_stored_chat(user, payloads[0]["chat_id"])
+    replies = assistant_messages(chat_data)
+    assert len(replies) == 1
+    assert replies[0]["content"] == REPLY_PIECES[0]
+    assert replies[0]["truncated"] is True
+
+
+@pytest.mark.asyncio
+async def test_stream_cancelled_mid_reply_stores_truncated_reply(chat_env):
+    """响应流在输出中途被关闭时，收尾任务在后台保存截断的回复"""
+    user = make_user()
+    body = await open_stream(chat_env, user)
+    first_event = await body.__anext__()
+    await body.aclose()
+    await drain_background_tasks()
+
+    assert chat_env.stream.closed
+    chat_id = parse_events([first_event])[0]["chat_id"]
+    chat_data = await load_stored_chat(user, chat_id)
+    replies = assistant_messages(chat_data)
+    assert len(replies) == 1
+    assert replies[0]["content"] == REPLY_PIECES[0]
+    assert replies[0]["truncated"] is True
+
+
+@pytest.mark.asyncio
+async def test_stream_writes_reply_once_when_engine_skips_deltas(chat_env, monkeypatch):
+    """存储引擎不在生成过程中写入增量时，回复只在结束时登记写入一次"""
+    monkeypatch.setattr(get_chat_storage_engine(), "write_deltas_while_streaming", False)
+    marked = []
+    original_mark_dirty = chat_svc.chat_write_behind.mark_dirty
+
+    def record_mark_dirty(key, flush_fn, pending_bytes=0):
+        marked.append(pending_bytes)
+        original_mark_dirty(key, flush_fn, pending_bytes)
+
+    monkeypatch.setattr(chat_svc.chat_write_behind, "mark_dirty", record_mark_dirty)
+
+    user = make_user()
+    events = [event async for event in await open_stream(chat_env, user)]
+    await drain_background_tasks()
+
+    assert marked == [len(REPLY)]
+    chat_data = await load_stored_chat(user, parse_events(events)[-1]["chat_id"])
+    assert assistant_messages(chat_data)[0]["content"] == REPLY
+
+
+@pytest.mark.asyncio
+async def test_chat_and_exercise_generation_share_user_slot(chat_env, monkeypatch):
+    """同一用户的聊天与习题生成使用同一调用名额键，聊天占用名额时习题生成排队等待"""
+    scheduler = chat_svc.llm_scheduler
+    monkeypatch.setattr(scheduler, "max_per_user", 1)
+
+    user = make_user()
+    body = await open_stream(chat_env, user)
+    await body.__anext__()
+
+    request = StudentExerciseGenerateRequest(content="牛顿第二定律", use_knowledge_matching=False)
+    generation = asyncio.create_task(
+        exercise_generator_stu_rt.generate_student_exercises_endpoint(request=request, current_user=user)
+    )
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+    user_key = chat_svc.get_user_cache_key(str(user.id), user.role)
+    assert not generation.done()
+    assert list(scheduler._queues[LLMPriority.BATCH]) == [user_key]
+
+    generation.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await generation
+    await body.aclose()
+    await drain_background_tasks()
+    assert scheduler.queue_depth() == 0
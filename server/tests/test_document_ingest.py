@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from app.services.doc_vector import document_vectorization_svc as vectorization
+
+
+@pytest.fixture
+def metadata_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorization, "METADATA_PATH", tmp_path)
+    return tmp_path
+
+
+async def noop(*args):
+    return None
+
+
+@pytest.mark.asyncio
+async def test_ingest_returns_existing_document_found_after_embedding(metadata_dir, tmp_path, monkeypatch):
+    """向量化期间相同内容已由其他任务入库时，返回已有文档且 is_new 为False，不重复追加元数据"""
+    upload = tmp_path / "upload.txt"
+    upload.write_text("第一段内容。\n\n第二段内容。", encoding="utf-8")
+
+    async def store_while_other_job_finishes(collection_id, document_id, title, staff_id, chunks, owned_chunk_ids,
+                                             on_progress):
+        vectorization._save_teacher_metadata(staff_id, [{
+            "document_id": document_id,
+            "title": "其他任务上传的文档",
+            "content_hash": "hash",
+            "chunk_count": len(chunks),
+            "created_at": "2025-01-01T00:00:00"
+        }])
+
+    monkeypatch.setattr(vectorization, "_store_document_chunks", store_while_other_job_finishes)
+
+    result = await vectorization.ingest_document(
+        "T001", "我的文档", "upload.txt", upload, upload.stat().st_size, None, [],
+        on_stage=noop, on_progress=noop
+    )
+
+    assert result["is_new"] is False
+    assert result["title"] == "其他任务上传的文档"
+    assert len(vectorization._load_teacher_metadata("T001")) == 1
+
+
+class FakeCollection:
+    """记录写入的文本块，第 fail_on_upsert 次写入时失败"""
+
+    def __init__(self, existing_ids=(), fail_on_upsert=None):
+        self.ids = set(existing_ids)
+        self.upserts = 0
+        self.fail_on_upsert = fail_on_upsert
+
+    def get(self, ids, include):
+        return {"ids": [chunk_id for chunk_id in ids if chunk_id in self.ids]}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.upserts += 1
+        if self.upserts == self.fail_on_upsert:
+            raise RuntimeError("写入失败")
+        self.ids.update(ids)
+
+    def delete(self, ids):
+        self.ids.difference_update(ids)
+
+
+@pytest.fixture
+def fake_vector_store(monkeypatch):
+    def use_collection(collection):
+        monkeypatch.setattr(vectorization.vector_store, "get_collection", lambda name, create=False: collection)
+        monkeypatch.setattr(vectorization.vector_store, "get_max_batch_size", lambda: 2)
+        monkeypatch.setattr(vectorization, "embedding_function", lambda batch: [[0.0]] * len(batch))
+        return collection
+
+    return use_collection
+
+
+@pytest.mark.asyncio
+async def test_store_chunks_writes_all_batches(fake_vector_store):
+    """按批写入全部文本块，每批后回调进度"""
+    collection = fake_vector_store(FakeCollection())
+    progress = []
+
+    async def on_progress(embedded, total):
+        progress.append((embedded, total))
+
+    owned = []
+    await vectorization._store_document_chunks(
+        "c", "doc", "标题", "T001", ["a", "b", "c", "d", "e"], owned, on_progress
+    )
+
+    assert collection.ids == {f"doc_chunk_{i}" for i in range(5)}
+    assert owned == [f"doc_chunk_{i}" for i in range(5)]
+    # 每批先登记新文本块再写入
+    assert progress == [(0, 5), (2, 5), (2, 5), (4, 5), (4, 5), (5, 5)]
+
+
+@pytest.mark.asyncio
+async def test_store_chunks_rollback_keeps_previously_existing_chunks(fake_vector_store):
+    """写入失败时只删除本次新写入的文本块，之前已存在的同ID文本块保留"""
+    collection = fake_vector_store(FakeCollection(existing_ids={"doc_chunk_0", "other_chunk_0"}, fail_on_upsert=2))
+
+    with pytest.raises(RuntimeError):
+        await vectorization._store_document_chunks("c", "doc", "标题", "T001", ["a", "b", "c", "d"], [], noop)
+
+    assert collection.ids == {"doc_chunk_0", "other_chunk_0"}
+
+
+@pytest.mark.asyncio
+async def test_store_chunks_rollback_after_resume_removes_earlier_run(fake_vector_store):
+    """中断前写入的文本块随任务状态保留归属，恢复后的运行失败时一并回滚"""
+    collection = fake_vector_store(FakeCollection(existing_ids={"other_chunk_0"}))
+    owned = []
+
+    async def interrupt_after_first_batch(embedded, total):
+        if embedded == 2:
+            raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        await vectorization._store_document_chunks(
+            "c", "doc", "标题", "T001", ["a", "b", "c", "d"], owned, interrupt_after_first_batch
+        )
+    assert collection.ids == {"other_chunk_0", "doc_chunk_0", "doc_chunk_1"}
+
+    # 恢复的任务传回已持久化的归属，第二批写入失败
+    collection.fail_on_upsert = 3
+    with pytest.raises(RuntimeError):
+        await vectorization._store_document_chunks("c", "doc", "标题", "T001", ["a", "b", "c", "d"], owned, noop)
+
+    assert collection.ids == {"other_chunk_0"}
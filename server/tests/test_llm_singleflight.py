@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from app.core.llm_singleflight import SingleFlight, make_request_key
+
+MESSAGES = [{"role": "user", "content": "生成  5 道\n习题"}]
+
+
+def test_request_key_normalizes_whitespace():
+    """messages 中的排版差异不影响请求键"""
+    key = make_request_key("teacher_exercise", "teacher_1", model="deepseek-chat", messages=MESSAGES)
+    same = make_request_key(
+        "teacher_exercise", "teacher_1",
+        model="deepseek-chat", messages=[{"role": "user", "content": " 生成 5 道 习题 "}]
+    )
+    assert key == same
+
+
+def test_request_key_is_scoped_to_user():
+    """不同用户的相同请求得到不同的键，各自占用调用名额"""
+    key = make_request_key("teacher_exercise", "teacher_1", model="deepseek-chat", messages=MESSAGES)
+    other = make_request_key("teacher_exercise", "teacher_2", model="deepseek-chat", messages=MESSAGES)
+    assert key != other
+
+
+@pytest.mark.asyncio
+async def test_do_coalesces_concurrent_calls():
+    """并发的相同请求只调用一次上游，共享结果"""
+    singleflight = SingleFlight()
+    calls = 0
+
+    async def call_llm():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "结果"
+
+    results = await asyncio.gather(*(singleflight.do("key", call_llm) for _ in range(3)))
+
+    assert results == ["结果"] * 3
+    assert calls == 1
+    assert singleflight.stats()["coalesced"] == 2
+    assert singleflight.stats()["in_flight"] == 0
+